@@ -0,0 +1,233 @@
+# analytics.py
+
+"""
+Per-question statistics for the admin analytics report.
+
+Each graded submission becomes a set of additive counters
+(submission_counters): for every question it showed, how often it was seen,
+answered, fully or partly correct, plus the sums needed for a correlation
+between the question's score and the rest of the attempt. data_manager adds
+them to the quiz's stored totals at submit time, so the report is built from
+a fixed number of counters however many students took the quiz.
+build_counters recomputes the totals from stored submissions in one pass
+(after a re-grade), using NumPy when it is installed.
+
+Counters are {key: [numbers]} and add element-wise:
+- 'quiz': [submissions, timed out, sum of scores, sum of squared scores]
+- 'score:<n>': [submissions that scored n]
+- 'q<index>': ITEM_FIELDS, followed by each multipart part's correct count
+"""
+
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # Optional: bulk rebuilds fall back to plain Python.
+    np = None
+
+QUIZ_KEY = 'quiz'
+ITEM_FIELDS = ('seen', 'answered', 'correct', 'partial', 'sum_x', 'sum_xx', 'sum_y', 'sum_yy', 'sum_xy')
+_SEEN, _ANSWERED, _CORRECT, _PARTIAL, _SX, _SXX, _SY, _SYY, _SXY = range(len(ITEM_FIELDS))
+
+# Questions seen fewer times than this are not flagged as too easy, too hard
+# or poorly discriminating.
+MIN_SEEN_FOR_FLAGS = 10
+
+
+def add_counters(totals, deltas):
+    """Adds `deltas` into `totals` in place, element-wise. Returns totals."""
+    for key, values in deltas.items():
+        current = totals.get(key)
+        if current is None:
+            totals[key] = list(values)
+            continue
+        if len(values) > len(current):
+            current.extend([0] * (len(values) - len(current)))
+        for i, value in enumerate(values):
+            current[i] += value
+    return totals
+
+
+def _score_key(score):
+    return f"score:{int(score) if float(score).is_integer() else score}"
+
+
+def _observations(grader, question_order, user_answers):
+    """
+    Grades one submission question by question. Returns (score, rows) with a
+    (question_index, answered, earned, available, [part correct flags]) row
+    per question shown.
+    """
+    rows = []
+    for position, question_index in enumerate(question_order):
+        user_answer = user_answers.get(str(position))
+        available = grader.max_points(question_index)
+        parts = []
+        if grader.is_multipart(question_index):
+            scored = grader.score_parts(question_index, user_answer)
+            earned = sum(part_earned for part_earned, _ in scored)
+            parts = [int(part_available > 0 and part_earned >= part_available)
+                     for part_earned, part_available in scored]
+        else:
+            earned = grader.score_question(question_index, user_answer)
+        rows.append((question_index, user_answer not in (None, '', []), earned, available, parts))
+    return sum(row[2] for row in rows), rows
+
+
+def _fractions(earned, available, score, total):
+    """The question's share of its points (x) and the rest of the attempt's (y)."""
+    x = earned / available if available > 0 else 0.0
+    rest_available = total - available
+    y = (score - earned) / rest_available if rest_available > 0 else 0.0
+    return x, y
+
+
+def submission_counters(grader, question_order, user_answers, timed_out=False):
+    """Returns the counters contributed by one graded submission."""
+    if timed_out:
+        # Timed-out attempts score 0 without being graded, so they only count
+        # towards the totals.
+        return {QUIZ_KEY: [1, 1, 0, 0], _score_key(0): [1]}
+    score, rows = _observations(grader, question_order, user_answers)
+    total = sum(row[3] for row in rows)
+    counters = {QUIZ_KEY: [1, 0, score, score * score], _score_key(score): [1]}
+    for question_index, answered, earned, available, parts in rows:
+        x, y = _fractions(earned, available, score, total)
+        item = [1, int(answered), int(available > 0 and earned >= available),
+                int(0 < earned < available), x, x * x, y, y * y, x * y] + parts
+        add_counters(counters, {f'q{question_index}': item})
+    return counters
+
+
+def build_counters(grader, question_count, submissions):
+    """
+    Recomputes the counters of many submissions, given as (question_order,
+    user_answers, timed_out) tuples. With NumPy the per-question sums are
+    accumulated with bincount over all rows at once.
+    """
+    if np is None:
+        counters = {}
+        for question_order, user_answers, timed_out in submissions:
+            add_counters(counters, submission_counters(grader, question_order, user_answers, timed_out))
+        return counters
+
+    quiz = [0, 0, 0, 0]
+    scores = Counter()
+    columns = ([], [], [], [], [])   # question index, answered, earned, available, rest fraction
+    part_correct = Counter()         # (question index, part) -> correct count
+    for question_order, user_answers, timed_out in submissions:
+        quiz[0] += 1
+        if timed_out:
+            quiz[1] += 1
+            scores[_score_key(0)] += 1
+            continue
+        score, rows = _observations(grader, question_order, user_answers)
+        quiz[2] += score
+        quiz[3] += score * score
+        scores[_score_key(score)] += 1
+        total = sum(row[3] for row in rows)
+        for question_index, answered, earned, available, parts in rows:
+            columns[0].append(question_index)
+            columns[1].append(answered)
+            columns[2].append(earned)
+            columns[3].append(available)
+            columns[4].append(_fractions(earned, available, score, total)[1])
+            for part, correct in enumerate(parts):
+                part_correct[(question_index, part)] += correct
+
+    counters = {}
+    if quiz[0]:
+        counters[QUIZ_KEY] = quiz
+    counters.update((key, [count]) for key, count in scores.items())
+    if not columns[0]:
+        return counters
+
+    index = np.array(columns[0], dtype=np.int64)
+    answered = np.array(columns[1], dtype=np.float64)
+    earned = np.array(columns[2], dtype=np.float64)
+    available = np.array(columns[3], dtype=np.float64)
+    y = np.array(columns[4], dtype=np.float64)
+    x = np.divide(earned, available, out=np.zeros_like(earned), where=available > 0)
+    weights = (None, answered, (available > 0) & (earned >= available), (earned > 0) & (earned < available),
+               x, x * x, y, y * y, x * y)
+    sums = [np.bincount(index, weights=w, minlength=question_count) for w in weights]
+    for question_index in np.unique(index).tolist():
+        item = [int(sums[field][question_index]) for field in (_SEEN, _ANSWERED, _CORRECT, _PARTIAL)]
+        item += [float(sums[field][question_index]) for field in (_SX, _SXX, _SY, _SYY, _SXY)]
+        part = 0
+        while (question_index, part) in part_correct:
+            item.append(part_correct[(question_index, part)])
+            part += 1
+        counters[f'q{question_index}'] = item
+    return counters
+
+
+def _correlation(n, sx, sxx, sy, syy, sxy):
+    """Pearson correlation from running sums, or None when it is undefined."""
+    if n < 2:
+        return None
+    variance_x = n * sxx - sx * sx
+    variance_y = n * syy - sy * sy
+    if variance_x <= 1e-12 or variance_y <= 1e-12:
+        return None
+    return (n * sxy - sx * sy) / (variance_x * variance_y) ** 0.5
+
+
+def _flags(item):
+    if item['seen'] < MIN_SEEN_FOR_FLAGS:
+        return []
+    flags = []
+    if item['facility'] < 0.2:
+        flags.append('very hard')
+    elif item['facility'] > 0.9:
+        flags.append('very easy')
+    if item['discrimination'] is not None:
+        if item['discrimination'] < 0:
+            flags.append('negative discrimination: check the answer key')
+        elif item['discrimination'] < 0.1:
+            flags.append('low discrimination')
+    return flags
+
+
+def item_report(quiz, counters):
+    """
+    Turns a quiz's counters into the analytics report: totals, the score
+    histogram and, per question, its facility (average share of its points
+    earned), correct/partial rates and discrimination (correlation between
+    the question's score and the rest of the attempt).
+    """
+    submissions, timed_out, score_sum, score_square_sum = counters.get(QUIZ_KEY, [0, 0, 0, 0])
+    graded = submissions - timed_out
+    mean = score_sum / graded if graded else None
+    histogram = sorted((float(key[len('score:'):]), values[0]) for key, values in counters.items()
+                       if key.startswith('score:'))
+
+    questions = []
+    for index, question in enumerate(quiz.get('questions', [])):
+        values = counters.get(f'q{index}')
+        if values is None:
+            continue
+        seen = values[_SEEN]
+        item = {
+            'number': index + 1,
+            'type': question.get('type'),
+            'text': question.get('text', ''),
+            'seen': seen,
+            'answered_rate': values[_ANSWERED] / seen,
+            'correct_rate': values[_CORRECT] / seen,
+            'partial_rate': values[_PARTIAL] / seen,
+            'facility': values[_SX] / seen,
+            'discrimination': _correlation(seen, *values[_SX:_SXY + 1]),
+            'part_correct_rates': [count / seen for count in values[len(ITEM_FIELDS):]],
+        }
+        item['flags'] = _flags(item)
+        questions.append(item)
+
+    return {
+        'submissions': submissions,
+        'timed_out': timed_out,
+        'mean_score': mean,
+        'score_sd': (max(0.0, score_square_sum / graded - mean * mean) ** 0.5) if graded else None,
+        'score_histogram': [[int(score) if score.is_integer() else score, count] for score, count in histogram],
+        'questions': questions,
+    }
@@ -1,10 +1,24 @@
 # app.py
 
-from flask import Flask
-from config import SECRET_KEY
+import hashlib
+import logging
+import os
+import time
+import uuid
+import click
+from flask import Flask, g, request
+from compression import compress_response
+from config import LOG_LEVEL, SECRET_KEY, SQLITE_DB_PATH
+import metrics
+import static_files
+from data_manager import extract_all_quiz_assets, migrate_quizzes, refresh_quiz_index, sweep_expired_state
 
 def create_app():
     """Application factory function."""
+    # One line per record with level, worker PID and module; LOG_LEVEL picks
+    # the threshold (DEBUG, INFO, WARNING, ...).
+    logging.basicConfig(level=LOG_LEVEL,
+                        format='%(asctime)s %(levelname)s [pid %(process)d] %(name)s: %(message)s')
     app = Flask(__name__)
     app.config['SECRET_KEY'] = SECRET_KEY
     app.config['MAX_FORM_FIELDS'] = 100000 
@@ -13,10 +27,158 @@ def create_app():
     from views.auth import auth_bp
     from views.admin import admin_bp
     from views.student import student_bp
+    from views.assets import assets_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(student_bp)
+    app.register_blueprint(assets_bp)
+
+    # --- Request metrics ---
+    # Registered first so it runs after every other after_request hook and
+    # the timing includes compression.
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            metrics.observe('quiz_http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+            metrics.inc('quiz_http_requests_total', endpoint=endpoint, method=request.method,
+                        status=response.status_code)
+            metrics.flush()
+        return response
+
+    # --- Compression & HTTP caching ---
+    # Static URLs carry a content fingerprint (?v=...) and are cached for a
+    # year; precompressed copies are served when present. Other buffered
+    # responses are compressed on the fly.
+
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = static_files.static_fingerprint(app.static_folder, values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    @app.before_request
+    def serve_precompressed_static():
+        if request.endpoint == 'static':
+            return static_files.send_precompressed(app.static_folder, request.view_args['filename'],
+                                                   request.accept_encodings)
+
+    @app.after_request
+    def compress_and_cache(response):
+        if request.endpoint == 'static':
+            return static_files.apply_static_cache_headers(response, app.static_folder,
+                                                           request.view_args['filename'], request.args.get('v'))
+        return compress_response(response, request.accept_encodings)
+
+    # Pages that answer 304s include this in their ETag, so a deploy that
+    # changes static files (and so their fingerprinted URLs) re-sends them.
+    static_digest = hashlib.sha1()
+    for directory, _, filenames in sorted(os.walk(app.static_folder)):
+        for name in sorted(n for n in filenames if not n.endswith(('.gz', '.br'))):
+            static_digest.update(f"{name}:{static_files.file_fingerprint(os.path.join(directory, name))};".encode())
+    app.config['STATIC_VERSION'] = static_digest.hexdigest()[:12]
+
+    # Load the quiz index once per worker so the first join doesn't pay for it.
+    refresh_quiz_index()
+
+    @app.cli.command('migrate-quizzes')
+    def migrate_quizzes_command():
+        """Upgrades every quiz file to the current schema version."""
+        upgraded = migrate_quizzes()
+        print(f"Upgraded {upgraded} quiz file(s) to the current schema.")
+
+    @app.cli.command('extract-assets')
+    def extract_assets_command():
+        """Moves images embedded in stored quizzes into the asset store."""
+        summary = extract_all_quiz_assets()
+        print(f"Extracted {summary['assets']} image(s) from {summary['quizzes']} quiz(zes), "
+              f"saving {summary['bytes_saved'] / 1024:.0f} KB of quiz JSON.")
+
+    @app.cli.command('sweep-state')
+    def sweep_state_command():
+        """Deletes expired quiz attempts and answer reviews."""
+        for namespace, removed in sweep_expired_state().items():
+            print(f"Removed {removed} expired or evicted {namespace} record(s).")
+
+    @app.cli.command('precompress-static')
+    def precompress_static_command():
+        """Writes .gz (and .br, with brotli installed) copies of static files."""
+        summary = static_files.precompress_static(app.static_folder)
+        print(f"Wrote {summary['written']} compressed cop(ies) of {summary['files']} static file(s), "
+              f"saving {summary['bytes_saved'] / 1024:.0f} KB.")
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--quiz-id', help='Append to this quiz instead of creating a new one.')
+    @click.option('--name', help='Name for the new quiz (defaults to the file\'s "name" or its filename).')
+    def import_questions_command(path, quiz_id, name):
+        """Validates and imports a JSON or JSON Lines question bank."""
+        from data_manager import get_quiz_for_update, save_quiz
+        from question_import import QuestionImporter, QuestionImportError
+
+        quiz = None
+        if quiz_id:
+            quiz = get_quiz_for_update(quiz_id)
+            if not quiz:
+                raise click.ClickException(f"Quiz {quiz_id} not found.")
+
+        with open(path, encoding='utf-8-sig') as f:
+            importer = QuestionImporter(f, first_number=len(quiz['questions']) + 1 if quiz else 1)
+            try:
+                questions = list(importer)
+            except QuestionImportError as e:
+                raise click.ClickException(str(e))
+
+        if importer.error_count:
+            for error in importer.errors:
+                print(error)
+            raise click.ClickException(f"{importer.error_count} question(s) failed validation; nothing was imported.")
+
+        if quiz:
+            quiz['questions'].extend(questions)
+            save_quiz(quiz_id, quiz)
+            print(f"Appended {len(questions)} question(s) to '{quiz['name']}'.")
+            return
+
+        quiz_id = str(uuid.uuid4())
+        quiz = {
+            'id': quiz_id,
+            'pin': str(uuid.uuid4().int)[:6],
+            'name': name or importer.metadata.get('name') or os.path.splitext(os.path.basename(path))[0],
+            'timer': importer.metadata.get('timer', 600),
+            'questions': questions
+        }
+        save_quiz(quiz_id, quiz)
+        print(f"Created quiz '{quiz['name']}' ({quiz_id}, PIN {quiz['pin']}) with {len(questions)} question(s).")
+
+    @app.cli.command('rebuild-analytics')
+    @click.option('--quiz-id', help='Rebuild only this quiz.')
+    def rebuild_analytics_command(quiz_id):
+        """Recomputes per-question statistics from stored submissions."""
+        from data_manager import get_all_quizzes, rebuild_item_stats
+        quiz_ids = [quiz_id] if quiz_id else [quiz['id'] for quiz in get_all_quizzes()]
+        for current_id in quiz_ids:
+            counted = rebuild_item_stats(current_id)
+            if counted is None:
+                raise click.ClickException(f"Quiz {current_id} not found.")
+            print(f"{current_id}: {counted} submission(s) counted.")
+
+    @app.cli.command('import-to-sqlite')
+    def import_to_sqlite_command():
+        """Copies the JSON/CSV data directories into the SQLite database."""
+        from storage import copy_storage, create_backend
+        summary = copy_storage(create_backend('file'), create_backend('sqlite'))
+        print(f"Imported {summary['users']} user(s), {summary['quizzes']} quiz(zes), "
+              f"{summary['leaderboard_rows']} leaderboard row(s) and {summary['submissions']} stored "
+              f"submission(s) into {SQLITE_DB_PATH}.")
 
     return app
 
@@ -0,0 +1,91 @@
+# assets.py
+
+"""
+Content-addressed storage for images embedded in quiz JSON.
+
+Questions often carry images as base64 data URIs. extract_assets() moves
+each one into ASSET_DIR under the SHA-256 of its bytes and replaces the URI
+with an /assets/<hash>.<ext> URL. The same image always gets the same URL,
+so it is stored once however many quizzes use it, and an answer that
+repeats an option's image still matches that option after extraction.
+
+SVG data URIs are left inline: an SVG served from this origin can run
+script when its URL is opened directly, while a data: URI cannot.
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from config import ASSET_DIR
+
+ASSET_URL_PREFIX = '/assets/'
+ASSET_NAME_RE = re.compile(r'^[0-9a-f]{64}\.[a-z]+$')
+
+_DATA_URI_RE = re.compile(r'data:(image/[A-Za-z0-9.+-]+);base64,([A-Za-z0-9+/]+={0,2})')
+_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+
+def store_asset(data, extension):
+    """Writes the bytes under their content hash (once) and returns the file name."""
+    filename = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+    path = os.path.join(ASSET_DIR, filename)
+    if os.path.exists(path):
+        return filename
+    os.makedirs(ASSET_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=ASSET_DIR, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+
+def _extract_from_string(text, stats):
+    def replace(match):
+        extension = _EXTENSIONS.get(match.group(1).lower())
+        if extension is None:
+            return match.group(0)
+        try:
+            data = base64.b64decode(match.group(2), validate=True)
+        except (binascii.Error, ValueError):
+            return match.group(0)
+        url = ASSET_URL_PREFIX + store_asset(data, extension)
+        stats['assets'] += 1
+        stats['bytes_saved'] += len(match.group(0)) - len(url)
+        return url
+
+    return _DATA_URI_RE.sub(replace, text)
+
+
+def _extract_in_place(container, stats):
+    items = container.items() if isinstance(container, dict) else enumerate(container)
+    for key, value in list(items):
+        if isinstance(value, str):
+            if 'data:image/' in value:
+                container[key] = _extract_from_string(value, stats)
+        elif isinstance(value, (dict, list)):
+            _extract_in_place(value, stats)
+
+
+def extract_assets(quiz_data):
+    """
+    Replaces the image data URIs in every question (text, options, answers,
+    parts) with asset URLs, in place. Returns {'assets', 'bytes_saved'}.
+    """
+    stats = {'assets': 0, 'bytes_saved': 0}
+    _extract_in_place(quiz_data.get('questions', []), stats)
+    return stats
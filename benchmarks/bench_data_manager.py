@@ -0,0 +1,130 @@
+# benchmarks/bench_data_manager.py
+
+"""
+Micro-benchmarks for the data_manager calls on the exam-start and submit
+path, run against a fresh data directory with synthetic banks (see
+generate_banks.py). Each operation is timed individually and reported as
+p50/p95/p99 latency and operations per second.
+
+    python benchmarks/bench_data_manager.py [--banks 20] [--questions 500] [--iterations 2000] [--backend file|sqlite]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from generate_banks import SAMPLE_QUIZ, make_bank  # noqa: E402
+from stats import print_report, summarize  # noqa: E402
+
+
+def timed(iterations, operation):
+    """Calls operation(i) `iterations` times and returns the individual durations."""
+    durations = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        operation(i)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--banks', type=int, default=20)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--backend', choices=['file', 'sqlite'], default=None)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='bench-data-manager-'))
+    if args.backend:
+        os.environ['STORAGE_BACKEND'] = args.backend
+    import data_manager as dm
+    from selection import select_for_attempt
+
+    with open(SAMPLE_QUIZ) as f:
+        sample = json.load(f)
+    rng = random.Random(args.seed)
+    bank_args = Namespace(questions=args.questions, multipart=0.1, image_kb=0, image_ratio=0, attempt_scale=2)
+    banks = [make_bank(sample, index, bank_args, rng) for index in range(args.banks)]
+    for bank in banks:
+        dm.save_quiz(bank['id'], bank)
+
+    n = args.iterations
+    quiz_ids = [bank['id'] for bank in banks]
+    pins = [bank['pin'] for bank in banks]
+    results = []
+
+    def run(label, operation, iterations=n):
+        results.append((label, summarize(timed(iterations, operation))))
+
+    run('get_quiz_by_id (cached)', lambda i: dm.get_quiz_by_id(quiz_ids[i % len(quiz_ids)]))
+
+    def cold_load(i):
+        dm.invalidate_quiz_cache(quiz_ids[i % len(quiz_ids)])
+        dm.get_quiz_by_id(quiz_ids[i % len(quiz_ids)])
+    run('get_quiz_by_id (cold)', cold_load, max(1, n // 10))
+
+    run('find_quiz_by_pin', lambda i: dm.find_quiz_by_pin(pins[i % len(pins)]))
+    run('list_quiz_summaries', lambda i: dm.list_quiz_summaries(page=1), max(1, n // 10))
+
+    def select(i):
+        quiz_id = quiz_ids[i % len(quiz_ids)]
+        quiz = dm.get_quiz_by_id(quiz_id)
+        return select_for_attempt(dm.get_selection_index(quiz_id, quiz), quiz['display_config'])
+    run('select_for_attempt', select)
+
+    from student_view import join_fragments
+
+    def page_json(i):
+        quiz_id = quiz_ids[i % len(quiz_ids)]
+        quiz = dm.get_quiz_by_id(quiz_id)
+        return join_fragments(dm.get_question_fragments(quiz_id, quiz), select(i)[:5])
+    run('select + question page JSON', page_json)
+
+    attempts = []
+    run('create_attempt', lambda i: attempts.append(dm.create_attempt(
+        quiz_ids[i % len(quiz_ids)], select(i), datetime.utcnow().isoformat())))
+    run('get_attempt', lambda i: dm.get_attempt(attempts[i % len(attempts)]))
+
+    def grade(i):
+        quiz_id = quiz_ids[i % len(quiz_ids)]
+        quiz = dm.get_quiz_by_id(quiz_id)
+        order = select(i)
+        return dm.get_grader(quiz_id, quiz).grade(order, {str(k): 'guess' for k in range(len(order))})
+    run('select + grade', grade)
+
+    def submit(i):
+        quiz_id = quiz_ids[i % len(quiz_ids)]
+        quiz = dm.get_quiz_by_id(quiz_id)
+        order = select(i)
+        timestamp = datetime.utcnow().isoformat()
+        dm.store_submission(quiz_id, quiz, f'student-{i}', timestamp, order, {}, attempt_id=attempts[i % len(attempts)])
+        dm.add_to_leaderboard(quiz_id, f'student-{i}', rng.randrange(50), timestamp)
+    run('store_submission + add_to_leaderboard', submit)
+
+    run('end_attempt', lambda i: dm.end_attempt(attempts[i]), min(n, len(attempts)))
+    run('get_leaderboard_page', lambda i: dm.get_leaderboard_page(quiz_ids[i % len(quiz_ids)], 1))
+
+    def save(i):
+        quiz = dm.get_quiz_for_update(quiz_ids[i % len(quiz_ids)])
+        quiz['timer'] += 1
+        dm.save_quiz(quiz['id'], quiz)
+    run('save_quiz', save, max(1, n // 20))
+
+    backend = os.environ.get('STORAGE_BACKEND', 'file')
+    print_report(f"data_manager, {args.banks} bank(s) x {args.questions} questions, {backend} backend", results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/bench_grading.py
+
+"""
+Compares the compiled QuizGrader with the inline grading loop submit_quiz
+used to run, on a synthetic quiz and a batch of random submissions. Also
+checks that both produce identical scores.
+
+    python benchmarks/bench_grading.py [--questions 2000] [--submissions 5000] [--per-attempt 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grading import QuizGrader  # noqa: E402
+
+OPTIONS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+
+
+def legacy_grade(quiz, question_order, user_answers):
+    """The per-question grading loop submit_quiz used before QuizGrader."""
+    score = 0
+    for i, actual_idx in enumerate(question_order):
+        question = quiz['questions'][actual_idx]
+        user_answer = user_answers.get(str(i))
+        if user_answer is not None:
+            if question.get('type') == 'multiple-select':
+                if set(user_answer) == set(question['answer']): score += question.get('score', 1)
+            elif question.get('type') == 'multipart':
+                for part_idx, part in enumerate(question.get('parts', [])):
+                    if len(user_answer) > part_idx and user_answer[part_idx] is not None:
+                        user_part_answer = user_answer[part_idx]
+                        if part['type'] == 'multiple-select':
+                            if set(user_part_answer) == set(part['answer']): score += part.get('score', 1)
+                        else:
+                            if str(user_part_answer).strip().lower() == str(part['answer']).lower(): score += part.get('score', 1)
+            else:
+                if str(user_answer).strip().lower() == str(question['answer']).lower(): score += question.get('score', 1)
+    return score
+
+
+def make_item(q_type):
+    if q_type == 'multiple-select':
+        return {'type': q_type, 'text': 'Pick', 'options': OPTIONS, 'answer': random.sample(OPTIONS, 2), 'score': 2}
+    if q_type == 'multiple-choice':
+        return {'type': q_type, 'text': 'Choose', 'options': OPTIONS, 'answer': random.choice(OPTIONS), 'score': 1}
+    return {'type': 'short-answer', 'text': 'Type', 'answer': random.choice(OPTIONS).title(), 'score': 1}
+
+
+def make_quiz(question_count):
+    questions = []
+    for _ in range(question_count):
+        q_type = random.choice(['multiple-choice', 'short-answer', 'multiple-select', 'multipart'])
+        if q_type == 'multipart':
+            questions.append({'type': 'multipart', 'text': 'Parts',
+                              'parts': [make_item(random.choice(['short-answer', 'multiple-select'])) for _ in range(3)]})
+        else:
+            questions.append(make_item(q_type))
+    return {'questions': questions}
+
+
+def random_answer(question):
+    if question['type'] == 'multipart':
+        return [random_answer(part) for part in question['parts']]
+    if random.random() < 0.5:
+        answer = question['answer']
+        return f"  {answer.upper()} " if isinstance(answer, str) else list(answer)
+    if question['type'] == 'multiple-select':
+        return random.sample(OPTIONS, 2)
+    return random.choice(OPTIONS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--submissions', type=int, default=5000)
+    parser.add_argument('--per-attempt', type=int, default=50)
+    args = parser.parse_args()
+
+    quiz = make_quiz(args.questions)
+    submissions = []
+    for _ in range(args.submissions):
+        order = random.sample(range(args.questions), args.per_attempt)
+        answers = {str(i): random_answer(quiz['questions'][q]) for i, q in enumerate(order) if random.random() < 0.9}
+        submissions.append((order, answers))
+
+    start = time.perf_counter()
+    legacy_scores = [legacy_grade(quiz, order, answers) for order, answers in submissions]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    grader = QuizGrader(quiz)
+    compile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    compiled_scores = [grader.grade(order, answers) for order, answers in submissions]
+    compiled_time = time.perf_counter() - start
+
+    if legacy_scores != compiled_scores:
+        print("FAILED: compiled grader disagrees with the legacy grading loop.")
+        sys.exit(1)
+    print(f"{args.submissions} submissions x {args.per_attempt} questions (bank of {args.questions})")
+    print(f"  legacy inline loop : {legacy_time * 1000:8.1f} ms ({args.submissions / legacy_time:,.0f} submissions/s)")
+    print(f"  QuizGrader compile : {compile_time * 1000:8.1f} ms (once per quiz version)")
+    print(f"  QuizGrader grade() : {compiled_time * 1000:8.1f} ms ({args.submissions / compiled_time:,.0f} submissions/s)")
+    print(f"  speed-up           : {legacy_time / compiled_time:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# benchmarks/bench_practice.py
+
+"""
+Measures practice-round throughput on a synthetic question bank:
+
+  1. selection only: the old per-request bucket rebuild + random.sample
+     against dealing from the cached selection index with per-student decks;
+  2. freshness: how many rounds a student gets before seeing a repeat;
+  3. end to end: POST /practice/api/questions through the Flask test client,
+     with and without gzip/brotli, reporting requests/s and bytes per response.
+
+    python benchmarks/bench_practice.py [--questions 2000] [--per-type 5] [--rounds 5000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from selection import QUESTION_TYPES, build_selection_index, deal_practice_round  # noqa: E402
+
+OPTIONS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+
+
+def make_question(q_type, n):
+    text = f"Question {n}: " + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 3
+    if q_type == 'multipart':
+        return {'type': q_type, 'text': text,
+                'parts': [{'type': 'short-answer', 'text': 'Part', 'answer': 'x', 'score': 1} for _ in range(3)]}
+    if q_type == 'multiple-select':
+        return {'type': q_type, 'text': text, 'options': OPTIONS, 'answer': OPTIONS[:2], 'score': 2}
+    if q_type == 'multiple-choice':
+        return {'type': q_type, 'text': text, 'options': OPTIONS, 'answer': OPTIONS[0], 'score': 1}
+    return {'type': q_type, 'text': text, 'answer': 'alpha', 'score': 1}
+
+
+def make_quiz(question_count, per_type):
+    return {
+        'id': 'bench-practice', 'pin': '900001', 'practice_pin': '900002', 'name': 'Practice benchmark',
+        'timer': 0, 'questions': [make_question(random.choice(QUESTION_TYPES), n) for n in range(question_count)],
+        'display_config': {'mode': 'question_count', 'parameters': {t: per_type for t in QUESTION_TYPES}},
+        'practice_mode_config': {'enabled': True, 'allow_student_selection': False, 'max_questions_limit': 100},
+    }
+
+
+def legacy_round(quiz, counts):
+    """The selection practice_questions_api did on every request before decks."""
+    available = {}
+    for i, q in enumerate(quiz['questions']):
+        available.setdefault(q['type'], []).append(i)
+    selected = []
+    for q_type, count in counts.items():
+        if count > 0:
+            selected.extend(random.sample(available.get(q_type, []), count))
+    random.shuffle(selected)
+    return selected
+
+
+def rounds_until_repeat(next_round, limit=10000):
+    seen = set()
+    for n in range(1, limit + 1):
+        picked = next_round()
+        if seen.intersection(picked):
+            return n
+        seen.update(picked)
+    return limit
+
+
+def bench_selection(quiz, counts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        legacy_round(quiz, counts)
+    legacy_time = time.perf_counter() - start
+
+    index = build_selection_index(quiz)
+    decks = {}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        deal_practice_round(index, counts, decks)
+    deck_time = time.perf_counter() - start
+
+    print(f"Selection, {rounds} rounds of {sum(counts.values())} questions (bank of {len(quiz['questions'])})")
+    print(f"  rebuild + sample   : {legacy_time * 1000:8.1f} ms ({rounds / legacy_time:,.0f} rounds/s)")
+    print(f"  cached index + deck: {deck_time * 1000:8.1f} ms ({rounds / deck_time:,.0f} rounds/s)")
+
+    print("Rounds before the first repeated question (median of 21 students)")
+    legacy = sorted(rounds_until_repeat(lambda: legacy_round(quiz, counts)) for _ in range(21))[10]
+    dealt = sorted(rounds_until_repeat(lambda decks={}: deal_practice_round(index, counts, decks))
+                   for _ in range(21))[10]
+    smallest = min(len(index['by_type'].get(t, ())) // max(1, c) for t, c in counts.items() if c)
+    print(f"  independent samples: {legacy}")
+    print(f"  per-student decks  : {dealt} (smallest bucket allows {smallest})")
+
+
+def bench_endpoint(quiz, rounds):
+    work = tempfile.mkdtemp(prefix='bench-practice-')
+    os.chdir(work)
+    from app import create_app
+    import data_manager
+
+    data_manager.save_quiz(quiz['id'], quiz)
+    app = create_app()
+    client = app.test_client()
+    client.post('/quiz/start', data={'pin': quiz['practice_pin'], 'name': 'bench'})
+    url = '/practice/api/questions'
+
+    print(f"End to end, {rounds} requests to {url}")
+    for label, accept in (('identity', ''), ('gzip', 'gzip'), ('br, gzip', 'br, gzip')):
+        total_bytes = 0
+        start = time.perf_counter()
+        for _ in range(rounds):
+            response = client.post(url, json={}, headers={'Accept-Encoding': accept})
+            total_bytes += len(response.get_data())
+        elapsed = time.perf_counter() - start
+        encoding = response.headers.get('Content-Encoding', 'identity')
+        print(f"  {label:9} -> {encoding:8}: {rounds / elapsed:8,.0f} req/s, {total_bytes / rounds:10,.0f} bytes/response")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--per-type', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=5000)
+    args = parser.parse_args()
+
+    quiz = make_quiz(args.questions, args.per_type)
+    counts = {t: args.per_type for t in QUESTION_TYPES}
+    bench_selection(quiz, counts, args.rounds)
+    bench_endpoint(json.loads(json.dumps(quiz)), max(1, args.rounds // 10))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/generate_banks.py
+
+"""
+Generates synthetic question banks for benchmarks and load tests, modelled
+on sample_quiz/sample_quiz.json. Banks are saved through data_manager into
+a data directory (so embedded images go through the asset store exactly as
+an upload would), and a manifest of quiz IDs and PINs is written to
+<data-dir>/banks.json for load_test.py.
+
+    python benchmarks/generate_banks.py --data-dir /tmp/quiz-bench \\
+        [--banks 20] [--questions 500] [--multipart 0.1] \\
+        [--image-kb 40] [--image-ratio 0.05] [--backend file|sqlite] [--seed 1]
+"""
+
+import argparse
+import base64
+import copy
+import json
+import os
+import random
+import struct
+import sys
+import zlib
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+SAMPLE_QUIZ = os.path.join(REPO, 'sample_quiz', 'sample_quiz.json')
+
+
+def make_png(size_bytes, rng):
+    """Returns a valid PNG of noise, roughly size_bytes long (noise doesn't compress)."""
+    side = max(1, int((size_bytes / 3) ** 0.5))
+    rows = b''.join(b'\x00' + rng.randbytes(side * 3) for _ in range(side))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(rows, 1)) + chunk(b'IEND', b''))
+
+
+def make_question(template, n, rng, image_kb, image_ratio):
+    question = copy.deepcopy(template)
+    question['text'] = f"[{n}] {question['text']}"
+    if image_kb and rng.random() < image_ratio:
+        image = base64.b64encode(make_png(image_kb * 1024, rng)).decode('ascii')
+        question['text'] += f"\n\n![Figure {n}](data:image/png;base64,{image})"
+    return question
+
+
+def make_bank(sample, index, args, rng):
+    multipart = [q for q in sample['questions'] if q['type'] == 'multipart']
+    single = [q for q in sample['questions'] if q['type'] != 'multipart']
+    questions = []
+    for n in range(args.questions):
+        pool = multipart if multipart and rng.random() < args.multipart else single
+        questions.append(make_question(rng.choice(pool), n, rng, args.image_kb, args.image_ratio))
+
+    counts = {}
+    for q in questions:
+        counts[q['type']] = counts.get(q['type'], 0) + 1
+    parameters = {q_type: min(count, sample['display_config']['parameters'].get(q_type, 0) * args.attempt_scale)
+                  for q_type, count in counts.items()}
+    return {
+        'id': f'bench-{index:04d}',
+        'pin': f'{700000 + index:06d}',
+        'practice_pin': f'{800000 + index:06d}',
+        'name': f"{sample['name']} #{index}",
+        'timer': sample.get('timer', 900),
+        'is_reviewable': True,
+        'display_config': {'mode': 'question_count', 'parameters': parameters, 'target_score': 10},
+        'practice_mode_config': {'enabled': True, 'allow_student_selection': True, 'max_questions_limit': 20},
+        'questions': questions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', required=True, help='Directory to create the quizzes in (the app\'s working directory).')
+    parser.add_argument('--banks', type=int, default=20)
+    parser.add_argument('--questions', type=int, default=500, help='Questions per bank.')
+    parser.add_argument('--multipart', type=float, default=0.1, help='Fraction of multipart questions.')
+    parser.add_argument('--image-kb', type=int, default=0, help='Size of embedded PNGs (0 = no images).')
+    parser.add_argument('--image-ratio', type=float, default=0.05, help='Fraction of questions with an image.')
+    parser.add_argument('--attempt-scale', type=int, default=2,
+                        help="Questions per attempt, as a multiple of the sample quiz's display_config.")
+    parser.add_argument('--backend', choices=['file', 'sqlite'], default=None)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with open(SAMPLE_QUIZ) as f:
+        sample = json.load(f)
+
+    # Storage paths are relative to the working directory and the backend is
+    # chosen from the environment, both read when data_manager is imported.
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.chdir(args.data_dir)
+    if args.backend:
+        os.environ['STORAGE_BACKEND'] = args.backend
+    import data_manager
+
+    rng = random.Random(args.seed)
+    manifest = []
+    for index in range(args.banks):
+        bank = make_bank(sample, index, args, rng)
+        data_manager.save_quiz(bank['id'], bank)
+        manifest.append({key: bank[key] for key in ('id', 'name', 'pin', 'practice_pin')})
+        manifest[-1]['questions'] = len(bank['questions'])
+
+    with open('banks.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Created {args.banks} bank(s) of {args.questions} question(s) in {os.getcwd()} "
+          f"(manifest: banks.json).")
+
+
+if __name__ == '__main__':
+    main()
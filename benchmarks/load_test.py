@@ -0,0 +1,190 @@
+# benchmarks/load_test.py
+
+"""
+Simulates a cohort starting and submitting a quiz at the same moment, using
+the app's real session flow:
+
+  POST /quiz/start -> GET /quiz/instructions -> GET /quiz
+  -> GET /quiz/api/questions?page=N (every page) -> POST /quiz/submit
+  -> GET /leaderboard/<quiz_id>
+
+Each client is a thread with its own cookie jar; all of them wait on a
+barrier and start together. Per-step p50/p95/p99 latency and throughput are
+reported. Create the banks first with generate_banks.py, then either point
+at a running server or let the script start gunicorn in the data directory:
+
+    python benchmarks/load_test.py --data-dir /tmp/quiz-bench --spawn --workers 4 --clients 200
+    python benchmarks/load_test.py --data-dir /tmp/quiz-bench --url http://127.0.0.1:8000 --clients 200
+
+The client side is plain Python too; for very high rates run several copies
+of this script (e.g. one per core) instead of raising --clients.
+"""
+
+import argparse
+import gzip
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stats import print_report, summarize  # noqa: E402
+
+STEPS = ['start', 'instructions', 'quiz', 'questions', 'submit', 'leaderboard']
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One student's browser: a cookie jar and a timed request helper."""
+
+    def __init__(self, base_url, timings, errors):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        self.timings = timings
+        self.errors = errors
+
+    def request(self, step, path, data=None, expect=(200,)):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, headers={'Accept-Encoding': 'gzip'})
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                status, payload, encoding = response.status, response.read(), response.headers.get('Content-Encoding')
+        except urllib.error.HTTPError as e:
+            status, payload, encoding = e.code, e.read(), e.headers.get('Content-Encoding')
+        except OSError as e:
+            self.errors[step].append(repr(e))
+            return None
+        self.timings[step].append(time.perf_counter() - started)
+        if status not in expect:
+            self.errors[step].append(f'HTTP {status}')
+            return None
+        return gzip.decompress(payload) if encoding == 'gzip' else payload
+
+
+def guess_answer(question):
+    if question['type'] == 'multipart':
+        return [guess_answer(part) for part in question.get('parts', [])]
+    options = question.get('options') or ['guess']
+    if question['type'] == 'multiple-select':
+        return random.sample(options, min(2, len(options)))
+    return random.choice(options)
+
+
+def run_student(client, bank, number, barrier):
+    barrier.wait()
+    if client.request('start', '/quiz/start', {'pin': bank['pin'], 'name': f'student-{number}'}, expect=(302,)) is None:
+        return
+    if client.request('instructions', '/quiz/instructions') is None or client.request('quiz', '/quiz') is None:
+        return
+
+    answers = {}
+    page, position = 1, 0
+    while True:
+        payload = client.request('questions', f'/quiz/api/questions?page={page}')
+        if payload is None:
+            return
+        data = json.loads(payload)
+        for question in data['questions']:
+            answers[str(position)] = guess_answer(question)
+            position += 1
+        if position >= data['total'] or not data['questions']:
+            break
+        page += 1
+
+    if client.request('submit', '/quiz/submit', {'answers': json.dumps(answers)}, expect=(302,)) is None:
+        return
+    client.request('leaderboard', f"/leaderboard/{bank['id']}")
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', required=True, help='Directory prepared by generate_banks.py.')
+    parser.add_argument('--url', help='Base URL of a running server.')
+    parser.add_argument('--spawn', action='store_true', help='Start gunicorn in --data-dir for the run.')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers when spawning.')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker when spawning.')
+    parser.add_argument('--port', type=int, default=8765, help='Port when spawning.')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--banks', type=int, default=None, help='Spread clients over the first N banks.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not args.url and not args.spawn:
+        parser.error('give --url or --spawn')
+
+    with open(os.path.join(args.data_dir, 'banks.json')) as f:
+        banks = json.load(f)[:args.banks]
+    random.seed(args.seed)
+
+    server = None
+    base_url = args.url
+    if args.spawn:
+        env = dict(os.environ, PYTHONPATH=REPO + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        server = subprocess.Popen(['gunicorn', '--workers', str(args.workers), '--worker-class', 'gthread',
+                                   '--threads', str(args.threads), '--bind', f'127.0.0.1:{args.port}',
+                                   '--log-level', 'warning', 'app:create_app()'], cwd=args.data_dir, env=env)
+        if not wait_for_port(args.port):
+            server.kill()
+            sys.exit("gunicorn did not start listening in time.")
+        base_url = f'http://127.0.0.1:{args.port}'
+    base_url = base_url.rstrip('/')
+
+    timings = {step: [] for step in STEPS}
+    errors = {step: [] for step in STEPS}
+    barrier = threading.Barrier(args.clients)
+    threads = [threading.Thread(target=run_student,
+                                args=(Client(base_url, timings, errors), random.choice(banks), n, barrier))
+               for n in range(args.clients)]
+    try:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    rows = [(step, summarize(timings[step], elapsed)) for step in STEPS]
+    rows.append(('all requests', summarize([t for step in STEPS for t in timings[step]], elapsed)))
+    print_report(f"{args.clients} simultaneous students over {len(banks)} bank(s) against {base_url} "
+                 f"({elapsed:.2f} s)", rows, unit='req/s')
+    completed = len(timings['leaderboard'])
+    print(f"  completed attempts: {completed}/{args.clients} ({completed / elapsed:,.1f} attempts/s)")
+    for step in STEPS:
+        if errors[step]:
+            print(f"  {step} errors: {len(errors[step])} (e.g. {errors[step][0]})")
+    if any(errors.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# benchmarks/stats.py
+
+"""
+Latency summaries shared by the benchmark scripts: percentiles, throughput
+and a fixed-width report table.
+"""
+
+import math
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list (fraction in 0..1)."""
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(durations, elapsed=None):
+    """
+    Summarizes a list of durations in seconds. Throughput is count / elapsed
+    when the operations overlapped (a load test), else count / sum(durations).
+    """
+    values = sorted(durations)
+    total = elapsed if elapsed is not None else sum(values)
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else float('nan'),
+        'throughput': len(values) / total if total else float('nan'),
+    }
+
+
+def print_report(title, rows, unit='ops/s'):
+    """rows: [(label, summary dict)], printed with latencies in milliseconds."""
+    print(title)
+    width = max([len(label) for label, _ in rows] + [10])
+    print(f"  {'':{width}}  {'count':>7}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'max ms':>9}  {unit:>11}")
+    for label, s in rows:
+        print(f"  {label:{width}}  {s['count']:7d}  {s['p50'] * 1000:9.3f}  {s['p95'] * 1000:9.3f}  "
+              f"{s['p99'] * 1000:9.3f}  {s['max'] * 1000:9.3f}  {s['throughput']:11,.1f}")
@@ -0,0 +1,114 @@
+# benchmarks/stress_storage.py
+
+"""
+Concurrency stress test for the storage layer.
+
+Runs several writer and reader processes against data_manager in a scratch
+directory, the way gunicorn workers share the data directories, and fails if
+a reader ever sees a partially written quiz or a leaderboard loses or
+mangles a row.
+
+    python benchmarks/stress_storage.py [--backend file|sqlite] [--seconds 10]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUIZ_ID = 'stress-quiz'
+
+
+def _make_quiz(marker):
+    # Vary the size a lot so a torn write would show up as truncated JSON.
+    question_count = random.randint(1, 400)
+    return {
+        'id': QUIZ_ID,
+        'pin': '424242',
+        'name': f'Stress {marker}',
+        'timer': 0,
+        'marker': marker,
+        'questions': [
+            {'text': 'x' * random.randint(0, 2000), 'type': 'short-answer', 'answer': 'a', 'score': 1, 'marker': marker}
+            for _ in range(question_count)
+        ],
+    }
+
+
+def _writer(worker, deadline, results):
+    import data_manager
+    saves = appends = 0
+    while time.time() < deadline:
+        data_manager.save_quiz(QUIZ_ID, _make_quiz(f'{worker}-{saves}'))
+        saves += 1
+        for _ in range(5):
+            data_manager.add_to_leaderboard(QUIZ_ID, f'writer{worker}', random.randint(0, 100))
+            appends += 1
+    results.put(('writer', saves, appends, 0))
+
+
+def _reader(worker, deadline, results):
+    from storage import get_backend
+    import data_manager
+    backend = get_backend()
+    reads = failures = 0
+    while time.time() < deadline:
+        loaded = backend.read_quiz(QUIZ_ID)
+        cached = data_manager.get_quiz_by_id(QUIZ_ID)
+        for quiz_data in (loaded[0] if loaded else None, cached):
+            reads += 1
+            if quiz_data is None or any(q['marker'] != quiz_data['marker'] for q in quiz_data['questions']):
+                failures += 1
+        data_manager.get_leaderboard(QUIZ_ID)
+    results.put(('reader', reads, 0, failures))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['file', 'sqlite'], default='file')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='quiz-stress-'))
+    os.environ['STORAGE_BACKEND'] = args.backend
+    sys.path.insert(0, REPO_ROOT)
+    import data_manager
+    data_manager.save_quiz(QUIZ_ID, _make_quiz('initial'))
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    deadline = time.time() + args.seconds
+    processes = [context.Process(target=_writer, args=(i, deadline, results)) for i in range(args.writers)]
+    processes += [context.Process(target=_reader, args=(i, deadline, results)) for i in range(args.readers)]
+    for process in processes:
+        process.start()
+    totals = {'saves': 0, 'appends': 0, 'reads': 0, 'failures': 0}
+    for _ in processes:
+        role, count, appends, failures = results.get()
+        totals['saves' if role == 'writer' else 'reads'] += count
+        totals['appends'] += appends
+        totals['failures'] += failures
+    for process in processes:
+        process.join()
+
+    # Every append must be present exactly once and parse cleanly.
+    from storage import get_backend
+    rows = get_backend().read_leaderboard_changes(QUIZ_ID, None)[0]
+    lost_rows = totals['appends'] - len(rows)
+
+    print(f"backend={args.backend} saves={totals['saves']} reads={totals['reads']} "
+          f"appends={totals['appends']} partial_reads={totals['failures']} lost_rows={lost_rows}")
+    if totals['failures'] or lost_rows:
+        print("FAILED: readers saw partial data or leaderboard rows were lost.")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# compression.py
+
+"""
+Content-Encoding negotiation for responses. gzip is always available;
+brotli is offered when the optional `brotli` package is installed.
+
+create_app runs every buffered response through compress_response. Static
+files are not compressed per request; `flask precompress-static` writes
+.gz/.br copies next to them once (see static_files.py).
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip alone is used without it.
+    brotli = None
+
+# Bodies smaller than this are sent as-is; compressing them saves little.
+MIN_COMPRESS_BYTES = 1024
+
+# Preferred first. Dynamic responses use moderate levels: the highest
+# brotli/gzip settings cost far more CPU than they save in bytes.
+AVAILABLE_ENCODINGS = (['br'] if brotli else []) + ['gzip']
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5
+
+# Everything else (images, archives, event streams) is left alone.
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+
+
+def negotiate_encoding(accept_encodings):
+    """Returns 'br', 'gzip' or None for a request's parsed Accept-Encoding."""
+    return accept_encodings.best_match(AVAILABLE_ENCODINGS)
+
+
+def compress(data, encoding, best=False):
+    """Compresses bytes; `best` trades CPU for size (for files compressed once)."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else _BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else _GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response, accept_encodings, min_size=MIN_COMPRESS_BYTES):
+    """
+    Compresses a buffered response body in place when the client accepts an
+    encoding we offer and the body is worth compressing. Streamed responses
+    (e.g. server-sent events) and file downloads are passed through.
+    Returns the response.
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < min_size:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ from the original, so a strong validator
+    # would be wrong; views compare ETags with contains_weak().
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
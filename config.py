@@ -10,10 +10,69 @@ load_dotenv()
 # Get the secret key from the environment, with a fallback for safety
 SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'a-fallback-secret-key-for-dev')
 
-# --- Data Storage Paths (Unchanged) ---
+# --- Data Storage ---
+# 'file' keeps the original JSON/CSV layout below; 'sqlite' keeps everything
+# in a single database at SQLITE_DB_PATH (see `flask import-to-sqlite`).
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'file')
+SQLITE_DB_PATH = os.getenv('SQLITE_DB_PATH', 'quiz_site.db')
+
+# --- Data Storage Paths (file backend) ---
 USER_DATA_FILE = 'users.json'
 QUIZ_DIR = 'quizzes'
 LEADERBOARD_DIR = 'leaderboards'
+SUBMISSION_DIR = 'submissions'
+STATE_DIR = 'state'
+ANALYTICS_DIR = 'analytics'
+ASSET_DIR = 'assets'   # Images extracted from quiz JSON (used by every backend)
+
+# --- Quiz Attempts ---
+# How long an in-progress attempt (question order and start time) is kept
+# server-side. The session cookie only carries the attempt's id.
+ATTEMPT_TTL_SECONDS = int(os.getenv('ATTEMPT_TTL_SECONDS', 6 * 60 * 60))
+
+# --- Answer Reviews ---
+# Review data saved at submission time expires after REVIEW_TTL_SECONDS; once
+# stored reviews exceed REVIEW_STORE_MAX_BYTES the oldest are evicted first.
+REVIEW_TTL_SECONDS = int(os.getenv('REVIEW_TTL_SECONDS', 24 * 60 * 60))
+REVIEW_STORE_MAX_BYTES = int(os.getenv('REVIEW_STORE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Each worker sweeps expired attempts and reviews at most this often.
+STATE_SWEEP_INTERVAL_SECONDS = int(os.getenv('STATE_SWEEP_INTERVAL_SECONDS', 5 * 60))
+
+# --- Caching ---
+# Upper bound (in bytes of quiz JSON) for the per-worker parsed-quiz cache.
+QUIZ_CACHE_MAX_BYTES = int(os.getenv('QUIZ_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# --- Leaderboards ---
+LEADERBOARD_PAGE_SIZE = 50
+
+# --- Admin Dashboard ---
+ADMIN_QUIZ_PAGE_SIZE = int(os.getenv('ADMIN_QUIZ_PAGE_SIZE', 25))
+
+# --- Quiz Delivery ---
+# The quiz page embeds the first page of questions and fetches the rest from
+# /quiz/api/questions this many at a time.
+QUESTION_PAGE_SIZE = int(os.getenv('QUESTION_PAGE_SIZE', 5))
+
+# --- Logging & Metrics ---
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Each worker writes its metrics snapshot here; /admin/metrics merges them.
+METRICS_DIR = os.getenv('METRICS_DIR', 'metrics')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+# If set, /admin/metrics also accepts "Authorization: Bearer <token>" (for Prometheus).
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# --- Live Exam Monitor ---
+# Joins and submissions are appended to LIVE_DIR/<quiz_id>.jsonl, which every
+# worker tails (at most every LIVE_POLL_SECONDS) to feed /admin/live streams.
+LIVE_DIR = os.getenv('LIVE_DIR', 'live')
+LIVE_POLL_SECONDS = float(os.getenv('LIVE_POLL_SECONDS', 1))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv('LIVE_HEARTBEAT_SECONDS', 15))
+# Streams end after this long and the browser reconnects; keep it below the
+# gunicorn --timeout when running sync workers.
+LIVE_STREAM_SECONDS = float(os.getenv('LIVE_STREAM_SECONDS', 60))
+# Open streams per worker; further watchers fall back to polling.
+LIVE_MAX_STREAMS = int(os.getenv('LIVE_MAX_STREAMS', 8))
 
 # --- Initial Admin User Configuration ---
 # Get admin credentials from the environment
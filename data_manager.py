@@ -1,21 +1,40 @@
-import json
-import os
-import csv
+from collections import OrderedDict
+from contextlib import closing
 from datetime import datetime
 from werkzeug.security import generate_password_hash
-from config import USER_DATA_FILE, QUIZ_DIR, LEADERBOARD_DIR
-from config import USER_DATA_FILE, ADMIN_USERNAME, ADMIN_PASSWORD
+from config import ADMIN_QUIZ_PAGE_SIZE, ATTEMPT_TTL_SECONDS, LEADERBOARD_PAGE_SIZE, QUIZ_CACHE_MAX_BYTES
+from config import REVIEW_STORE_MAX_BYTES, REVIEW_TTL_SECONDS, STATE_SWEEP_INTERVAL_SECONDS
+from config import ADMIN_USERNAME, ADMIN_PASSWORD
+import hashlib
+import json
+import logging
+import re
+import secrets
+import sqlite3
+import threading
+import time
 import uuid
-from datetime import datetime
-from werkzeug.security import generate_password_hash
+import analytics
+from assets import extract_assets
+from grading import QuizGrader, question_layout_hash
+from leaderboard import Leaderboard
+import live_monitor
+import metrics
+from readonly import freeze, thaw
+from selection import build_selection_index
+from storage import get_backend
+from student_view import build_question_fragments, build_student_view
+
+logger = logging.getLogger(__name__)
 
 def load_users():
     """
-    Loads user data from users.json. If the file doesn't exist,
-    it creates it with the initial admin user from the .env configuration.
+    Loads user data from storage. If no users exist yet, it creates the
+    initial admin user from the .env configuration.
     """
-    if not os.path.exists(USER_DATA_FILE):
-        print(f"User data file not found. Creating '{USER_DATA_FILE}' with initial admin user.")
+    users = get_backend().load_users()
+    if users is None:
+        logger.info("User data not found. Creating initial admin user '%s'.", ADMIN_USERNAME)
         # Create the default admin user from the config
         initial_users = {
             ADMIN_USERNAME: {
@@ -25,24 +44,33 @@ def load_users():
         }
         save_users(initial_users)
         return initial_users
+    return users
 
-    with open(USER_DATA_FILE, 'r') as f:
-        return json.load(f)
+def users_exist():
+    """Returns True once user data has been persisted."""
+    return get_backend().load_users() is not None
 
 def save_users(users):
-    """Saves user data to the users.json file."""
-    with open(USER_DATA_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+    """Saves user data to storage."""
+    get_backend().save_users(users)
 
 # --- Helper function for backward compatibility ---
-def _ensure_backward_compatibility(quiz_data):
+# Bump this whenever _ensure_backward_compatibility learns a new upgrade step.
+# Quizzes stamped with the current version skip the upgrade on the read path.
+QUIZ_SCHEMA_VERSION = 1
+
+def _needs_upgrade(quiz_data):
+    return quiz_data.get('schema_version', 0) < QUIZ_SCHEMA_VERSION
+
+def _ensure_backward_compatibility(quiz_data, verbose=True):
     """
-    Checks for and adds missing keys for all new features to older quiz files.
-    This function is now upgraded to handle all recent feature additions.
+    Checks for and adds missing keys for all new features to older quiz files
+    and stamps the result with the current schema version.
     """
     # Check for the original display_config
     if 'display_config' not in quiz_data:
-        print(f"INFO: Upgrading old quiz format for quiz ID {quiz_data.get('id')}. Adding default 'display_config'.")
+        if verbose:
+            logger.info("Upgrading old quiz format for quiz ID %s. Adding default 'display_config'.", quiz_data.get('id'))
         quiz_data['display_config'] = {
             'mode': 'question_count',
             'parameters': { 'multiple-choice': 0, 'short-answer': 0, 'multiple-select': 0, 'multipart': 0 },
@@ -51,7 +79,8 @@ def _ensure_backward_compatibility(quiz_data):
 
     # --- UPGRADE: Add default (disabled) practice mode configuration ---
     if 'practice_mode_config' not in quiz_data:
-        print(f"INFO: Upgrading quiz ID {quiz_data.get('id')}. Adding default 'practice_mode_config'.")
+        if verbose:
+            logger.info("Upgrading quiz ID %s. Adding default 'practice_mode_config'.", quiz_data.get('id'))
         quiz_data['practice_mode_config'] = {
             'enabled': False,
             'allow_student_selection': False,
@@ -60,7 +89,8 @@ def _ensure_backward_compatibility(quiz_data):
 
     # --- UPGRADE: Generate a practice PIN if one doesn't exist ---
     if 'practice_pin' not in quiz_data:
-        print(f"INFO: Upgrading quiz ID {quiz_data.get('id')}. Generating new 'practice_pin'.")
+        if verbose:
+            logger.info("Upgrading quiz ID %s. Generating new 'practice_pin'.", quiz_data.get('id'))
         # Generate a new random 6-digit pin for practice mode
         quiz_data['practice_pin'] = str(uuid.uuid4().int)[-6:]
 
@@ -71,132 +101,763 @@ def _ensure_backward_compatibility(quiz_data):
     if 'instructions' not in quiz_data:
         quiz_data['instructions'] = ''
 
+    quiz_data['schema_version'] = QUIZ_SCHEMA_VERSION
     return quiz_data
 
 
 def get_all_quizzes():
-    """Scans the quiz directory and returns data from all quiz JSON files."""
+    """Returns data from all stored quizzes."""
     quizzes = []
-    if not os.path.exists(QUIZ_DIR):
-        os.makedirs(QUIZ_DIR)
-    for filename in os.listdir(QUIZ_DIR):
-        if filename.endswith('.json'):
-            with open(os.path.join(QUIZ_DIR, filename), 'r') as f:
-                try:
-                    quiz_data = json.load(f)
-                    # --- START OF THE FIX ---
-                    quiz_data = _ensure_backward_compatibility(quiz_data)
-                    # --- END OF THE FIX ---
-                    quizzes.append(quiz_data)
-                except json.JSONDecodeError:
-                    print(f"ERROR: Could not parse {filename}. It may be a corrupted JSON file.")
+    for quiz_id in get_backend().list_quiz_signatures():
+        quiz_data = _load_quiz(quiz_id)
+        if quiz_data is not None:
+            quizzes.append(quiz_data)
     return quizzes
 
 def get_quiz_by_id(quiz_id):
-    """Loads a single quiz by its ID and ensures it's backward-compatible."""
-    quiz_path = os.path.join(QUIZ_DIR, f"{quiz_id}.json")
-    if os.path.exists(quiz_path):
-        with open(quiz_path, 'r') as f:
-            try:
-                quiz_data = json.load(f)
-                # --- START OF THE FIX ---
-                quiz_data = _ensure_backward_compatibility(quiz_data)
-                # --- END OF THE FIX ---
-                return quiz_data
-            except json.JSONDecodeError:
-                print(f"ERROR: Could not parse {quiz_id}.json. It may be a corrupted JSON file.")
+    """
+    Loads a single quiz by its ID and ensures it's backward-compatible.
+    The result is shared with other requests and is read-only.
+    """
+    return _load_quiz(quiz_id)
+
+def get_quiz_for_update(quiz_id):
+    """Returns a private, mutable copy of a quiz for routes that modify and re-save it."""
+    quiz_data = _load_quiz(quiz_id)
+    return thaw(quiz_data) if quiz_data is not None else None
+
+# --- Parsed Quiz Cache ---
+# Parsed and upgraded quizzes are kept per worker, keyed by quiz ID and
+# validated against the stored quiz's signature on every lookup, so a quiz
+# saved by another worker is picked up on the next request. Entries are
+# evicted least recently used first once their combined size exceeds the cap.
+
+_quiz_cache = OrderedDict()   # quiz_id -> {'signature', 'quiz', 'size', 'derived'}
+_quiz_cache_bytes = 0
+_quiz_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_quiz_cache_lock = threading.Lock()
+
+def _evict_quiz(quiz_id):
+    """Drops a quiz from the cache. Must be called with the cache lock held."""
+    global _quiz_cache_bytes
+    entry = _quiz_cache.pop(quiz_id, None)
+    if entry is not None:
+        _quiz_cache_bytes -= entry['size']
+
+def _load_quiz(quiz_id):
+    """Returns the cached, read-only quiz, re-reading storage only if it changed."""
+    return _load_quiz_with_signature(quiz_id)[0]
+
+def _load_quiz_with_signature(quiz_id):
+    """Like _load_quiz, but returns (quiz, storage signature) or (None, None)."""
+    global _quiz_cache_bytes
+    signature = get_backend().quiz_signature(quiz_id)
+    if signature is None:
+        with _quiz_cache_lock:
+            _evict_quiz(quiz_id)
+        return None, None
+
+    with _quiz_cache_lock:
+        entry = _quiz_cache.get(quiz_id)
+        if entry is not None and entry['signature'] == signature:
+            _quiz_cache.move_to_end(quiz_id)
+            _quiz_cache_stats['hits'] += 1
+            return entry['quiz'], signature
+        _quiz_cache_stats['misses'] += 1
+
+    loaded = get_backend().read_quiz(quiz_id)
+    if loaded is None:
+        return None, None
+    quiz_data, signature, size = loaded
+    metrics.inc('quiz_storage_reads_total')
+    metrics.inc('quiz_storage_read_bytes_total', size)
+    if _needs_upgrade(quiz_data):
+        quiz_data = _ensure_backward_compatibility(quiz_data)
+        signature = _write_back_upgrade(quiz_id, quiz_data, signature)
+    quiz_data = freeze(quiz_data)
+
+    with _quiz_cache_lock:
+        _evict_quiz(quiz_id)
+        if size <= QUIZ_CACHE_MAX_BYTES:
+            _quiz_cache[quiz_id] = {'signature': signature, 'quiz': quiz_data, 'size': size, 'derived': {}}
+            _quiz_cache_bytes += size
+            while _quiz_cache_bytes > QUIZ_CACHE_MAX_BYTES:
+                oldest_id = next(iter(_quiz_cache))
+                _evict_quiz(oldest_id)
+                _quiz_cache_stats['evictions'] += 1
+    return quiz_data, signature
+
+def get_quiz_derived(quiz_id, quiz_data, name, builder):
+    """
+    Returns builder(quiz_data), computed once per cached version of a quiz.
+
+    Derived data (selection indexes, graders, ...) is stored with the cache
+    entry, so it is rebuilt automatically after the quiz is saved. It is only
+    reused if `quiz_data` is the exact object currently cached, so callers can
+    never pair a quiz with data derived from a different version of it.
+    """
+    with _quiz_cache_lock:
+        entry = _quiz_cache.get(quiz_id)
+        if entry is not None and entry['quiz'] is quiz_data and name in entry['derived']:
+            return entry['derived'][name]
+    value = builder(quiz_data)
+    with _quiz_cache_lock:
+        entry = _quiz_cache.get(quiz_id)
+        if entry is not None and entry['quiz'] is quiz_data:
+            entry['derived'][name] = value
+    return value
+
+def get_selection_index(quiz_id, quiz_data):
+    """Returns the cached per-type/per-score question index for a quiz."""
+    return get_quiz_derived(quiz_id, quiz_data, 'selection', build_selection_index)
+
+def get_grader(quiz_id, quiz_data):
+    """Returns the cached QuizGrader (compiled answer key) for a quiz."""
+    return get_quiz_derived(quiz_id, quiz_data, 'grader', QuizGrader)
+
+def get_student_view(quiz_id, quiz_data):
+    """Returns the cached student view of a quiz's questions (render fields only, no answers)."""
+    return get_quiz_derived(quiz_id, quiz_data, 'student_view', build_student_view)
+
+def get_question_fragments(quiz_id, quiz_data):
+    """Returns the cached per-question JSON fragments of the student view."""
+    return get_quiz_derived(quiz_id, quiz_data, 'question_fragments',
+                            lambda quiz: build_question_fragments(get_student_view(quiz_id, quiz)))
+
+def get_layout_hash(quiz_id, quiz_data):
+    """Returns the cached question-layout fingerprint stored with each submission."""
+    return get_quiz_derived(quiz_id, quiz_data, 'layout', question_layout_hash)
+
+def _questions_hash(quiz_data):
+    return hashlib.sha1(json.dumps(quiz_data.get('questions', []), sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_questions_hash(quiz_id, quiz_data):
+    """Returns a cached hash of a quiz's questions, answers included."""
+    return get_quiz_derived(quiz_id, quiz_data, 'questions_hash', _questions_hash)
+
+def _quiz_hash(quiz_data):
+    return hashlib.sha1(json.dumps(quiz_data, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_quiz_hash(quiz_id, quiz_data):
+    """Returns a cached hash of the whole quiz, for ETags of pages rendered from it."""
+    return get_quiz_derived(quiz_id, quiz_data, 'quiz_hash', _quiz_hash)
+
+def _write_back_upgrade(quiz_id, quiz_data, signature):
+    """
+    Persists an upgraded legacy quiz so later reads skip the upgrade (and its
+    practice PIN stops changing). Skipped if the quiz changed since it was read.
+    Returns the signature of the quiz now in storage.
+    """
+    with _quiz_write_lock:
+        new_signature = get_backend().write_quiz(quiz_id, quiz_data, expected_signature=signature)
+    return new_signature if new_signature is not None else signature
+
+def migrate_quizzes():
+    """Upgrades every stored quiz to the current schema. Returns the number upgraded."""
+    upgraded = 0
+    backend = get_backend()
+    for quiz_id in backend.list_quiz_signatures():
+        loaded = backend.read_quiz(quiz_id)
+        if loaded is None:
+            continue
+        quiz_data, signature, _ = loaded
+        if _needs_upgrade(quiz_data):
+            _write_back_upgrade(quiz_id, _ensure_backward_compatibility(quiz_data), signature)
+            invalidate_quiz_cache(quiz_id)
+            upgraded += 1
+    return upgraded
+
+def extract_all_quiz_assets():
+    """
+    Moves embedded images out of every stored quiz. Returns a summary dict
+    with the number of quizzes rewritten, images extracted and bytes saved.
+    """
+    summary = {'quizzes': 0, 'assets': 0, 'bytes_saved': 0}
+    backend = get_backend()
+    for quiz_id in backend.list_quiz_signatures():
+        loaded = backend.read_quiz(quiz_id)
+        if loaded is None:
+            continue
+        quiz_data, signature, _ = loaded
+        stats = extract_assets(quiz_data)
+        if not stats['assets']:
+            continue
+        with _quiz_write_lock:
+            written = backend.write_quiz(quiz_id, quiz_data, expected_signature=signature)
+        if written is None:
+            logger.warning("Quiz %s changed while its images were being extracted; it was skipped.", quiz_id)
+            continue
+        invalidate_quiz_cache(quiz_id)
+        summary['quizzes'] += 1
+        summary['assets'] += stats['assets']
+        summary['bytes_saved'] += stats['bytes_saved']
+    return summary
+
+def invalidate_quiz_cache(quiz_id=None):
+    """Drops one quiz (or every quiz) from this worker's cache."""
+    global _quiz_cache_bytes
+    with _quiz_cache_lock:
+        if quiz_id is None:
+            _quiz_cache.clear()
+            _quiz_cache_bytes = 0
+        else:
+            _evict_quiz(quiz_id)
+
+def get_quiz_cache_stats():
+    """Returns hit/miss/eviction counters and the current size of the quiz cache."""
+    with _quiz_cache_lock:
+        return dict(_quiz_cache_stats, entries=len(_quiz_cache), bytes=_quiz_cache_bytes,
+                    max_bytes=QUIZ_CACHE_MAX_BYTES)
+
+def _quiz_cache_metrics():
+    stats = get_quiz_cache_stats()
+    return [
+        ('quiz_cache_hits_total', {}, stats['hits']),
+        ('quiz_cache_misses_total', {}, stats['misses']),
+        ('quiz_cache_evictions_total', {}, stats['evictions']),
+        ('quiz_cache_entries', {}, stats['entries']),
+        ('quiz_cache_bytes', {}, stats['bytes']),
+    ]
+
+metrics.register_collector(_quiz_cache_metrics)
+
+_quiz_write_lock = threading.Lock()
+
+def _stored_revision(quiz_id):
+    """
+    Returns (revision, signature) of the quiz in storage, or (0, None). Unlike
+    _load_quiz_with_signature it never writes back a legacy upgrade (which
+    takes _quiz_write_lock), so it is safe to call while holding the lock.
+    """
+    signature = get_backend().quiz_signature(quiz_id)
+    if signature is None:
+        return 0, None
+    with _quiz_cache_lock:
+        entry = _quiz_cache.get(quiz_id)
+        if entry is not None and entry['signature'] == signature:
+            return entry['quiz'].get('revision', 0), signature
+    loaded = get_backend().read_quiz(quiz_id)
+    if loaded is None:
+        return 0, None
+    stored, signature, _ = loaded
+    return stored.get('revision', 0), signature
+
+def save_quiz(quiz_id, quiz_data, expected_revision=None):
+    """
+    Saves a quiz under its ID, moving embedded images into the asset store.
+    Every save bumps the quiz's 'revision'. If expected_revision is given and
+    the stored quiz is at a different revision, nothing is written and None
+    is returned; otherwise the new revision is returned.
+    """
+    # New quizzes (uploads, the create form) are filled in with current defaults.
+    quiz_data = _ensure_backward_compatibility(quiz_data, verbose=False)
+    extract_assets(quiz_data)
+    backend = get_backend()
+    with _quiz_write_lock:
+        while True:
+            current_revision, current_signature = _stored_revision(quiz_id)
+            if expected_revision is not None and current_revision != expected_revision:
                 return None
-    return None
+            quiz_data['revision'] = current_revision + 1
+            quiz_data['updated_at'] = datetime.utcnow().isoformat(timespec='seconds')
+            # The write only succeeds if nobody (in any worker) saved since we
+            # read the current revision; otherwise re-read and try again.
+            signature = backend.write_quiz(quiz_id, quiz_data, expected_signature=current_signature)
+            if signature is not None:
+                break
+    invalidate_quiz_cache(quiz_id)
+    _index_quiz(quiz_id, quiz_data, signature)
+    return quiz_data['revision']
+
+# --- Quiz Index ---
+# A small summary of every quiz (name, PINs, question counts, total score),
+# so joining by PIN and listing quizzes never parse question bodies. Summaries
+# are stored next to the quizzes and rewritten on every save. Each worker
+# keeps a copy and re-syncs whenever the backend's quiz stamp changes; a
+# summary built from an older signature than its quiz (e.g. the file was
+# edited by hand) is rebuilt from the quiz.
+
+_SUMMARY_VERSION = 1   # Bump when _quiz_summary changes, so stored summaries are rebuilt.
+
+_index_lock = threading.Lock()
+_quiz_index = {}      # quiz_id -> (signature, summary)
+_pin_index = {}       # pin -> (quiz_id, mode)
+_index_stamp = None
+
+def _quiz_summary(quiz_data):
+    """Builds the listing/PIN summary of a quiz."""
+    questions = quiz_data.get('questions', [])
+    question_counts = {}
+    total_score = 0
+    for q in questions:
+        question_counts[q.get('type')] = question_counts.get(q.get('type'), 0) + 1
+        if q.get('type') == 'multipart':
+            total_score += sum(p.get('score', 0) for p in q.get('parts', []))
+        else:
+            total_score += q.get('score', 0)
+    return {
+        'version': _SUMMARY_VERSION,
+        'name': quiz_data.get('name', ''),
+        'pin': quiz_data.get('pin'),
+        'practice_pin': quiz_data.get('practice_pin'),
+        'practice_enabled': bool(quiz_data.get('practice_mode_config', {}).get('enabled')),
+        'is_reviewable': bool(quiz_data.get('is_reviewable')),
+        'timer': quiz_data.get('timer'),
+        'question_count': len(questions),
+        'question_counts': question_counts,
+        'total_score': total_score,
+        'updated_at': quiz_data.get('updated_at'),
+    }
+
+def _rebuild_pin_lookup():
+    """Rebuilds the PIN -> quiz map. Real PINs always win over practice PINs."""
+    global _pin_index
+    pin_index = {}
+    for quiz_id, (_, summary) in _quiz_index.items():
+        if summary['practice_enabled'] and summary['practice_pin']:
+            pin_index[summary['practice_pin']] = (quiz_id, 'practice')
+    for quiz_id, (_, summary) in _quiz_index.items():
+        if summary['pin']:
+            pin_index[summary['pin']] = (quiz_id, 'real')
+    _pin_index = pin_index
+
+def _index_quiz(quiz_id, quiz_data, signature):
+    """Stores the summary of a freshly saved quiz and adds it to this worker's index."""
+    entry = (signature, _quiz_summary(quiz_data))
+    get_backend().write_quiz_summaries({quiz_id: entry})
+    with _index_lock:
+        _quiz_index[quiz_id] = entry
+        _rebuild_pin_lookup()
+
+def _unindex_quiz(quiz_id):
+    with _index_lock:
+        if _quiz_index.pop(quiz_id, None) is not None:
+            _rebuild_pin_lookup()
+
+def refresh_quiz_index():
+    """
+    Brings the quiz index up to date with storage. Only quizzes whose stored
+    summary is missing or stale are parsed.
+    """
+    global _quiz_index, _index_stamp
+    backend = get_backend()
+    stamp = backend.quiz_stamp()
+    if stamp is not None and stamp == _index_stamp:
+        return
+
+    stored = backend.read_quiz_summaries()
+    fresh, rebuilt = {}, {}
+    for quiz_id, signature in backend.list_quiz_signatures().items():
+        entry = stored.get(quiz_id)
+        if entry is not None and entry[0] == signature and entry[1].get('version') == _SUMMARY_VERSION:
+            fresh[quiz_id] = entry
+            continue
+        quiz_data, signature = _load_quiz_with_signature(quiz_id)
+        if quiz_data is not None:
+            fresh[quiz_id] = rebuilt[quiz_id] = (signature, _quiz_summary(quiz_data))
+    if rebuilt:
+        backend.write_quiz_summaries(rebuilt)
+
+    with _index_lock:
+        _quiz_index = fresh
+        _rebuild_pin_lookup()
+        _index_stamp = stamp
 
-def save_quiz(quiz_id, quiz_data):
-    """Saves a quiz to a JSON file named after its ID."""
-    if not os.path.exists(QUIZ_DIR):
-        os.makedirs(QUIZ_DIR)
-    with open(os.path.join(QUIZ_DIR, f"{quiz_id}.json"), 'w') as f:
-        json.dump(quiz_data, f, indent=4)
+def find_quiz_by_pin(pin):
+    """Returns (quiz_id, mode) for a real or practice PIN, or (None, None)."""
+    refresh_quiz_index()
+    return _pin_index.get(pin.strip(), (None, None))
 
-# --- Leaderboard Management (CSV) ---
+def pin_in_use(pin, exclude_quiz_id=None):
+    """True if another quiz already uses `pin` as its quiz or practice PIN."""
+    refresh_quiz_index()
+    return any(quiz_id != exclude_quiz_id and pin in (summary['pin'], summary['practice_pin'])
+               for quiz_id, (_, summary) in _quiz_index.items())
+
+def get_quiz_summary(quiz_id):
+    """Returns a copy of a quiz's index summary (see _quiz_summary), or None."""
+    refresh_quiz_index()
+    entry = _quiz_index.get(quiz_id)
+    return dict(entry[1], id=quiz_id) if entry else None
+
+def list_quiz_summaries(search='', page=1, per_page=ADMIN_QUIZ_PAGE_SIZE):
+    """
+    Returns (summaries, total_matches) for one 1-based page of the quiz list,
+    sorted by name. `search` matches anywhere in the name or at the start of
+    either PIN, ignoring case.
+    Each summary is a copy of the index entry with 'id' and 'leaderboard_size' added.
+    """
+    refresh_quiz_index()
+    search = search.strip().lower()
+    with _index_lock:
+        entries = list(_quiz_index.items())
+    matches = [
+        dict(summary, id=quiz_id) for quiz_id, (_, summary) in entries
+        if not search or search in summary['name'].lower()
+        or (summary['pin'] or '').lower().startswith(search)
+        or (summary['practice_pin'] or '').lower().startswith(search)
+    ]
+    matches.sort(key=lambda summary: (summary['name'].lower(), summary['id']))
+    page_entries = matches[(page - 1) * per_page:page * per_page]
+    for summary in page_entries:
+        summary['leaderboard_size'] = get_leaderboard_size(summary['id'])
+    return page_entries, len(matches)
+
+# --- Leaderboard Management ---
+
+# Each worker keeps every quiz's leaderboard sorted in memory. New rows
+# (including ones added by other workers) are applied by reading only what
+# was appended since the last look; the whole leaderboard is re-read only
+# when storage reports that earlier rows were changed or removed.
+
+_leaderboards = {}   # quiz_id -> Leaderboard
+_leaderboard_lock = threading.Lock()
+
+def _refresh_leaderboard(quiz_id):
+    """Returns the up-to-date Leaderboard for a quiz (None if it has no entries yet)."""
+    with _leaderboard_lock:
+        board = _leaderboards.get(quiz_id)
+        changes = get_backend().read_leaderboard_changes(quiz_id, board.cursor if board else None)
+        if changes is None:
+            _leaderboards.pop(quiz_id, None)
+            return None
+        rows, cursor, reset = changes
+        if board is None or reset:
+            board = _leaderboards[quiz_id] = Leaderboard()
+        for row in rows:
+            board.add(row)
+        board.cursor = cursor
+        return board
 
 def get_leaderboard(quiz_id):
-    """Reads a leaderboard CSV file and returns its data, sorted by score."""
-    leaderboard = []
-    leaderboard_path = os.path.join(LEADERBOARD_DIR, f"{quiz_id}.csv")
-    if os.path.exists(leaderboard_path):
-        with open(leaderboard_path, 'r', newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # Ensure score is an integer for correct sorting
-                row['score'] = int(row['score'])
-                leaderboard.append(row)
-    # Sort by score (descending)
-    leaderboard.sort(key=lambda x: x['score'], reverse=True)
-    return leaderboard
-
-def add_to_leaderboard(quiz_id, username, score):
-    """Appends a new entry to a leaderboard CSV file."""
-    if not os.path.exists(LEADERBOARD_DIR):
-        os.makedirs(LEADERBOARD_DIR)
-        
-    leaderboard_path = os.path.join(LEADERBOARD_DIR, f"{quiz_id}.csv")
-    file_exists = os.path.exists(leaderboard_path)
-    
-    with open(leaderboard_path, 'a', newline='') as f:
-        fieldnames = ['username', 'score', 'timestamp']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()  # Write header if file is new
-            
-        writer.writerow({
-            'username': username,
-            'score': score,
-            'timestamp': datetime.utcnow().isoformat()
-        })
-
-TEMP_SESSION_DIR = 'temp_sessions'
+    """Returns a quiz's leaderboard entries, sorted by score (highest first)."""
+    board = _refresh_leaderboard(quiz_id)
+    return board.rows() if board else []
+
+def get_leaderboard_size(quiz_id):
+    """Returns the number of entries on a quiz's leaderboard."""
+    board = _refresh_leaderboard(quiz_id)
+    return len(board) if board else 0
+
+def get_leaderboard_page(quiz_id, page, per_page=LEADERBOARD_PAGE_SIZE):
+    """Returns (entries, total_entries) for one 1-based page of a leaderboard."""
+    board = _refresh_leaderboard(quiz_id)
+    if not board:
+        return [], 0
+    return board.page((page - 1) * per_page, per_page), len(board)
+
+def add_to_leaderboard(quiz_id, username, score, timestamp=None):
+    """Appends a new entry to a quiz's leaderboard and returns its timestamp."""
+    timestamp = timestamp or datetime.utcnow().isoformat()
+    get_backend().append_leaderboard_row(quiz_id, {
+        'username': username,
+        'score': score,
+        'timestamp': timestamp
+    })
+
+    # Fold the new row into this worker's sorted leaderboard right away.
+    _refresh_leaderboard(quiz_id)
+    return timestamp
+
+# --- Stored Submissions & Re-grading ---
+# Every submission's answers are kept, so a corrected answer key can be
+# applied to past attempts. A submission is matched to its leaderboard row by
+# (username, timestamp).
+
+def store_submission(quiz_id, quiz_data, username, timestamp, question_order, user_answers,
+                     timed_out=False, attempt_id=None):
+    """Keeps a submission's answers for later re-grading."""
+    record = {
+        'attempt_id': attempt_id or uuid.uuid4().hex,
+        'username': username,
+        'timestamp': timestamp,
+        'layout': get_layout_hash(quiz_id, quiz_data),
+        'question_order': list(question_order),
+        'answers': user_answers,
+    }
+    if timed_out:
+        record['timed_out'] = True
+    backend = get_backend()
+    backend.append_submission(quiz_id, record)
+    backend.add_item_stats(quiz_id, record['layout'], analytics.submission_counters(
+        get_grader(quiz_id, quiz_data), question_order, user_answers, timed_out))
+    metrics.inc('quiz_submissions_total', timed_out='true' if timed_out else 'false')
+
+def regrade_quiz(quiz_id):
+    """
+    Re-scores every stored submission of a quiz against its current answer
+    key and rewrites the leaderboard with the new scores. Submissions taken
+    against a different question layout (questions added, removed, reordered
+    or reworded since) and timed-out attempts keep their recorded score.
+    Returns a summary dict, or None if the quiz doesn't exist.
+    """
+    quiz = get_quiz_by_id(quiz_id)
+    if quiz is None:
+        return None
+    backend = get_backend()
+    grader = get_grader(quiz_id, quiz)
+    layout = get_layout_hash(quiz_id, quiz)
+    question_count = len(quiz.get('questions', []))
+
+    summary = {'submissions': 0, 'regraded': 0, 'skipped': 0, 'changed': 0}
+
+    def new_scores():
+        for record in backend.iter_submissions(quiz_id):
+            summary['submissions'] += 1
+            question_order = record.get('question_order', [])
+            if (record.get('timed_out') or record.get('layout') != layout
+                    or any(not 0 <= i < question_count for i in question_order)):
+                summary['skipped'] += 1
+                continue
+            summary['regraded'] += 1
+            yield record['username'], record['timestamp'], grader.grade(question_order, record.get('answers', {}))
+
+    # New scores go to a temporary on-disk table keyed like the leaderboard
+    # rows, so memory stays flat however many submissions the quiz has. (The
+    # two streams can't simply be zipped: concurrent submits may append them
+    # in different orders, and timed-out attempts have no stored answers.)
+    with closing(sqlite3.connect('')) as scratch:
+        scratch.execute('CREATE TABLE scores (username TEXT, timestamp TEXT, score, PRIMARY KEY (username, timestamp))')
+        scratch.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?)', new_scores())
+
+        def apply_new_score(row):
+            found = scratch.execute('SELECT score FROM scores WHERE username = ? AND timestamp = ?',
+                                    (row['username'], row['timestamp'])).fetchone()
+            if found is not None and found[0] != row['score']:
+                row['score'] = found[0]
+                summary['changed'] += 1
+            return row
+
+        if summary['regraded']:
+            backend.rewrite_leaderboard(quiz_id, apply_new_score)
+            _refresh_leaderboard(quiz_id)
+    if summary['submissions']:
+        # The per-question statistics were counted against the old answer key.
+        rebuild_item_stats(quiz_id)
+    logger.info("Re-graded %d of %d stored submission(s) for quiz %s; %d score(s) changed.",
+                summary['regraded'], summary['submissions'], quiz_id, summary['changed'])
+    return summary
+
+# --- Item Statistics ---
+# Per-question counters (see analytics.py) are added at every submission, so
+# the analytics report never has to re-grade stored answers. They are kept
+# for the quiz's current question layout only.
+
+def get_item_report(quiz_id):
+    """Returns the analytics report of a quiz (see analytics.item_report), or None."""
+    quiz = get_quiz_by_id(quiz_id)
+    if quiz is None:
+        return None
+    stored = get_backend().read_item_stats(quiz_id)
+    counters = stored[1] if stored and stored[0] == get_layout_hash(quiz_id, quiz) else {}
+    return analytics.item_report(quiz, counters)
+
+def rebuild_item_stats(quiz_id):
+    """
+    Recomputes a quiz's per-question counters from its stored submissions,
+    e.g. after a re-grade or for submissions made before the counters existed.
+    Submissions taken against another question layout are left out.
+    Returns the number of submissions counted, or None if the quiz doesn't exist.
+    """
+    quiz = get_quiz_by_id(quiz_id)
+    if quiz is None:
+        return None
+    backend = get_backend()
+    layout = get_layout_hash(quiz_id, quiz)
+    question_count = len(quiz.get('questions', []))
+    submissions = (
+        (record.get('question_order', []), record.get('answers', {}), bool(record.get('timed_out')))
+        for record in backend.iter_submissions(quiz_id)
+        if record.get('layout') == layout
+        and all(0 <= i < question_count for i in record.get('question_order', []))
+    )
+    counters = analytics.build_counters(get_grader(quiz_id, quiz), question_count, submissions)
+    backend.replace_item_stats(quiz_id, layout, counters)
+    counted = counters.get(analytics.QUIZ_KEY, [0])[0]
+    logger.info("Rebuilt item statistics for quiz %s from %d stored submission(s).", quiz_id, counted)
+    return counted
+
+# --- Expiring State ---
+# Attempts and answer reviews are short-lived records in the backend's
+# expiring store. Each namespace has a TTL and an optional size cap; every
+# worker sweeps expired (and, over the cap, oldest) records at most once per
+# STATE_SWEEP_INTERVAL_SECONDS, piggybacking on writes.
+
+_ATTEMPT_NAMESPACE = 'attempts'
+_REVIEW_NAMESPACE = 'reviews'
+_STATE_LIMITS = {   # namespace -> (ttl seconds, max bytes or None)
+    _ATTEMPT_NAMESPACE: (ATTEMPT_TTL_SECONDS, None),
+    _REVIEW_NAMESPACE: (REVIEW_TTL_SECONDS, REVIEW_STORE_MAX_BYTES),
+}
+_STATE_KEY_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+_last_sweep = {}   # namespace -> time.monotonic() of this worker's last sweep
+_sweep_lock = threading.Lock()
+
+def _put_state(namespace, key, data):
+    """Stores a record under its namespace's TTL and returns its expiry time."""
+    expires_at = time.time() + _STATE_LIMITS[namespace][0]
+    get_backend().put_expiring(namespace, key, data, expires_at)
+    _maybe_sweep(namespace)
+    return expires_at
+
+def _maybe_sweep(namespace):
+    """
+    Starts a background sweep of a namespace if this worker hasn't swept it
+    for STATE_SWEEP_INTERVAL_SECONDS. The sweep visits every shard, so it
+    runs on its own thread rather than inside the request that triggered it.
+    """
+    now = time.monotonic()
+    if now - _last_sweep.get(namespace, float('-inf')) < STATE_SWEEP_INTERVAL_SECONDS:
+        return
+    if not _sweep_lock.acquire(blocking=False):
+        return  # This worker is already sweeping
+    _last_sweep[namespace] = now
+    try:
+        threading.Thread(target=_sweep, args=(namespace,), name=f'sweep-{namespace}', daemon=True).start()
+    except BaseException:
+        _sweep_lock.release()
+        raise
+
+def _sweep(namespace):
+    try:
+        get_backend().sweep_expiring(namespace, _STATE_LIMITS[namespace][1])
+    except Exception:
+        logger.exception("Error sweeping expired %s", namespace)
+    finally:
+        _sweep_lock.release()
+
+def sweep_expired_state():
+    """Sweeps every namespace now. Returns {namespace: records removed}."""
+    backend = get_backend()
+    return {namespace: backend.sweep_expiring(namespace, max_bytes)
+            for namespace, (_, max_bytes) in _STATE_LIMITS.items()}
+
+# --- Quiz Attempts ---
+# An in-progress attempt (question order, start time, mode) is stored under a
+# short random id, so the session cookie only carries the id. Attempts never
+# change once created, so each worker also keeps recently used ones in memory.
+
+_ATTEMPT_CACHE_SIZE = 1024
+_attempt_cache = OrderedDict()   # attempt_id -> (expires_at, attempt)
+_attempt_cache_lock = threading.Lock()
+
+def _cache_attempt(attempt_id, expires_at, attempt):
+    with _attempt_cache_lock:
+        _attempt_cache[attempt_id] = (expires_at, attempt)
+        _attempt_cache.move_to_end(attempt_id)
+        while len(_attempt_cache) > _ATTEMPT_CACHE_SIZE:
+            _attempt_cache.popitem(last=False)
+
+def create_attempt(quiz_id, question_order, start_time, mode='real'):
+    """Stores a new attempt and returns its id."""
+    attempt_id = secrets.token_urlsafe(12)
+    attempt = {
+        'quiz_id': quiz_id,
+        'question_order': list(question_order),
+        'start_time': start_time,
+        'mode': mode,
+    }
+    expires_at = _put_state(_ATTEMPT_NAMESPACE, attempt_id, attempt)
+    _cache_attempt(attempt_id, expires_at, freeze(attempt))
+    return attempt_id
+
+def get_attempt(attempt_id):
+    """Returns a (read-only) attempt, or None if it is unknown or expired."""
+    if not attempt_id or not _STATE_KEY_RE.match(attempt_id):
+        return None
+    with _attempt_cache_lock:
+        cached = _attempt_cache.get(attempt_id)
+    if cached is not None and cached[0] > time.time():
+        return cached[1]
+
+    loaded = get_backend().get_expiring(_ATTEMPT_NAMESPACE, attempt_id)
+    if loaded is None:
+        return None
+    attempt, expires_at = loaded
+    attempt = freeze(attempt)
+    _cache_attempt(attempt_id, expires_at, attempt)
+    return attempt
+
+def end_attempt(attempt_id):
+    """Removes and returns an attempt, so that it can only be submitted once."""
+    if not attempt_id or not _STATE_KEY_RE.match(attempt_id):
+        return None
+    with _attempt_cache_lock:
+        _attempt_cache.pop(attempt_id, None)
+    return get_backend().pop_expiring(_ATTEMPT_NAMESPACE, attempt_id)
+
+# --- Temporary Session Data ---
 
 def save_temp_session_data(session_id, data):
-    """Saves temporary data (like review data) to a server-side file."""
-    if not os.path.exists(TEMP_SESSION_DIR):
-        os.makedirs(TEMP_SESSION_DIR)
-    
-    file_path = os.path.join(TEMP_SESSION_DIR, f"{session_id}.json")
-    with open(file_path, 'w') as f:
-        json.dump(data, f)
+    """Saves temporary data (like review data) on the server side for REVIEW_TTL_SECONDS."""
+    _put_state(_REVIEW_NAMESPACE, session_id, data)
 
 def load_temp_session_data(session_id):
-    """Loads and then deletes temporary session data from a file."""
-    file_path = os.path.join(TEMP_SESSION_DIR, f"{session_id}.json")
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        # Clean up the file after it's been read once to prevent reuse
-        os.remove(file_path)
-        return data
-    return None
+    """Loads and then deletes temporary session data, so it can only be used once."""
+    if not session_id or not _STATE_KEY_RE.match(session_id):
+        return None
+    return get_backend().pop_expiring(_REVIEW_NAMESPACE, session_id)
 
 def delete_quiz(quiz_id):
-    """Deletes a quiz JSON file and its associated leaderboard file."""
+    """Deletes a quiz, its leaderboard, stored submissions, item statistics and live event log."""
+    backend = get_backend()
     quiz_deleted = False
-    leaderboard_deleted = False
 
-    # 1. Delete the quiz file
-    quiz_file_path = os.path.join(QUIZ_DIR, f"{quiz_id}.json")
+    # 1. Delete the quiz itself
+    try:
+        quiz_deleted = backend.delete_quiz(quiz_id)
+    except OSError as e:
+        logger.error("Error deleting quiz file %s: %s", quiz_id, e)
+
+    if quiz_deleted:
+        invalidate_quiz_cache(quiz_id)
+        _unindex_quiz(quiz_id)
+
+    # 2. Delete the associated leaderboard
+    try:
+        backend.delete_leaderboard(quiz_id)
+    except OSError as e:
+        logger.error("Error deleting leaderboard file for quiz %s: %s", quiz_id, e)
+    with _leaderboard_lock:
+        _leaderboards.pop(quiz_id, None)
+
+    # 3. Delete the stored submissions
     try:
-        if os.path.exists(quiz_file_path):
-            os.remove(quiz_file_path)
-            quiz_deleted = True
+        backend.delete_submissions(quiz_id)
     except OSError as e:
-        print(f"Error deleting quiz file {quiz_id}: {e}")
+        logger.error("Error deleting stored submissions for quiz %s: %s", quiz_id, e)
 
-    # 2. Delete the associated leaderboard file
-    # --- FIX: The filename must match the one used by get_leaderboard and add_to_leaderboard ---
-    leaderboard_file_path = os.path.join(LEADERBOARD_DIR, f"{quiz_id}.csv")
+    # 4. Delete the per-question statistics
     try:
-        if os.path.exists(leaderboard_file_path):
-            os.remove(leaderboard_file_path)
+        backend.delete_item_stats(quiz_id)
     except OSError as e:
-        print(f"Error deleting leaderboard file for quiz {quiz_id}: {e}")
+        logger.error("Error deleting item statistics for quiz %s: %s", quiz_id, e)
 
-    # Return True only if the main quiz file was successfully deleted
-    return quiz_deleted
\ No newline at end of file
+    # 5. Delete the live monitor's event log
+    try:
+        live_monitor.delete_session(quiz_id)
+    except OSError as e:
+        logger.error("Error deleting the live event log for quiz %s: %s", quiz_id, e)
+
+    # Return True only if the main quiz was successfully deleted
+    return quiz_deleted
+
+# --- Metrics ---
+
+def get_storage_metrics():
+    """
+    Returns (name, labels, value) gauges describing stored data: the number
+    of quizzes, each quiz's leaderboard size and the unexpired attempts and
+    reviews. These are the same for every worker, so they are measured once
+    per scrape rather than merged.
+    """
+    refresh_quiz_index()
+    with _index_lock:
+        quiz_ids = list(_quiz_index)
+    values = [('quiz_count', {}, len(quiz_ids))]
+    values.extend(('quiz_leaderboard_entries', {'quiz_id': quiz_id}, get_leaderboard_size(quiz_id))
+                  for quiz_id in quiz_ids)
+    backend = get_backend()
+    values.extend(('quiz_state_records', {'namespace': namespace}, backend.count_expiring(namespace))
+                  for namespace in _STATE_LIMITS)
+    return values
@@ -0,0 +1,161 @@
+# grading.py
+
+"""
+Compiled answer keys for scoring quiz submissions.
+
+QuizGrader normalises a quiz's answer keys once (lower-cased strings for
+typed/single answers, frozensets for multiple-select, flattened multipart
+parts), so scoring a submission is a tight loop of comparisons. data_manager
+caches one grader per quiz version.
+
+The rules are exactly the ones submit_quiz has always applied:
+- multiple-select: the set of chosen options must equal the answer set;
+- everything else: str(answer).strip().lower() must equal the lower-cased key;
+- multipart: each part is scored on its own by the rules above;
+- a question or part without a 'score' is worth 1 point.
+"""
+
+import hashlib
+import json
+
+_SELECT = 0
+_TEXT = 1
+_MULTIPART = 2
+
+
+def _compile_answer(item):
+    """Returns (kind, key, score) for a non-multipart question or part."""
+    score = item.get('score', 1)
+    answer = item.get('answer')
+    if item.get('type') == 'multiple-select':
+        try:
+            key = frozenset(answer) if answer is not None else None
+        except TypeError:
+            key = None
+        return (_SELECT, key, score)
+    return (_TEXT, str(answer).lower() if answer is not None else None, score)
+
+
+def _compile_question(question):
+    if question.get('type') == 'multipart':
+        parts = tuple(_compile_answer(part) for part in question.get('parts', []))
+        return (_MULTIPART, parts, 0)
+    return _compile_answer(question)
+
+
+def _score_answer(kind, key, score, user_answer):
+    if key is None:
+        return 0
+    if kind == _SELECT:
+        try:
+            return score if frozenset(user_answer) == key else 0
+        except TypeError:
+            return 0
+    return score if str(user_answer).strip().lower() == key else 0
+
+
+def _part_answer(user_answer, part_idx):
+    """The answer to one part of a multipart question, or None."""
+    try:
+        return user_answer[part_idx] if len(user_answer) > part_idx else None
+    except (TypeError, KeyError):
+        return None
+
+
+class QuizGrader:
+    """Scores submissions against one version of a quiz's answer key."""
+
+    def __init__(self, quiz):
+        self._questions = tuple(_compile_question(q) for q in quiz.get('questions', []))
+
+    def score_question(self, question_index, user_answer):
+        """Points earned for one question (0 for an unanswered one)."""
+        if user_answer is None:
+            return 0
+        kind, key, score = self._questions[question_index]
+        if kind != _MULTIPART:
+            return _score_answer(kind, key, score, user_answer)
+        # Accumulated directly: this is on the submit path, so it doesn't build
+        # score_parts' per-part detail.
+        earned = 0
+        for part_idx, (part_kind, part_key, part_score) in enumerate(key):
+            user_part_answer = _part_answer(user_answer, part_idx)
+            if user_part_answer is not None:
+                earned += _score_answer(part_kind, part_key, part_score, user_part_answer)
+        return earned
+
+    def score_parts(self, question_index, user_answer):
+        """[(points earned, points available)] for each part of a multipart question."""
+        _, parts, _ = self._questions[question_index]
+        scored = []
+        for part_idx, (part_kind, part_key, part_score) in enumerate(parts):
+            user_part_answer = _part_answer(user_answer, part_idx)
+            earned = 0
+            if user_part_answer is not None:
+                earned = _score_answer(part_kind, part_key, part_score, user_part_answer)
+            scored.append((earned, part_score))
+        return scored
+
+    def check(self, question_index, user_answer):
+        """
+        Whether an answer matches the key, whatever the question is worth: a
+        bool, or a list of bools (one per part) for a multipart question.
+        """
+        kind, key, _ = self._questions[question_index]
+        if kind != _MULTIPART:
+            return user_answer is not None and _score_answer(kind, key, 1, user_answer) == 1
+        matches = []
+        for part_idx, (part_kind, part_key, _) in enumerate(key):
+            user_part_answer = _part_answer(user_answer, part_idx)
+            matches.append(user_part_answer is not None
+                           and _score_answer(part_kind, part_key, 1, user_part_answer) == 1)
+        return matches
+
+    def is_multipart(self, question_index):
+        return self._questions[question_index][0] == _MULTIPART
+
+    def max_points(self, question_index):
+        """Points available for one question (all parts of a multipart one)."""
+        kind, key, score = self._questions[question_index]
+        if kind != _MULTIPART:
+            return score
+        return sum(part_score for _, _, part_score in key)
+
+    def grade(self, question_order, user_answers):
+        """
+        Scores one submission. user_answers maps the *position* in
+        question_order (as a string, the way the quiz page posts it) to the
+        student's answer.
+        """
+        questions = self._questions
+        score = 0
+        for position, question_index in enumerate(question_order):
+            user_answer = user_answers.get(str(position))
+            if user_answer is None:
+                continue
+            kind, key, points = questions[question_index]
+            # The common single-answer case is inlined; everything else goes
+            # through score_question.
+            if kind == _TEXT:
+                if key is not None and str(user_answer).strip().lower() == key:
+                    score += points
+            else:
+                score += self.score_question(question_index, user_answer)
+        return score
+
+
+def question_layout_hash(quiz):
+    """
+    Fingerprints everything about a quiz's questions except the answer keys
+    and scores (order, types, texts, options, parts). A stored submission can
+    only be re-graded against a quiz with the same layout hash, since its
+    question_order indexes into the question list it was taken against.
+    """
+    hasher = hashlib.sha1()
+    for question in quiz.get('questions', []):
+        shape = {k: v for k, v in question.items() if k not in ('answer', 'score', 'parts')}
+        shape['parts'] = [{k: v for k, v in part.items() if k not in ('answer', 'score')}
+                          for part in question.get('parts', [])]
+        hasher.update(json.dumps(shape, sort_keys=True).encode('utf-8'))
+        hasher.update(b'\n')
+    return hasher.hexdigest()
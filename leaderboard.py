@@ -0,0 +1,41 @@
+# leaderboard.py
+
+from bisect import bisect_right
+
+from readonly import freeze
+
+
+class Leaderboard:
+    """
+    One quiz's leaderboard, kept sorted by score (highest first) as rows are
+    appended. Rows with equal scores stay in submission order, matching the
+    stable sort the leaderboard page has always used.
+
+    `cursor` is the storage backend's opaque record of how much of the stored
+    leaderboard has been applied, so later refreshes only read new rows.
+    """
+
+    def __init__(self):
+        self.cursor = None
+        self._keys = []
+        self._rows = []
+        self._seq = 0
+
+    def add(self, row):
+        """Inserts a row (its 'score' must already be an int) at its ranked position."""
+        key = (-row['score'], self._seq)
+        self._seq += 1
+        position = bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._rows.insert(position, freeze(row))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def rows(self):
+        """Returns every row, best score first."""
+        return list(self._rows)
+
+    def page(self, offset, limit):
+        """Returns `limit` rows starting at rank `offset` (0-based)."""
+        return self._rows[offset:offset + limit]
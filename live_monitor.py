@@ -0,0 +1,310 @@
+# live_monitor.py
+
+"""
+Live exam monitoring: who has joined a quiz, who has submitted and how the
+scores are spread, pushed to admins as server-sent events.
+
+Joins and submissions are appended as JSON lines to a per-quiz event log,
+LIVE_DIR/<quiz_id>.jsonl, which is the broadcast channel between gunicorn
+workers. Each worker keeps one aggregator per watched quiz that tails the
+log and folds new events into a running summary, so any number of watchers
+share one small file read per LIVE_POLL_SECONDS instead of each re-reading
+the leaderboard. Watchers in the worker that recorded an event are woken
+immediately.
+
+A stream holds a worker thread while it is open, so streams are only served
+by threaded or gevent workers (run.sh uses gthread); on sync workers the
+monitor page polls the snapshot instead. Streams end after
+LIVE_STREAM_SECONDS and the browser reconnects.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from config import LIVE_DIR, LIVE_HEARTBEAT_SECONDS, LIVE_MAX_STREAMS, LIVE_POLL_SECONDS, LIVE_STREAM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+RECENT_EVENTS = 20          # Events listed in the activity feed.
+RATE_WINDOW_MINUTES = 10    # Minutes covered by the submissions-per-minute chart.
+_NAME_LIMIT = 80            # Keeps every event line well below PIPE_BUF, so appends stay atomic.
+
+
+def _log_path(quiz_id):
+    return os.path.join(LIVE_DIR, f'{quiz_id}.jsonl')
+
+
+def _append_event(quiz_id, event):
+    line = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+    try:
+        os.makedirs(LIVE_DIR, exist_ok=True)
+        # One write() on an O_APPEND descriptor, so lines from different
+        # workers never interleave.
+        fd = os.open(_log_path(quiz_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError:
+        logger.exception("Could not record a live event for quiz %s", quiz_id)
+        return
+    aggregator = _aggregators.get(quiz_id)
+    if aggregator is not None:
+        aggregator.refresh(notify=True)
+
+
+# --- Recording ---
+
+def record_join(quiz_id, name, restart=False):
+    """Records a student starting (or restarting) a real attempt."""
+    _append_event(quiz_id, {'type': 'join', 'name': name[:_NAME_LIMIT], 'restart': restart,
+                            'ts': datetime.utcnow().isoformat(timespec='seconds')})
+
+
+def record_submission(quiz_id, name, score, timed_out=False):
+    """Records a graded submission."""
+    _append_event(quiz_id, {'type': 'submit', 'name': name[:_NAME_LIMIT], 'score': score,
+                            'timed_out': timed_out, 'ts': datetime.utcnow().isoformat(timespec='seconds')})
+
+
+def reset_session(quiz_id):
+    """Starts a new live session for a quiz, discarding the events of the previous one."""
+    os.makedirs(LIVE_DIR, exist_ok=True)
+    tmp_path = _log_path(quiz_id) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps({'type': 'session', 'ts': datetime.utcnow().isoformat(timespec='seconds')}) + '\n')
+    # A new file (and inode) tells every worker's aggregator to start over.
+    os.replace(tmp_path, _log_path(quiz_id))
+    aggregator = _aggregators.get(quiz_id)
+    if aggregator is not None:
+        aggregator.refresh(notify=True)
+
+
+def delete_session(quiz_id):
+    """Removes a quiz's event log and this worker's aggregator (when the quiz is deleted)."""
+    try:
+        os.remove(_log_path(quiz_id))
+    except FileNotFoundError:
+        pass
+    with _aggregators_lock:
+        _aggregators.pop(quiz_id, None)
+
+
+# --- Aggregation ---
+
+class _Aggregator:
+    """One worker's running summary of a quiz's event log."""
+
+    def __init__(self, quiz_id):
+        self.quiz_id = quiz_id
+        self.condition = threading.Condition()
+        self.version = 0
+        self.checked_at = float('-inf')
+        self._reset_state()
+
+    def _reset_state(self):
+        self.inode = None
+        self.offset = 0
+        self.partial = b''
+        self.session_started = None
+        self.joined = 0
+        self.restarts = 0
+        self.submitted = 0
+        self.timed_out = 0
+        self.scores = {}   # score -> number of submissions
+        self.minutes = {}  # 'YYYY-MM-DDTHH:MM' -> submissions in that minute
+        self.recent = deque(maxlen=RECENT_EVENTS)
+        self.last_event = None
+        self._payload = None
+
+    def _apply(self, event):
+        kind = event.get('type')
+        if kind == 'session':
+            self.session_started = event['ts']
+            return
+        if self.session_started is None:
+            self.session_started = event['ts']
+        if kind == 'join':
+            if event.get('restart'):
+                self.restarts += 1
+            else:
+                self.joined += 1
+        elif kind == 'submit':
+            self.submitted += 1
+            if event.get('timed_out'):
+                self.timed_out += 1
+            self.scores[event['score']] = self.scores.get(event['score'], 0) + 1
+            minute = event['ts'][:16]
+            self.minutes[minute] = self.minutes.get(minute, 0) + 1
+        else:
+            return
+        self.last_event = event['ts']
+        self.recent.appendleft(event)
+
+    def refresh(self, notify=False):
+        """Folds in events appended since the last read. Returns True if anything changed."""
+        with self.condition:
+            self.checked_at = time.monotonic()
+            try:
+                stat = os.stat(_log_path(self.quiz_id))
+            except FileNotFoundError:
+                stat = None
+            changed = False
+            if stat is None or stat.st_ino != self.inode or stat.st_size < self.offset:
+                # Session reset, log deleted, or first read.
+                changed = self.offset > 0 or self.inode is not None
+                self._reset_state()
+                if stat is not None:
+                    self.inode = stat.st_ino
+            if stat is not None and stat.st_size > self.offset:
+                try:
+                    with open(_log_path(self.quiz_id), 'rb') as f:
+                        f.seek(self.offset)
+                        chunk = f.read(stat.st_size - self.offset)
+                except FileNotFoundError:
+                    chunk = b''  # Reset or deleted since the stat; noticed on the next refresh.
+                self.offset += len(chunk)
+                lines = (self.partial + chunk).split(b'\n')
+                self.partial = lines.pop()  # An incomplete last line is finished next time.
+                for line in lines:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning("Skipping a malformed live event for quiz %s", self.quiz_id)
+                changed = changed or bool(lines)
+            if changed:
+                self.version += 1
+                self._payload = None
+                if notify:
+                    self.condition.notify_all()
+            return changed
+
+    def payload(self):
+        """
+        The current summary as JSON, serialised once per version (and minute,
+        for the rate chart) however many watchers read it.
+        """
+        minute = int(time.time() // 60)
+        with self.condition:
+            if self._payload is None or self._payload[0] != minute:
+                self._payload = (minute, json.dumps(self._summary(), separators=(',', ':')))
+            return self._payload[1]
+
+    def _median(self):
+        # The middle score(s), read off the histogram.
+        middle, seen = [], 0
+        for score, count in sorted(self.scores.items()):
+            middle.extend(score for position in ((self.submitted - 1) // 2, self.submitted // 2)
+                          if seen <= position < seen + count)
+            seen += count
+        return sum(middle) / 2
+
+    def _summary(self):
+        total = sum(score * count for score, count in self.scores.items())
+        now = datetime.utcnow()
+        minutes = [(now - timedelta(minutes=back)).strftime('%Y-%m-%dT%H:%M')
+                   for back in range(RATE_WINDOW_MINUTES - 1, -1, -1)]
+        return {
+            'quiz_id': self.quiz_id,
+            'version': self.version,
+            'session_started': self.session_started,
+            'last_event': self.last_event,
+            'joined': self.joined,
+            'restarts': self.restarts,
+            'submitted': self.submitted,
+            'in_progress': max(0, self.joined - self.submitted),
+            'timed_out': self.timed_out,
+            'mean_score': round(total / self.submitted, 2) if self.submitted else None,
+            'median_score': self._median() if self.submitted else None,
+            'scores': sorted(self.scores.items()),
+            'per_minute': [[minute, self.minutes.get(minute, 0)] for minute in minutes],
+            'recent': list(self.recent),
+        }
+
+    def wait_for_change(self, seen_version, timeout):
+        """
+        Blocks until the summary moves past seen_version or `timeout` seconds
+        pass. Whichever waiting thread finds the log unchecked for
+        LIVE_POLL_SECONDS re-reads it for all of them.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.version == seen_version:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if now - self.checked_at >= LIVE_POLL_SECONDS:
+                    self.refresh(notify=True)
+                    continue
+                self.condition.wait(min(deadline, self.checked_at + LIVE_POLL_SECONDS) - now)
+            return self.version
+
+
+_aggregators = {}   # quiz_id -> _Aggregator
+_aggregators_lock = threading.Lock()
+_streams = threading.BoundedSemaphore(LIVE_MAX_STREAMS)
+
+
+def get_aggregator(quiz_id):
+    """Returns this worker's aggregator for a quiz, reading the log up to date."""
+    with _aggregators_lock:
+        aggregator = _aggregators.get(quiz_id)
+        if aggregator is None:
+            aggregator = _aggregators[quiz_id] = _Aggregator(quiz_id)
+    if time.monotonic() - aggregator.checked_at >= LIVE_POLL_SECONDS:
+        aggregator.refresh(notify=True)
+    return aggregator
+
+
+def snapshot(quiz_id):
+    """Returns the current summary of a quiz's live session, as JSON text."""
+    return get_aggregator(quiz_id).payload()
+
+
+class _Stream:
+    """
+    The server-sent events of one watcher: a snapshot now and after every
+    change, with heartbeat comments in between. The WSGI server calls
+    close() when the response ends, which frees the stream's slot even if
+    the client went away before the first event.
+    """
+
+    def __init__(self, aggregator):
+        self.aggregator = aggregator
+        self._closed = False
+
+    def __iter__(self):
+        aggregator = self.aggregator
+        # Reconnect quickly once the stream ends at LIVE_STREAM_SECONDS.
+        yield 'retry: 2000\n\n'
+        deadline = time.monotonic() + LIVE_STREAM_SECONDS
+        version = None
+        while True:
+            if version != aggregator.version:
+                version = aggregator.version
+                yield f'event: snapshot\nid: {version}\ndata: {aggregator.payload()}\n\n'
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if aggregator.wait_for_change(version, min(remaining, LIVE_HEARTBEAT_SECONDS)) == version:
+                yield ': heartbeat\n\n'
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            _streams.release()
+
+
+def open_stream(quiz_id):
+    """
+    Returns an iterable of server-sent events for a quiz's live session, or
+    None if this worker already serves LIVE_MAX_STREAMS streams.
+    """
+    if not _streams.acquire(blocking=False):
+        return None
+    return _Stream(get_aggregator(quiz_id))
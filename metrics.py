@@ -0,0 +1,208 @@
+# metrics.py
+
+"""
+Request timings and internal counters, exported in Prometheus text format.
+
+Every worker process counts in memory and writes a snapshot of its numbers
+to METRICS_DIR/<pid>.json at most every METRICS_FLUSH_SECONDS (and whenever
+it serves a scrape). /admin/metrics merges the snapshots of all live
+workers, so the totals cover the whole gunicorn pool.
+
+Metric families are declared in METRICS; modules record into them with
+inc() and observe(), and register_collector() adds per-worker values that
+are read when a snapshot is taken (e.g. cache sizes).
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from config import METRICS_DIR, METRICS_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (Prometheus type, help text)
+METRICS = {
+    'quiz_http_requests_total': ('counter', 'HTTP requests served, by endpoint, method and status.'),
+    'quiz_http_request_duration_seconds': ('histogram', 'Time to produce a response, by endpoint.'),
+    'quiz_storage_reads_total': ('counter', 'Quizzes read and parsed from storage (quiz cache misses that hit storage).'),
+    'quiz_storage_read_bytes_total': ('counter', 'Bytes of quiz JSON parsed from storage.'),
+    'quiz_cache_hits_total': ('counter', 'Parsed-quiz cache hits.'),
+    'quiz_cache_misses_total': ('counter', 'Parsed-quiz cache misses.'),
+    'quiz_cache_evictions_total': ('counter', 'Parsed-quiz cache evictions.'),
+    'quiz_cache_entries': ('gauge', 'Quizzes held in the parsed-quiz caches (summed over workers).'),
+    'quiz_cache_bytes': ('gauge', 'Bytes of quiz JSON held in the parsed-quiz caches (summed over workers).'),
+    'quiz_submissions_total': ('counter', 'Quiz submissions graded.'),
+    'quiz_workers': ('gauge', 'Worker processes whose metrics are included.'),
+    'quiz_count': ('gauge', 'Stored quizzes.'),
+    'quiz_leaderboard_entries': ('gauge', 'Leaderboard entries per quiz.'),
+    'quiz_state_records': ('gauge', 'Unexpired stored records per namespace (attempts, reviews).'),
+}
+
+_lock = threading.Lock()
+_counters = {}     # (name, labels) -> value
+_histograms = {}   # (name, labels) -> [bucket counts..., +Inf count, sum]
+_collectors = []
+_last_flush = 0.0
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Adds `value` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Records one observation in a latency histogram."""
+    key = _key(name, labels)
+    with _lock:
+        buckets = _histograms.get(key)
+        if buckets is None:
+            buckets = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        buckets[-1] += seconds
+
+
+def register_collector(collector):
+    """collector() -> iterable of (name, labels dict, value), read at every snapshot."""
+    _collectors.append(collector)
+
+
+def _snapshot():
+    with _lock:
+        snapshot = {
+            'pid': os.getpid(),
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(buckets)] for (name, labels), buckets in _histograms.items()],
+        }
+    snapshot['collected'] = []
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                snapshot['collected'].append([name, list(_key(name, labels)[1]), value])
+        except Exception:
+            logger.exception("Metrics collector %r failed", collector)
+    return snapshot
+
+
+def flush(force=False):
+    """Writes this worker's snapshot, at most every METRICS_FLUSH_SECONDS unless forced."""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < METRICS_FLUSH_SECONDS:
+        return
+    _last_flush = now
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix='.tmp-', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_snapshot(), f, separators=(',', ':'))
+        os.replace(tmp_path, os.path.join(METRICS_DIR, f'{os.getpid()}.json'))
+    except OSError:
+        logger.exception("Could not write the metrics snapshot")
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # os.kill(pid, 0) would terminate the process on Windows, and Waitress
+        # runs a single process anyway.
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshots():
+    """Yields the snapshots of live workers, deleting those of workers that exited."""
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith('.') or not name.endswith('.json'):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            pid = int(name[:-len('.json')])
+        except ValueError:
+            continue
+        if not _process_alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                yield json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render(global_values=()):
+    """
+    Returns every worker's merged metrics, plus `global_values` ((name, labels
+    dict, value) measured once, e.g. leaderboard sizes), in Prometheus text format.
+    """
+    flush(force=True)
+    samples = {}      # (name, labels) -> value
+    histograms = {}   # (name, labels) -> buckets
+    workers = 0
+    for snapshot in _read_snapshots():
+        workers += 1
+        for name, labels, value in snapshot['counters'] + snapshot['collected']:
+            key = (name, tuple(map(tuple, labels)))
+            samples[key] = samples.get(key, 0) + value
+        for name, labels, buckets in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(buckets))
+            for i, value in enumerate(buckets):
+                merged[i] += value
+    samples[('quiz_workers', ())] = workers
+    for name, labels, value in global_values:
+        samples[_key(name, labels)] = value
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        family = sorted((labels, value) for (n, labels), value in samples.items() if n == name)
+        family_histograms = sorted((labels, b) for (n, labels), b in histograms.items() if n == name)
+        if not family and not family_histograms:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in family:
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+        for labels, buckets in family_histograms:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {buckets[-1]:.6f}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
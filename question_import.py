@@ -0,0 +1,196 @@
+# question_import.py
+
+"""
+Streaming import of question banks.
+
+QuestionImporter reads questions one at a time from a text stream, so a
+large upload is never parsed as a single document. Three layouts are
+accepted:
+
+- a quiz object:  {"name": ..., "questions": [{...}, {...}]}
+- a JSON array:   [{...}, {...}]
+- JSON Lines:     one question object per line
+
+Every question is checked with validation.validate_question as it arrives.
+Invalid questions are skipped and reported with the line they start on;
+malformed JSON stops the import with a QuestionImportError.
+"""
+
+import json
+
+from selection import QUESTION_TYPES
+from validation import validate_question
+
+_WHITESPACE = ' \t\r\n'
+_CHUNK_SIZE = 64 * 1024
+# A single question (images included) larger than this is treated as malformed
+# input rather than buffered indefinitely.
+MAX_QUESTION_CHARS = 32 * 1024 * 1024
+# Only this many validation errors are kept for reporting.
+MAX_REPORTED_ERRORS = 50
+
+
+class QuestionImportError(ValueError):
+    """The upload is not valid JSON (or JSON Lines); `line` is 1-based."""
+
+    def __init__(self, line, message):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+
+class _JSONReader:
+    """A sliding buffer over a text stream that decodes one JSON value at a time."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buf = ''
+        self.pos = 0
+        self.line_base = 1   # Line number of buf[0]
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        data = self.stream.read(_CHUNK_SIZE)
+        if not data:
+            self.eof = True
+            return False
+        # Drop what has been consumed so memory stays bounded.
+        self.line_base += self.buf.count('\n', 0, self.pos)
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def line(self, pos=None):
+        return self.line_base + self.buf.count('\n', 0, self.pos if pos is None else pos)
+
+    def peek(self):
+        """Returns the next non-whitespace character ('' at the end of the input)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char == '' or char not in chars:
+            found = repr(char) if char else 'the end of the file'
+            raise QuestionImportError(self.line(), f"Expected {' or '.join(repr(c) for c in chars)} but found {found}.")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decodes the next JSON value, reading more input until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number running up to the end of the buffer may continue in the next chunk.
+                if end < len(self.buf) or self.eof or not isinstance(value, (int, float)):
+                    self.pos = end
+                    return value
+                self._fill()
+            except json.JSONDecodeError as e:
+                if len(self.buf) - self.pos < MAX_QUESTION_CHARS and self._fill():
+                    continue
+                raise QuestionImportError(self.line(e.pos), e.msg) from None
+
+
+class QuestionImporter:
+    """
+    Iterating yields the valid questions in file order. Afterwards:
+      - metadata: the quiz object's other top-level keys (e.g. 'name', 'timer');
+      - errors: up to MAX_REPORTED_ERRORS "Line N: Question #k ..." messages;
+      - error_count / imported_count: totals.
+    Question numbers start at `first_number`, so an append can number
+    questions after the ones already in the quiz.
+    """
+
+    def __init__(self, stream, first_number=1):
+        self.reader = _JSONReader(stream)
+        self.next_number = first_number
+        self.metadata = {}
+        self.errors = []
+        self.error_count = 0
+        self.imported_count = 0
+
+    def __iter__(self):
+        reader = self.reader
+        first = reader.peek()
+        if first == '[':
+            reader.pos += 1
+            yield from self._array()
+        elif first == '{':
+            yield from self._object_or_lines()
+        else:
+            reader.expect('[{')
+        if reader.peek() != '':
+            raise QuestionImportError(reader.line(), "Unexpected data after the end of the questions.")
+
+    def _array(self):
+        reader = self.reader
+        if reader.peek() == ']':
+            reader.pos += 1
+            return
+        while True:
+            yield from self._check(reader.line(), reader.value())
+            if reader.expect(',]') == ']':
+                return
+
+    def _object_or_lines(self):
+        # Reads the first object key by key. A 'questions' key means it is a
+        # whole quiz whose questions are streamed; otherwise the object is
+        # the first line of a JSON Lines file.
+        reader = self.reader
+        start_line = reader.line()
+        reader.pos += 1
+        fields = {}
+        has_questions = False
+        if reader.peek() == '}':
+            reader.pos += 1
+        else:
+            while True:
+                if reader.peek() != '"':
+                    reader.expect('"')
+                key = reader.value()
+                reader.expect(':')
+                if key == 'questions':
+                    has_questions = True
+                    reader.expect('[')
+                    yield from self._array()
+                else:
+                    fields[key] = reader.value()
+                if reader.expect(',}') == '}':
+                    break
+
+        if has_questions:
+            self.metadata = fields
+            return
+        yield from self._check(start_line, fields)
+        while reader.peek() != '':
+            yield from self._check(reader.line(), reader.value())
+
+    def _check(self, line, question):
+        number = self.next_number
+        self.next_number += 1
+        if not isinstance(question, dict):
+            error = f"Question #{number} is not a JSON object."
+        elif question.get('type') not in QUESTION_TYPES:
+            error = f"Question #{number} has an unknown type {question.get('type')!r}."
+        elif not isinstance(question.get('text', ''), str):
+            error = f"Question #{number} has a non-text 'text' field."
+        elif question['type'] == 'multipart' and not all(
+                isinstance(part, dict) and isinstance(part.get('text', ''), str)
+                for part in (question.get('parts') if isinstance(question.get('parts'), list) else [None])):
+            error = f"Question #{number} ('multipart') must have a list of sub-question objects."
+        else:
+            error = validate_question(question, number)
+        if error:
+            self.error_count += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append(f"Line {line}: {error}")
+            return
+        self.imported_count += 1
+        yield question
@@ -0,0 +1,50 @@
+# readonly.py
+
+"""
+Read-only dict/list wrappers for data that is shared between requests.
+
+Cached quizzes are handed to every request in a worker, so a route that
+mutates one would silently corrupt it for everybody else. These types are
+real dict/list subclasses (so Jinja, jsonify and random.sample keep working)
+that refuse in-place changes. Use thaw() to get a private, mutable copy.
+"""
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("Cached quiz data is read-only. Use get_quiz_for_update() to get an editable copy.")
+
+
+class FrozenDict(dict):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+class FrozenList(list):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+def freeze(value):
+    """Recursively converts dicts and lists into their read-only counterparts."""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Recursively converts (possibly read-only) dicts and lists into plain, mutable ones."""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
@@ -1,4 +1,4 @@
 #!/bin/sh
 # The quotes and the () at the end are crucial.
 source /venv/bin/activate
-gunicorn --workers 4 --bind 0.0.0.0:8000 'app:create_app()' --access-logfile ./logs/gunicorn-access.log --error-logfile ./logs/gunicorn-error.log --capture-output --log-level debug --timeout 120
\ No newline at end of file
+gunicorn --workers 4 --worker-class gthread --threads 8 --bind 0.0.0.0:8000 'app:create_app()' --access-logfile ./logs/gunicorn-access.log --error-logfile ./logs/gunicorn-error.log --capture-output --log-level info --timeout 120
\ No newline at end of file
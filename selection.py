@@ -0,0 +1,137 @@
+# selection.py
+
+"""
+Question selection for quiz attempts and practice sessions.
+
+build_selection_index() does the one linear pass over a quiz's questions;
+data_manager caches its result next to the parsed quiz, so choosing the
+questions for each student only samples from precomputed index arrays.
+
+Practice rounds deal from per-student "decks": a deck walks a type's bucket
+in a random order, so successive rounds show fresh questions until the whole
+bucket has been seen. A deck is just [offset, stride, dealt, size] and fits
+in the session cookie.
+"""
+
+import math
+import random
+
+QUESTION_TYPES = ['multiple-choice', 'short-answer', 'multiple-select', 'multipart']
+
+
+def question_score(question):
+    """Total score of a question (multipart questions sum their parts)."""
+    if question['type'] == 'multipart':
+        return sum(p.get('score', 0) for p in question.get('parts', []))
+    return question.get('score', 0)
+
+
+def build_selection_index(quiz):
+    """
+    Returns {'by_type': {type: (question indices...)}, 'counts': {type: n},
+    'scores': (score per question...), 'scored': (indices with score > 0...)}.
+    """
+    by_type = {}
+    scores = []
+    for i, question in enumerate(quiz.get('questions', [])):
+        by_type.setdefault(question['type'], []).append(i)
+        scores.append(question_score(question))
+    return {
+        'by_type': {q_type: tuple(indices) for q_type, indices in by_type.items()},
+        'counts': {q_type: len(indices) for q_type, indices in by_type.items()},
+        'scores': tuple(scores),
+        'scored': tuple(i for i, score in enumerate(scores) if score > 0),
+    }
+
+
+def select_by_total_score(index, target_score):
+    """
+    Picks random scored questions until their total reaches target_score.
+    This is a partial Fisher-Yates shuffle, so it only does as many random
+    draws as questions it ends up picking.
+    """
+    pool = list(index['scored'])
+    scores = index['scores']
+    selected = []
+    current_score = 0
+    for i in range(len(pool)):
+        if current_score >= target_score:
+            break
+        j = random.randrange(i, len(pool))
+        pool[i], pool[j] = pool[j], pool[i]
+        selected.append(pool[i])
+        current_score += scores[pool[i]]
+    return selected
+
+
+def select_by_type_counts(index, counts):
+    """Picks up to counts[type] random questions of each type."""
+    selected = []
+    for q_type, count in counts.items():
+        available = index['by_type'].get(q_type)
+        if count > 0 and available:
+            selected.extend(random.sample(available, min(count, len(available))))
+    return selected
+
+
+def select_for_attempt(index, display_config):
+    """Returns the shuffled question indices for a real quiz attempt."""
+    mode = display_config.get('mode', 'question_count')
+    if mode == 'total_score':
+        selected = select_by_total_score(index, display_config.get('target_score', 10))
+    else:  # 'question_count' mode
+        selected = select_by_type_counts(index, display_config.get('parameters', {}))
+    random.shuffle(selected)
+    return selected
+
+
+def new_deck(size):
+    """
+    Starts a walk over range(size) that visits every position once: position
+    k is (offset + k * stride) % size, with stride coprime to size.
+    """
+    stride = 1
+    if size > 2:
+        stride = random.randrange(1, size)
+        while math.gcd(stride, size) != 1:
+            stride = random.randrange(1, size)
+    return [random.randrange(size) if size else 0, stride, 0, size]
+
+
+def deal_from_deck(deck, bucket, count):
+    """
+    Returns `count` distinct entries of `bucket` (count <= len(bucket)) and
+    the deck to store for the next round. A deck built for a different
+    bucket size, or one that runs out, is replaced by a fresh shuffle.
+    """
+    size = len(bucket)
+    if not deck or deck[3] != size:
+        deck = new_deck(size)
+    offset, stride, dealt, _ = deck
+    picked = []
+    seen = set()
+    while len(picked) < count:
+        if dealt >= size:
+            offset, stride, dealt, _ = new_deck(size)
+        position = (offset + dealt * stride) % size
+        dealt += 1
+        # After a reshuffle, skip anything already dealt in this round.
+        if position not in seen:
+            seen.add(position)
+            picked.append(bucket[position])
+    return picked, [offset, stride, dealt, size]
+
+
+def deal_practice_round(index, counts, decks):
+    """
+    Deals counts[type] questions of each type from the student's decks
+    ({type: deck}, updated in place) and returns them shuffled.
+    """
+    selected = []
+    for q_type, count in counts.items():
+        bucket = index['by_type'].get(q_type, ())
+        if count > 0 and bucket:
+            picked, decks[q_type] = deal_from_deck(decks.get(q_type), bucket, count)
+            selected.extend(picked)
+    random.shuffle(selected)
+    return selected
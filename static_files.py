@@ -0,0 +1,118 @@
+# static_files.py
+
+"""
+Caching and compression for files under static/.
+
+- Fingerprinting: url_for('static', ...) gets a ?v=<content hash> argument,
+  so a fingerprinted URL never changes content and is cached as immutable.
+  Editing a file changes its URL on the next page render.
+- Precompression: `flask precompress-static` writes <file>.gz (and <file>.br
+  with the optional brotli package) once, at the highest levels; requests
+  that accept an encoding are answered with the matching copy.
+"""
+
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import send_file
+from werkzeug.security import safe_join
+
+from compression import AVAILABLE_ENCODINGS, COMPRESSIBLE_MIMETYPES, MIN_COMPRESS_BYTES, compress
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+_fingerprints = {}   # path -> ((mtime_ns, size), digest)
+_fingerprint_lock = threading.Lock()
+
+
+def file_fingerprint(path):
+    """Returns a short content hash of a file (None if it is missing), re-hashed only when it changes."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _fingerprint_lock:
+        cached = _fingerprints.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    with _fingerprint_lock:
+        _fingerprints[path] = (signature, digest)
+    return digest
+
+
+def static_fingerprint(static_folder, filename):
+    path = safe_join(static_folder, filename)
+    return file_fingerprint(path) if path else None
+
+
+def _is_compressible(path):
+    # guess_type reports 'x.css.gz' as text/css with a gzip encoding.
+    mimetype, encoding = mimetypes.guess_type(path)
+    return encoding is None and mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def precompress_static(static_folder):
+    """
+    Writes .gz/.br copies of every compressible static file that has no
+    up-to-date copy yet. Returns {'files', 'written', 'bytes_saved'}.
+    """
+    summary = {'files': 0, 'written': 0, 'bytes_saved': 0}
+    for directory, _, filenames in os.walk(static_folder):
+        for name in filenames:
+            path = os.path.join(directory, name)
+            if not _is_compressible(path) or os.path.getsize(path) < MIN_COMPRESS_BYTES:
+                continue
+            summary['files'] += 1
+            data = None
+            for encoding in AVAILABLE_ENCODINGS:
+                variant = path + _SUFFIXES[encoding]
+                if os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path):
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = compress(data, encoding, best=True)
+                tmp_path = variant + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(compressed)
+                os.replace(tmp_path, variant)
+                summary['written'] += 1
+                summary['bytes_saved'] += len(data) - len(compressed)
+    return summary
+
+
+def send_precompressed(static_folder, filename, accept_encodings):
+    """
+    Returns a response serving a precompressed copy of a static file, or None
+    if the client doesn't accept one or no up-to-date copy exists.
+    """
+    path = safe_join(static_folder, filename)
+    if not path or not os.path.isfile(path):
+        return None
+    for encoding in AVAILABLE_ENCODINGS:
+        variant = path + _SUFFIXES[encoding]
+        if not accept_encodings[encoding] or not os.path.isfile(variant):
+            continue
+        if os.path.getmtime(variant) < os.path.getmtime(path):
+            continue   # Stale copy: the file was edited after precompressing.
+        response = send_file(variant, mimetype=mimetypes.guess_type(path)[0], conditional=True)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+    return None
+
+
+def apply_static_cache_headers(response, static_folder, filename, requested_version):
+    """Marks fingerprinted static responses immutable; others must revalidate."""
+    response.vary.add('Accept-Encoding')
+    if requested_version and requested_version == static_fingerprint(static_folder, filename):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,73 @@
+# storage/__init__.py
+
+"""
+Pluggable persistence for data_manager. STORAGE_BACKEND selects between the
+original JSON/CSV files ('file') and a single SQLite database ('sqlite').
+"""
+
+import threading
+
+from config import STORAGE_BACKEND, SQLITE_DB_PATH
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name, sqlite_path=SQLITE_DB_PATH):
+    if name == 'file':
+        from storage.file_backend import FileBackend
+        return FileBackend()
+    if name == 'sqlite':
+        from storage.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"Unknown storage backend '{name}'. Expected 'file' or 'sqlite'.")
+
+
+def get_backend():
+    """Returns the process-wide backend selected by STORAGE_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(STORAGE_BACKEND)
+    return _backend
+
+
+def copy_storage(source, target):
+    """
+    Copies users, quizzes, leaderboards, stored submissions and item
+    statistics from one backend into another, e.g.
+    to import an existing directory tree into SQLite. Temporary review
+    sessions are short-lived and are not copied. Returns a summary dict.
+    """
+    summary = {'users': 0, 'quizzes': 0, 'leaderboard_rows': 0, 'submissions': 0}
+
+    users = source.load_users()
+    if users:
+        target.save_users(users)
+        summary['users'] = len(users)
+
+    for quiz_id in source.list_quiz_signatures():
+        loaded = source.read_quiz(quiz_id)
+        if loaded is None:
+            continue
+        target.write_quiz(quiz_id, loaded[0])
+        summary['quizzes'] += 1
+        target.delete_submissions(quiz_id)
+        for record in source.iter_submissions(quiz_id):
+            target.append_submission(quiz_id, record)
+            summary['submissions'] += 1
+        item_stats = source.read_item_stats(quiz_id)
+        if item_stats is not None:
+            target.replace_item_stats(quiz_id, *item_stats)
+
+    for quiz_id in source.list_leaderboard_ids():
+        changes = source.read_leaderboard_changes(quiz_id, None)
+        if changes is None:
+            continue
+        target.delete_leaderboard(quiz_id)
+        for row in changes[0]:
+            target.append_leaderboard_row(quiz_id, row)
+            summary['leaderboard_rows'] += 1
+
+    return summary
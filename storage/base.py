@@ -0,0 +1,161 @@
+# storage/base.py
+
+
+class StorageBackend:
+    """
+    The persistence interface behind data_manager.
+
+    Backends only move raw data in and out of storage. Caching, schema
+    upgrades and indexes live in data_manager and rely on the *signatures*
+    and *stamps* returned here to find out when something changed, including
+    changes made by another worker process.
+
+    - A quiz signature is any comparable value that changes whenever that
+      quiz is written.
+    - The quiz stamp is a cheap value that changes whenever any quiz is
+      written, added or removed.
+    - A leaderboard cursor is an opaque value recording how much of a
+      leaderboard has already been read.
+    """
+
+    # --- Users ---
+
+    def load_users(self):
+        """Returns the user dict, or None if no users have been saved yet."""
+        raise NotImplementedError
+
+    def save_users(self, users):
+        raise NotImplementedError
+
+    # --- Quizzes ---
+
+    def quiz_stamp(self):
+        raise NotImplementedError
+
+    def list_quiz_signatures(self):
+        """Returns {quiz_id: signature} for every stored quiz."""
+        raise NotImplementedError
+
+    def quiz_signature(self, quiz_id):
+        """Returns the quiz's current signature, or None if it doesn't exist."""
+        raise NotImplementedError
+
+    def read_quiz(self, quiz_id):
+        """
+        Returns (quiz_data, signature, size_in_bytes) for a stored quiz, or
+        None if it doesn't exist or can't be parsed.
+        """
+        raise NotImplementedError
+
+    def write_quiz(self, quiz_id, quiz_data, expected_signature=None):
+        """
+        Stores a quiz and returns its new signature. If expected_signature is
+        given and the stored quiz no longer matches it, nothing is written and
+        None is returned.
+        """
+        raise NotImplementedError
+
+    def delete_quiz(self, quiz_id):
+        """Deletes a quiz (and its summary). Returns True if it existed."""
+        raise NotImplementedError
+
+    def read_quiz_summaries(self):
+        """
+        Returns {quiz_id: (signature, summary)} for the stored quiz summaries.
+        The signature is the one the summary was built from; it may be stale.
+        """
+        raise NotImplementedError
+
+    def write_quiz_summaries(self, summaries):
+        """Stores {quiz_id: (signature, summary)} entries, replacing older ones."""
+        raise NotImplementedError
+
+    # --- Leaderboards ---
+
+    def list_leaderboard_ids(self):
+        raise NotImplementedError
+
+    def append_leaderboard_row(self, quiz_id, row):
+        """Appends a {'username', 'score', 'timestamp'} row."""
+        raise NotImplementedError
+
+    def read_leaderboard_changes(self, quiz_id, cursor):
+        """
+        Returns (rows, new_cursor, reset) with the rows added since `cursor`
+        (None means from the start), or None if the quiz has no leaderboard.
+        reset is True when earlier rows were changed or removed, in which case
+        `rows` holds the whole leaderboard again. Scores are ints.
+        """
+        raise NotImplementedError
+
+    def rewrite_leaderboard(self, quiz_id, transform):
+        """
+        Streams every leaderboard row through transform(row) -> row and stores
+        the results in place of the old rows, blocking concurrent appends
+        while it runs. Readers see the change as a reset.
+        """
+        raise NotImplementedError
+
+    def delete_leaderboard(self, quiz_id):
+        raise NotImplementedError
+
+    # --- Stored submissions ---
+
+    def append_submission(self, quiz_id, record):
+        """Stores one submission record (a JSON-serialisable dict)."""
+        raise NotImplementedError
+
+    def iter_submissions(self, quiz_id):
+        """Yields a quiz's stored submission records one at a time, oldest first."""
+        raise NotImplementedError
+
+    def delete_submissions(self, quiz_id):
+        raise NotImplementedError
+
+    # --- Item statistics ---
+    # Per-question counters for the analytics report, {key: [numbers]} that
+    # add element-wise (see analytics.py). They belong to one question layout
+    # of the quiz; counters for another layout are discarded.
+
+    def add_item_stats(self, quiz_id, layout, deltas):
+        """Adds one submission's counters to the quiz's totals for `layout`."""
+        raise NotImplementedError
+
+    def read_item_stats(self, quiz_id):
+        """Returns (layout, counters) with the quiz's totals, or None if there are none."""
+        raise NotImplementedError
+
+    def replace_item_stats(self, quiz_id, layout, counters):
+        """Replaces the quiz's totals (after they were recomputed)."""
+        raise NotImplementedError
+
+    def delete_item_stats(self, quiz_id):
+        raise NotImplementedError
+
+    # --- Expiring state ---
+    # Short-lived records such as in-progress quiz attempts and answer
+    # reviews, grouped by namespace. A record past its expires_at (a
+    # time.time() value) is never returned.
+
+    def put_expiring(self, namespace, key, data, expires_at):
+        raise NotImplementedError
+
+    def get_expiring(self, namespace, key):
+        """Returns (data, expires_at), or None if the record is missing or expired."""
+        raise NotImplementedError
+
+    def pop_expiring(self, namespace, key):
+        """Returns and removes a record's data, or None if it is missing or expired."""
+        raise NotImplementedError
+
+    def count_expiring(self, namespace):
+        """Returns the number of unexpired records in a namespace."""
+        raise NotImplementedError
+
+    def sweep_expiring(self, namespace, max_bytes=None):
+        """
+        Deletes a namespace's expired records and then, if max_bytes is given,
+        the records closest to expiry (i.e. the oldest) until the rest fit.
+        Returns the number of records deleted.
+        """
+        raise NotImplementedError
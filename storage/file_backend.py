@@ -0,0 +1,570 @@
+# storage/file_backend.py
+
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows (Waitress) runs a single process, so per-path thread locks suffice.
+    fcntl = None
+
+from analytics import add_counters
+from config import USER_DATA_FILE, QUIZ_DIR, LEADERBOARD_DIR, SUBMISSION_DIR, STATE_DIR, ANALYTICS_DIR
+from storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_FIELDS = ['username', 'score', 'timestamp']
+
+# How many already-read bytes of a leaderboard CSV are re-checked on each
+# incremental read to detect the file being edited outside the app.
+_LEADERBOARD_TAIL_CHECK = 64
+
+# A read of item statistics that folds at least this many new log lines
+# saves a snapshot, so later reads start from there.
+_ITEM_STATS_SNAPSHOT_LINES = 50
+
+
+def _file_signature(path):
+    """
+    Returns an (mtime, size, inode) triple used to detect changes to a file.
+    Files are rewritten by renaming a new file over them, so the inode changes
+    on every write even when the mtime and size don't visibly move.
+    """
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+# Mode for files created by an atomic write: mkstemp makes them 0600, which
+# would tighten the permissions of every file rewritten through it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_NEW_FILE_MODE = 0o644 & ~_UMASK
+
+
+def _match_mode(tmp_path, path):
+    """Gives a replacement file the mode of the file it replaces (or _NEW_FILE_MODE)."""
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = _NEW_FILE_MODE
+    os.chmod(tmp_path, mode)
+
+
+def _atomic_write_json(path, data, mtime=None, **dump_kwargs):
+    """
+    Writes JSON to a temporary file in the same directory, fsyncs it and then
+    renames it over `path`, so readers only ever see the old or the new file.
+    If given, `mtime` is applied before the rename.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        _match_mode(tmp_path, path)
+        if mtime is not None:
+            os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+_path_locks = {}   # Without fcntl: absolute path -> threading.Lock
+_path_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _exclusive_lock(f):
+    """
+    Holds an advisory exclusive lock on an open file. Without fcntl, a
+    per-path thread lock serialises the threads of this process instead.
+    """
+    if fcntl is None:
+        key = os.path.abspath(f.name)
+        with _path_locks_guard:
+            lock = _path_locks.setdefault(key, threading.Lock())
+        with lock:
+            yield
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def _locked_append(path):
+    """
+    Opens a file for appending while holding an exclusive lock on it. If the
+    file was replaced while we waited for the lock (a leaderboard rewrite),
+    the new file is opened and locked instead.
+    """
+    while True:
+        f = open(path, 'a', newline='')
+        try:
+            with _exclusive_lock(f):
+                try:
+                    current_inode = os.stat(path).st_ino
+                except FileNotFoundError:
+                    current_inode = None
+                if current_inode == os.fstat(f.fileno()).st_ino:
+                    f.seek(0, os.SEEK_END)
+                    yield f
+                    return
+        finally:
+            f.close()
+
+
+class FileBackend(StorageBackend):
+    """
+    The original storage layout: users.json, one JSON file per quiz, one CSV
+    per leaderboard, one JSON Lines file of stored submissions per quiz and
+    one JSON file per expiring record (attempts, answer reviews).
+    """
+
+    def __init__(self):
+        self.generation_file = os.path.join(QUIZ_DIR, '.generation')
+        self.quiz_lock_file = os.path.join(QUIZ_DIR, '.lock')
+        self.summary_file = os.path.join(QUIZ_DIR, '.summaries.json')
+
+    @contextmanager
+    def _quiz_dir_lock(self):
+        """Serialises quiz writes and deletes across worker processes."""
+        if not os.path.exists(QUIZ_DIR):
+            os.makedirs(QUIZ_DIR)
+        with open(self.quiz_lock_file, 'a') as lock_file, _exclusive_lock(lock_file):
+            yield
+
+    # --- Users ---
+
+    def load_users(self):
+        if not os.path.exists(USER_DATA_FILE):
+            return None
+        with open(USER_DATA_FILE, 'r') as f:
+            return json.load(f)
+
+    def save_users(self, users):
+        _atomic_write_json(USER_DATA_FILE, users, indent=4)
+
+    # --- Quizzes ---
+
+    def _quiz_path(self, quiz_id):
+        return os.path.join(QUIZ_DIR, f"{quiz_id}.json")
+
+    def _bump_generation(self):
+        """
+        Replaces the generation marker so other workers notice every save, even
+        when the directory mtime doesn't visibly move (coarse timestamps).
+        """
+        _atomic_write_json(self.generation_file, time.time_ns())
+
+    def quiz_stamp(self):
+        # The directory mtime catches files being added or removed; the
+        # generation marker catches quizzes being rewritten in place.
+        try:
+            dir_mtime = os.stat(QUIZ_DIR).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        # The marker's contents and inode change on every bump; its mtime may not.
+        try:
+            with open(self.generation_file) as f:
+                generation = (os.fstat(f.fileno()).st_ino, f.read())
+        except FileNotFoundError:
+            generation = None
+        return (dir_mtime, generation)
+
+    def list_quiz_signatures(self):
+        signatures = {}
+        if not os.path.exists(QUIZ_DIR):
+            return signatures
+        for entry in os.scandir(QUIZ_DIR):
+            # Dotfiles are the summary index and in-flight temporary files.
+            if entry.name.endswith('.json') and not entry.name.startswith('.'):
+                # inode() rather than stat().st_ino, which is 0 on Windows.
+                stat = entry.stat()
+                signatures[entry.name[:-len('.json')]] = (stat.st_mtime_ns, stat.st_size, entry.inode())
+        return signatures
+
+    def quiz_signature(self, quiz_id):
+        try:
+            return _file_signature(self._quiz_path(quiz_id))
+        except FileNotFoundError:
+            return None
+
+    def read_quiz(self, quiz_id):
+        quiz_path = self._quiz_path(quiz_id)
+        try:
+            # Take the signature first: if the file changes while we read it,
+            # the cached copy is simply treated as stale on the next lookup.
+            signature = _file_signature(quiz_path)
+            with open(quiz_path, 'r') as f:
+                quiz_data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            logger.error("Could not parse %s.json. It may be a corrupted JSON file.", quiz_id)
+            return None
+        return quiz_data, signature, signature[1]
+
+    def write_quiz(self, quiz_id, quiz_data, expected_signature=None):
+        quiz_path = self._quiz_path(quiz_id)
+        with self._quiz_dir_lock():
+            if expected_signature is not None and self.quiz_signature(quiz_id) != expected_signature:
+                return None
+            _atomic_write_json(quiz_path, quiz_data, indent=4)
+            signature = _file_signature(quiz_path)
+            self._bump_generation()
+        return signature
+
+    def delete_quiz(self, quiz_id):
+        quiz_path = self._quiz_path(quiz_id)
+        with self._quiz_dir_lock():
+            if not os.path.exists(quiz_path):
+                return False
+            os.remove(quiz_path)
+            summaries = self._read_summary_file()
+            if summaries.pop(quiz_id, None) is not None:
+                _atomic_write_json(self.summary_file, summaries, separators=(',', ':'))
+            self._bump_generation()
+        return True
+
+    def _read_summary_file(self):
+        try:
+            with open(self.summary_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logger.warning("The quiz summary index is corrupted; it will be rebuilt.")
+            return {}
+
+    def read_quiz_summaries(self):
+        # Summaries for every quiz share one small file, so listing quizzes is
+        # a single read. Signatures come back from JSON as lists.
+        return {quiz_id: (tuple(entry['signature']), entry['summary'])
+                for quiz_id, entry in self._read_summary_file().items()}
+
+    def write_quiz_summaries(self, summaries):
+        with self._quiz_dir_lock():
+            stored = self._read_summary_file()
+            for quiz_id, (signature, summary) in summaries.items():
+                stored[quiz_id] = {'signature': list(signature), 'summary': summary}
+            _atomic_write_json(self.summary_file, stored, separators=(',', ':'))
+
+    # --- Leaderboards ---
+
+    def _leaderboard_path(self, quiz_id):
+        return os.path.join(LEADERBOARD_DIR, f"{quiz_id}.csv")
+
+    def list_leaderboard_ids(self):
+        if not os.path.exists(LEADERBOARD_DIR):
+            return []
+        return [name[:-len('.csv')] for name in os.listdir(LEADERBOARD_DIR) if name.endswith('.csv')]
+
+    def append_leaderboard_row(self, quiz_id, row):
+        if not os.path.exists(LEADERBOARD_DIR):
+            os.makedirs(LEADERBOARD_DIR)
+
+        with _locked_append(self._leaderboard_path(quiz_id)) as f:
+            writer = csv.DictWriter(f, fieldnames=LEADERBOARD_FIELDS)
+            if f.tell() == 0:
+                writer.writeheader()  # Write header if file is new
+            writer.writerow(row)
+            f.flush()
+
+    def read_leaderboard_changes(self, quiz_id, cursor):
+        # The cursor is (inode, bytes applied, last bytes applied, header).
+        leaderboard_path = self._leaderboard_path(quiz_id)
+        try:
+            stat = os.stat(leaderboard_path)
+        except FileNotFoundError:
+            return None
+
+        reset = cursor is None or cursor[0] != stat.st_ino or stat.st_size < cursor[1]
+        if not reset and stat.st_size == cursor[1]:
+            return [], cursor, False
+
+        with open(leaderboard_path, 'rb') as f:
+            if not reset:
+                inode, offset, tail, fieldnames = cursor
+                f.seek(offset - len(tail))
+                chunk = f.read(stat.st_size - offset + len(tail))
+                if chunk.startswith(tail):
+                    chunk = chunk[len(tail):]
+                else:
+                    # The already-applied part of the file changed underneath us.
+                    reset = True
+            if reset:
+                f.seek(0)
+                chunk = f.read(stat.st_size)
+                offset, fieldnames = 0, None
+
+        # Only apply complete lines; a concurrent append may still be in flight.
+        complete = chunk.rfind(b'\n') + 1
+        if not complete:
+            return [], (cursor if not reset else (stat.st_ino, 0, b'', None)), reset
+        reader = csv.reader(io.StringIO(chunk[:complete].decode('utf-8'), newline=''))
+        if fieldnames is None:
+            fieldnames = next(reader, None)
+        rows = []
+        for values in reader:
+            if not values:
+                continue
+            row = dict(zip(fieldnames, values))
+            # Ensure score is an integer for correct sorting
+            row['score'] = int(row['score'])
+            rows.append(row)
+
+        new_tail = chunk[max(0, complete - _LEADERBOARD_TAIL_CHECK):complete]
+        return rows, (stat.st_ino, offset + complete, new_tail, fieldnames), reset
+
+    def rewrite_leaderboard(self, quiz_id, transform):
+        leaderboard_path = self._leaderboard_path(quiz_id)
+        if not os.path.exists(leaderboard_path):
+            return
+        # Holding the append lock keeps new rows out while the replacement is
+        # written; appenders that were waiting re-open the new file.
+        with _locked_append(leaderboard_path):
+            fd, tmp_path = tempfile.mkstemp(dir=LEADERBOARD_DIR, prefix='.tmp-', suffix='.csv')
+            try:
+                with open(leaderboard_path, 'r', newline='') as src, os.fdopen(fd, 'w', newline='') as dst:
+                    writer = csv.DictWriter(dst, fieldnames=LEADERBOARD_FIELDS)
+                    writer.writeheader()
+                    for row in csv.DictReader(src):
+                        row['score'] = int(row['score'])
+                        writer.writerow(transform(row))
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                _match_mode(tmp_path, leaderboard_path)
+                os.replace(tmp_path, leaderboard_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def delete_leaderboard(self, quiz_id):
+        leaderboard_path = self._leaderboard_path(quiz_id)
+        if os.path.exists(leaderboard_path):
+            os.remove(leaderboard_path)
+
+    # --- Stored submissions ---
+
+    def _submission_path(self, quiz_id):
+        return os.path.join(SUBMISSION_DIR, f"{quiz_id}.jsonl")
+
+    def append_submission(self, quiz_id, record):
+        if not os.path.exists(SUBMISSION_DIR):
+            os.makedirs(SUBMISSION_DIR)
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with _locked_append(self._submission_path(quiz_id)) as f:
+            f.write(line)
+            f.flush()
+
+    def iter_submissions(self, quiz_id):
+        try:
+            f = open(self._submission_path(quiz_id), 'r')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                # Skip a trailing line that is still being appended.
+                if line.endswith('\n'):
+                    yield json.loads(line)
+
+    def delete_submissions(self, quiz_id):
+        submission_path = self._submission_path(quiz_id)
+        if os.path.exists(submission_path):
+            os.remove(submission_path)
+
+    # --- Item statistics ---
+    # analytics/<quiz_id>.jsonl is an append-only log with one line of counter
+    # deltas per submission, so submitting never rewrites the totals.
+    # Reads fold the log into analytics/<quiz_id>.json, a snapshot of the
+    # totals and of how far into which log file they reach, and then only
+    # parse the lines added since. replace_item_stats starts a new log file
+    # whose first line holds the full totals; a snapshot of the old file
+    # no longer matches its inode and is ignored.
+
+    def _item_stats_paths(self, quiz_id):
+        base = os.path.join(ANALYTICS_DIR, quiz_id)
+        return base + '.jsonl', base + '.json'
+
+    def add_item_stats(self, quiz_id, layout, deltas):
+        if not os.path.exists(ANALYTICS_DIR):
+            os.makedirs(ANALYTICS_DIR, exist_ok=True)
+        line = json.dumps({'layout': layout, 'deltas': deltas}, separators=(',', ':')) + '\n'
+        with _locked_append(self._item_stats_paths(quiz_id)[0]) as f:
+            f.write(line)
+            f.flush()
+
+    def read_item_stats(self, quiz_id):
+        log_path, snapshot_path = self._item_stats_paths(quiz_id)
+        try:
+            stat = os.stat(log_path)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            snapshot = None
+        if snapshot and snapshot['inode'] == stat.st_ino and snapshot['offset'] <= stat.st_size:
+            layout, counters, offset = snapshot['layout'], snapshot['counters'], snapshot['offset']
+        else:
+            layout, counters, offset = None, {}, 0
+
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read(stat.st_size - offset)
+        # Only fold complete lines; a concurrent append may still be in flight.
+        complete = chunk.rfind(b'\n') + 1
+        lines = chunk[:complete].splitlines()
+        for line in lines:
+            record = json.loads(line)
+            if 'counters' in record:
+                layout, counters = record['layout'], record['counters']
+                continue
+            if record['layout'] != layout:
+                layout, counters = record['layout'], {}
+            add_counters(counters, record['deltas'])
+
+        if len(lines) >= _ITEM_STATS_SNAPSHOT_LINES:
+            _atomic_write_json(snapshot_path, {'inode': stat.st_ino, 'offset': offset + complete,
+                                               'layout': layout, 'counters': counters}, separators=(',', ':'))
+        return (layout, counters) if layout is not None else None
+
+    def replace_item_stats(self, quiz_id, layout, counters):
+        if not os.path.exists(ANALYTICS_DIR):
+            os.makedirs(ANALYTICS_DIR, exist_ok=True)
+        log_path = self._item_stats_paths(quiz_id)[0]
+        # Holding the append lock keeps new deltas out while the log is
+        # swapped; appenders that were waiting re-open the new file.
+        with _locked_append(log_path):
+            fd, tmp_path = tempfile.mkstemp(dir=ANALYTICS_DIR, prefix='.tmp-', suffix='.jsonl')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(json.dumps({'layout': layout, 'counters': counters}, separators=(',', ':')) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                _match_mode(tmp_path, log_path)
+                os.replace(tmp_path, log_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def delete_item_stats(self, quiz_id):
+        for path in self._item_stats_paths(quiz_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # --- Expiring state ---
+    # Records live in state/<namespace>/<shard>/<key>.json, spread over 256
+    # shard directories so no single directory grows huge. Each file's mtime
+    # is set to its expiry time, so sweeps only need to stat files.
+
+    def _expiring_path(self, namespace, key):
+        shard = hashlib.sha1(key.encode('utf-8')).hexdigest()[:2]
+        return os.path.join(STATE_DIR, namespace, shard, f"{key}.json")
+
+    def put_expiring(self, namespace, key, data, expires_at):
+        path = self._expiring_path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write_json(path, {'expires_at': expires_at, 'data': data}, mtime=expires_at)
+
+    def get_expiring(self, namespace, key):
+        try:
+            with open(self._expiring_path(namespace, key), 'r') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        if record['expires_at'] <= time.time():
+            return None
+        return record['data'], record['expires_at']
+
+    def pop_expiring(self, namespace, key):
+        path = self._expiring_path(namespace, key)
+        # Claim the file by renaming it first, so two workers can never both
+        # consume the same record.
+        claimed_path = f"{path}.{os.getpid()}-{threading.get_ident()}.claimed"
+        try:
+            os.rename(path, claimed_path)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(claimed_path, 'r') as f:
+                record = json.load(f)
+        finally:
+            os.remove(claimed_path)
+        return record['data'] if record['expires_at'] > time.time() else None
+
+    def count_expiring(self, namespace):
+        now = time.time()
+        count = 0
+        try:
+            shards = [entry.path for entry in os.scandir(os.path.join(STATE_DIR, namespace)) if entry.is_dir()]
+        except FileNotFoundError:
+            return 0
+        for shard in shards:
+            for entry in os.scandir(shard):
+                if entry.name.startswith('.') or not entry.name.endswith('.json'):
+                    continue
+                try:
+                    if entry.stat().st_mtime > now:
+                        count += 1
+                except FileNotFoundError:
+                    continue
+        return count
+
+    def sweep_expiring(self, namespace, max_bytes=None):
+        now = time.time()
+        removed = 0
+        live = []   # (expires_at, size, path)
+        try:
+            shards = [entry.path for entry in os.scandir(os.path.join(STATE_DIR, namespace)) if entry.is_dir()]
+        except FileNotFoundError:
+            return 0
+        for shard in shards:
+            for entry in os.scandir(shard):
+                # Skip in-progress writes (.tmp-*) and claimed records.
+                if entry.name.startswith('.') or not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                    if stat.st_mtime <= now:
+                        os.remove(entry.path)
+                        removed += 1
+                    else:
+                        live.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError:
+                    continue  # Popped or swept by another worker meanwhile
+
+        if max_bytes is not None:
+            total = sum(size for _, size, _ in live)
+            live.sort()
+            for _, size, path in live:
+                if total <= max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+        return removed
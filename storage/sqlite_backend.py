@@ -0,0 +1,336 @@
+# storage/sqlite_backend.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from analytics import add_counters
+from storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quizzes (
+    id TEXT PRIMARY KEY,
+    pin TEXT,
+    practice_pin TEXT,
+    version INTEGER NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_quizzes_pin ON quizzes (pin);
+CREATE INDEX IF NOT EXISTS idx_quizzes_practice_pin ON quizzes (practice_pin);
+CREATE TABLE IF NOT EXISTS quiz_summaries (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leaderboard (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    quiz_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leaderboard_quiz_score ON leaderboard (quiz_id, score DESC, id);
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    quiz_id TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_quiz ON submissions (quiz_id, id);
+CREATE TABLE IF NOT EXISTS item_stats (
+    quiz_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (quiz_id, key)
+);
+CREATE TABLE IF NOT EXISTS expiring_state (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_expiring_state_expiry ON expiring_state (namespace, expires_at);
+"""
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores everything in a single SQLite database in WAL mode, so readers in
+    every worker proceed while one writer commits. Each thread of each worker
+    process opens one connection and reuses it for the life of the process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        # Connections must not cross a fork (e.g. gunicorn --preload), so they
+        # are keyed by PID as well as by thread.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    # --- Users ---
+
+    def load_users(self):
+        rows = self._connect().execute('SELECT username, data FROM users').fetchall()
+        if not rows:
+            return None
+        return {username: json.loads(data) for username, data in rows}
+
+    def save_users(self, users):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM users')
+            conn.executemany('INSERT INTO users (username, data) VALUES (?, ?)',
+                             [(username, json.dumps(data)) for username, data in users.items()])
+
+    # --- Quizzes ---
+
+    def _bump_generation(self, conn):
+        """Advances the quiz generation counter and returns its new value."""
+        conn.execute("INSERT INTO meta (key, value) VALUES ('quiz_generation', 1) "
+                     "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+        return conn.execute("SELECT value FROM meta WHERE key = 'quiz_generation'").fetchone()[0]
+
+    def quiz_stamp(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'quiz_generation'").fetchone()
+        return row[0] if row else 0
+
+    def list_quiz_signatures(self):
+        return dict(self._connect().execute('SELECT id, version FROM quizzes'))
+
+    def quiz_signature(self, quiz_id):
+        row = self._connect().execute('SELECT version FROM quizzes WHERE id = ?', (quiz_id,)).fetchone()
+        return row[0] if row else None
+
+    def read_quiz(self, quiz_id):
+        row = self._connect().execute('SELECT body, version FROM quizzes WHERE id = ?', (quiz_id,)).fetchone()
+        if row is None:
+            return None
+        body, version = row
+        try:
+            return json.loads(body), version, len(body)
+        except json.JSONDecodeError:
+            logger.error("Could not parse stored quiz %s. It may be corrupted.", quiz_id)
+            return None
+
+    def write_quiz(self, quiz_id, quiz_data, expected_signature=None):
+        body = json.dumps(quiz_data)
+        with self._transaction() as conn:
+            row = conn.execute('SELECT version FROM quizzes WHERE id = ?', (quiz_id,)).fetchone()
+            current = row[0] if row else None
+            if expected_signature is not None and current != expected_signature:
+                return None
+            # Versions come from the generation counter, which only goes up, so a
+            # quiz deleted and written again never reuses a version that another
+            # worker may still have cached.
+            version = self._bump_generation(conn)
+            conn.execute('INSERT OR REPLACE INTO quizzes (id, pin, practice_pin, version, body) VALUES (?, ?, ?, ?, ?)',
+                         (quiz_id, quiz_data.get('pin'), quiz_data.get('practice_pin'), version, body))
+        return version
+
+    def delete_quiz(self, quiz_id):
+        with self._transaction() as conn:
+            deleted = conn.execute('DELETE FROM quizzes WHERE id = ?', (quiz_id,)).rowcount > 0
+            conn.execute('DELETE FROM quiz_summaries WHERE id = ?', (quiz_id,))
+            if deleted:
+                self._bump_generation(conn)
+        return deleted
+
+    def read_quiz_summaries(self):
+        return {quiz_id: (version, json.loads(summary)) for quiz_id, version, summary
+                in self._connect().execute('SELECT id, version, summary FROM quiz_summaries')}
+
+    def write_quiz_summaries(self, summaries):
+        with self._transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO quiz_summaries (id, version, summary) VALUES (?, ?, ?)',
+                             [(quiz_id, version, json.dumps(summary))
+                              for quiz_id, (version, summary) in summaries.items()])
+
+    # --- Leaderboards ---
+
+    def _leaderboard_generation(self, conn, quiz_id):
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (f'leaderboard:{quiz_id}',)).fetchone()
+        return row[0] if row else 0
+
+    def list_leaderboard_ids(self):
+        return [row[0] for row in self._connect().execute('SELECT DISTINCT quiz_id FROM leaderboard')]
+
+    def append_leaderboard_row(self, quiz_id, row):
+        with self._transaction() as conn:
+            conn.execute('INSERT INTO leaderboard (quiz_id, username, score, timestamp) VALUES (?, ?, ?, ?)',
+                         (quiz_id, row['username'], int(row['score']), row['timestamp']))
+
+    def read_leaderboard_changes(self, quiz_id, cursor):
+        # The cursor is (leaderboard generation, last row id applied). The
+        # generation changes whenever existing rows are deleted or rewritten.
+        conn = self._connect()
+        generation = self._leaderboard_generation(conn, quiz_id)
+        reset = cursor is None or cursor[0] != generation
+        last_id = 0 if reset else cursor[1]
+        rows = conn.execute('SELECT id, username, score, timestamp FROM leaderboard '
+                            'WHERE quiz_id = ? AND id > ? ORDER BY id', (quiz_id, last_id)).fetchall()
+        if reset and not rows:
+            return None
+        if rows:
+            last_id = rows[-1][0]
+        return ([{'username': username, 'score': score, 'timestamp': timestamp}
+                 for _, username, score, timestamp in rows],
+                (generation, last_id), reset)
+
+    def _bump_leaderboard_generation(self, conn, quiz_id):
+        conn.execute("INSERT INTO meta (key, value) VALUES (?, 1) "
+                     "ON CONFLICT(key) DO UPDATE SET value = value + 1", (f'leaderboard:{quiz_id}',))
+
+    def rewrite_leaderboard(self, quiz_id, transform):
+        with self._transaction() as conn:
+            updates = []
+            for row_id, username, score, timestamp in conn.execute(
+                    'SELECT id, username, score, timestamp FROM leaderboard WHERE quiz_id = ?', (quiz_id,)):
+                row = transform({'username': username, 'score': score, 'timestamp': timestamp})
+                if (row['username'], row['score'], row['timestamp']) != (username, score, timestamp):
+                    updates.append((row['username'], int(row['score']), row['timestamp'], row_id))
+            conn.executemany('UPDATE leaderboard SET username = ?, score = ?, timestamp = ? WHERE id = ?', updates)
+            self._bump_leaderboard_generation(conn, quiz_id)
+
+    def delete_leaderboard(self, quiz_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM leaderboard WHERE quiz_id = ?', (quiz_id,))
+            self._bump_leaderboard_generation(conn, quiz_id)
+
+    # --- Stored submissions ---
+
+    def append_submission(self, quiz_id, record):
+        with self._transaction() as conn:
+            conn.execute('INSERT INTO submissions (quiz_id, record) VALUES (?, ?)',
+                         (quiz_id, json.dumps(record, separators=(',', ':'))))
+
+    def iter_submissions(self, quiz_id):
+        # A dedicated connection, so the caller may write while we stream.
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            for (record,) in conn.execute('SELECT record FROM submissions WHERE quiz_id = ? ORDER BY id', (quiz_id,)):
+                yield json.loads(record)
+        finally:
+            conn.close()
+
+    def delete_submissions(self, quiz_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM submissions WHERE quiz_id = ?', (quiz_id,))
+
+    # --- Item statistics ---
+    # One row per counter key, so a submission only touches the rows of the
+    # questions it showed.
+
+    def add_item_stats(self, quiz_id, layout, deltas):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM item_stats WHERE quiz_id = ? AND layout != ?', (quiz_id, layout))
+            keys = list(deltas)
+            current = {}
+            for start in range(0, len(keys), 500):   # Stay under SQLite's bound-parameter limit.
+                batch = keys[start:start + 500]
+                current.update((key, json.loads(value)) for key, value in conn.execute(
+                    f"SELECT key, value FROM item_stats WHERE quiz_id = ? AND key IN ({','.join('?' * len(batch))})",
+                    [quiz_id] + batch))
+            add_counters(current, deltas)
+            conn.executemany('INSERT OR REPLACE INTO item_stats (quiz_id, key, layout, value) VALUES (?, ?, ?, ?)',
+                             [(quiz_id, key, layout, json.dumps(current[key])) for key in keys])
+
+    def read_item_stats(self, quiz_id):
+        rows = self._connect().execute('SELECT key, layout, value FROM item_stats WHERE quiz_id = ?',
+                                       (quiz_id,)).fetchall()
+        if not rows:
+            return None
+        return rows[0][1], {key: json.loads(value) for key, _, value in rows}
+
+    def replace_item_stats(self, quiz_id, layout, counters):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM item_stats WHERE quiz_id = ?', (quiz_id,))
+            conn.executemany('INSERT INTO item_stats (quiz_id, key, layout, value) VALUES (?, ?, ?, ?)',
+                             [(quiz_id, key, layout, json.dumps(values)) for key, values in counters.items()])
+
+    def delete_item_stats(self, quiz_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM item_stats WHERE quiz_id = ?', (quiz_id,))
+
+    # --- Expiring state ---
+
+    def put_expiring(self, namespace, key, data, expires_at):
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO expiring_state (namespace, key, data, expires_at) VALUES (?, ?, ?, ?)',
+                         (namespace, key, json.dumps(data), expires_at))
+
+    def get_expiring(self, namespace, key):
+        row = self._connect().execute('SELECT data, expires_at FROM expiring_state '
+                                      'WHERE namespace = ? AND key = ? AND expires_at > ?',
+                                      (namespace, key, time.time())).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def pop_expiring(self, namespace, key):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT data, expires_at FROM expiring_state WHERE namespace = ? AND key = ?',
+                               (namespace, key)).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM expiring_state WHERE namespace = ? AND key = ?', (namespace, key))
+        return json.loads(row[0]) if row[1] > time.time() else None
+
+    def count_expiring(self, namespace):
+        return self._connect().execute('SELECT COUNT(*) FROM expiring_state WHERE namespace = ? AND expires_at > ?',
+                                       (namespace, time.time())).fetchone()[0]
+
+    def sweep_expiring(self, namespace, max_bytes=None):
+        with self._transaction() as conn:
+            removed = conn.execute('DELETE FROM expiring_state WHERE namespace = ? AND expires_at <= ?',
+                                   (namespace, time.time())).rowcount
+            if max_bytes is not None:
+                # Keep the latest-expiring records whose running size fits.
+                removed += conn.execute(
+                    'DELETE FROM expiring_state WHERE namespace = ? AND key IN ('
+                    '  SELECT key FROM ('
+                    '    SELECT key, SUM(length(data)) OVER (ORDER BY expires_at DESC, key) AS kept_bytes'
+                    '    FROM expiring_state WHERE namespace = ?'
+                    '  ) WHERE kept_bytes > ?)',
+                    (namespace, namespace, max_bytes)).rowcount
+        return removed
+
+
+class _Transaction:
+    """Runs a block inside BEGIN IMMEDIATE ... COMMIT (or ROLLBACK on error)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
@@ -0,0 +1,52 @@
+# student_view.py
+
+"""
+Questions as they are sent to students' browsers.
+
+The student view of a quiz is a projection of its questions that keeps only
+what the quiz and practice pages render (RENDER_FIELDS): answer keys, scores
+and any other authoring fields never leave the server. data_manager caches
+the projection with the parsed quiz, along with one JSON fragment per
+projected question, so both are built once per quiz version. A page of an
+attempt, or a practice round, is then assembled by joining fragments.
+
+Fragments are escaped like Jinja's |tojson (<, >, & and ' become \\u
+escapes), so the same bytes can be served as JSON or embedded in a <script>.
+"""
+
+import json
+
+# The only question and multipart-part fields a student's browser receives.
+RENDER_FIELDS = ('type', 'text', 'options', 'parts')
+PART_RENDER_FIELDS = ('type', 'text', 'options')
+
+_HTML_ESCAPES = {ord('<'): '\\u003c', ord('>'): '\\u003e', ord('&'): '\\u0026', ord("'"): '\\u0027'}
+
+
+def project_question(question):
+    """Returns the student's view of a question: RENDER_FIELDS only, no answers."""
+    projected = {key: question[key] for key in RENDER_FIELDS if key in question}
+    if 'parts' in projected:
+        projected['parts'] = [{key: part[key] for key in PART_RENDER_FIELDS if key in part}
+                              for part in projected['parts']]
+    return projected
+
+
+def build_student_view(quiz):
+    """Returns the projected questions of a quiz, in question-list order."""
+    return tuple(project_question(question) for question in quiz.get('questions', []))
+
+
+def to_json_fragment(value):
+    """Serialises a value as compact, script-safe UTF-8 JSON."""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).translate(_HTML_ESCAPES).encode('utf-8')
+
+
+def build_question_fragments(student_view):
+    """Returns one JSON fragment (bytes) per projected question."""
+    return tuple(to_json_fragment(question) for question in student_view)
+
+
+def join_fragments(fragments, indices):
+    """Returns the JSON array of the questions at `indices`, as bytes."""
+    return b'[' + b','.join(fragments[i] for i in indices) + b']'
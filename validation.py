@@ -0,0 +1,72 @@
+# validation.py
+
+"""
+Rules a quiz must satisfy before it is saved, shared by the editor, the
+patch API and the bulk importer.
+"""
+
+from collections import defaultdict
+
+
+def validate_question(q_data, q_num):
+    """
+    Validates a single question dictionary to ensure it's logically sound.
+    Returns an error string if invalid, otherwise None.
+    """
+    q_type = q_data.get('type')
+    if not q_data.get('text', '').strip():
+        return f"Question #{q_num} is missing its main text."
+    
+    # Validation for types that have predefined options
+    if q_type in ['multiple-choice', 'multiple-select']:
+        options = q_data.get('options', [])
+        if not options:
+            return f"Question #{q_num} ('{q_type}') has no options defined."
+        
+        answers = q_data.get('answer')
+        
+        # It's NOT an error if 'answers' is missing on the first save of a new question.
+        # However, if answers ARE provided, they must be valid.
+        if answers:
+            if not isinstance(answers, list):
+                answers = [answers]
+            
+            for ans in answers:
+                if ans not in options:
+                    return f"Question #{q_num}: The answer '{ans}' is not listed in the provided options."
+    
+    # Recursive validation for multipart questions
+    elif q_type == 'multipart':
+        parts = q_data.get('parts', [])
+        if not parts:
+            return f"Question #{q_num} ('multipart') has no sub-questions (parts) defined."
+        for i, part in enumerate(parts):
+            part_error = validate_question(part, f"{q_num}.{i+1}")
+            if part_error:
+                return part_error
+    
+    # Validation for types that ALWAYS require an answer
+    elif not q_data.get('answer'):
+         return f"Question #{q_num} ('{q_type}') is missing an answer."
+
+    return None
+
+
+def display_config_errors(display_config, questions):
+    """Checks the question selection rules against the questions available."""
+    errors = []
+    available_counts = defaultdict(int)
+    total_possible_score = sum(q.get('score', 0) if q['type'] != 'multipart' else sum(p.get('score', 0) for p in q.get('parts', [])) for q in questions)
+    for q in questions: available_counts[q['type']] += 1
+
+    display_mode = display_config['mode']
+    if display_mode == 'question_count':
+        for q_type, count in display_config['parameters'].items():
+            if count > available_counts[q_type]:
+                # General errors have no index
+                errors.append({'text': f"Display Error: You requested {count} '{q_type}' questions, but only {available_counts[q_type]} are available."})
+    elif display_mode == 'total_score':
+        target = display_config['target_score']
+        if target > total_possible_score:
+            errors.append({'text': f"Display Error: Target score of {target} is higher than the total possible score of all questions ({total_possible_score})."})
+    return errors
@@ -1,50 +1,201 @@
 # views/admin.py
 import base64
-from collections import defaultdict
+import csv
+import io
+import hmac
 import json
-import traceback
+import logging
+import os
 import uuid
 import zlib
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from data_manager import delete_quiz, get_all_quizzes, get_quiz_by_id, save_quiz
+from flask import Blueprint, abort, current_app, jsonify, render_template, request, redirect, session, url_for, flash
+from analytics import MIN_SEEN_FOR_FLAGS
+from config import ADMIN_QUIZ_PAGE_SIZE, METRICS_TOKEN
+from data_manager import delete_quiz, get_item_report, get_quiz_by_id, get_quiz_for_update, get_quiz_summary, get_storage_metrics, list_quiz_summaries, pin_in_use, rebuild_item_stats, regrade_quiz, save_quiz
 from decorators import admin_required
+from question_import import QuestionImporter, QuestionImportError
+from selection import QUESTION_TYPES
+from validation import display_config_errors, validate_question
+import live_monitor
+import metrics
 import pako
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+logger = logging.getLogger(__name__)
 
 @admin_bp.route('/dashboard')
 @admin_required
 def admin_dashboard():
-    quizzes = get_all_quizzes()
-    return render_template('admin_dashboard.html', quizzes=quizzes)
+    search = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    quizzes, total_quizzes = list_quiz_summaries(search, page)
+    total_pages = max(1, -(-total_quizzes // ADMIN_QUIZ_PAGE_SIZE))
+    return render_template('admin_dashboard.html', quizzes=quizzes, total_quizzes=total_quizzes,
+                           search=search, page=page, total_pages=total_pages)
+
+IMPORT_EXTENSIONS = ('.json', '.jsonl')
+# How many per-question errors are flashed after a rejected import.
+IMPORT_ERRORS_SHOWN = 5
+
+def _import_questions(file, first_number=1):
+    """
+    Streams questions out of an uploaded .json/.jsonl file.
+    Returns (importer, questions), or (None, None) after flashing why the file was rejected.
+    """
+    importer = QuestionImporter(io.TextIOWrapper(file.stream, encoding='utf-8-sig'), first_number)
+    try:
+        questions = list(importer)
+    except (QuestionImportError, UnicodeDecodeError) as e:
+        flash(f"Error processing file: {e}", "danger")
+        return None, None
+
+    if importer.error_count:
+        flash(f"No questions were imported: {importer.error_count} question(s) failed validation.", "danger")
+        for error in importer.errors[:IMPORT_ERRORS_SHOWN]:
+            flash(error, "danger")
+        return None, None
+    return importer, questions
+
+@admin_bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for all workers. Open to admins, or to scrapers sending METRICS_TOKEN."""
+    authorization = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(authorization, f'Bearer {METRICS_TOKEN}')
+    if session.get('role') != 'admin' and not token_ok:
+        abort(403)
+    response = current_app.response_class(metrics.render(get_storage_metrics()),
+                                          mimetype='text/plain; version=0.0.4')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# --- Live Exam Monitor ---
+
+def can_stream():
+    """
+    Whether this server can hold a stream open without blocking other
+    requests. A sync gunicorn worker serves one request at a time, so a
+    stream there would keep students from submitting; the page polls the
+    snapshot instead.
+    """
+    return bool(request.environ.get('wsgi.multithread'))
+
+@admin_bp.route('/live/<quiz_id>')
+@admin_required
+def live_monitor_page(quiz_id):
+    quiz = get_quiz_summary(quiz_id)
+    if not quiz:
+        flash("Quiz not found.", "danger")
+        return redirect(url_for('admin.admin_dashboard'))
+    return render_template('live_monitor.html', quiz=quiz, snapshot=live_monitor.snapshot(quiz_id),
+                           streaming=can_stream())
+
+@admin_bp.route('/live/<quiz_id>/stream')
+def live_monitor_stream(quiz_id):
+    """Server-sent events with the live session summary; see live_monitor.py."""
+    # EventSource can't follow the login redirect usefully, so refuse outright.
+    if session.get('role') != 'admin':
+        abort(403)
+    if get_quiz_summary(quiz_id) is None:
+        abort(404)
+    stream = live_monitor.open_stream(quiz_id) if can_stream() else None
+    if stream is None:
+        # The page falls back to polling the snapshot.
+        response = current_app.response_class("Live streams are unavailable on this worker.", status=503)
+        response.headers['Retry-After'] = '30'
+        return response
+    response = current_app.response_class(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'   # Stop nginx buffering the events.
+    return response
+
+@admin_bp.route('/live/<quiz_id>/snapshot')
+@admin_required
+def live_monitor_snapshot(quiz_id):
+    response = current_app.response_class(live_monitor.snapshot(quiz_id), mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@admin_bp.route('/live/<quiz_id>/reset', methods=['POST'])
+@admin_required
+def live_monitor_reset(quiz_id):
+    if get_quiz_summary(quiz_id) is None:
+        flash("Quiz not found.", "danger")
+        return redirect(url_for('admin.admin_dashboard'))
+    live_monitor.reset_session(quiz_id)
+    flash("Started a new live session. Joins and submissions are counted from now.", "success")
+    return redirect(url_for('admin.live_monitor_page', quiz_id=quiz_id))
+
+# --- Analytics ---
+
+ANALYTICS_CSV_FIELDS = ['number', 'type', 'seen', 'answered_rate', 'correct_rate', 'partial_rate',
+                        'facility', 'discrimination', 'part_correct_rates', 'flags', 'text']
+
+@admin_bp.route('/analytics/<quiz_id>')
+@admin_required
+def quiz_analytics(quiz_id):
+    report = get_item_report(quiz_id)
+    if report is None:
+        flash("Quiz not found.", "danger")
+        return redirect(url_for('admin.admin_dashboard'))
+    return render_template('analytics.html', quiz=get_quiz_summary(quiz_id), report=report,
+                           min_seen=MIN_SEEN_FOR_FLAGS)
+
+@admin_bp.route('/analytics/<quiz_id>/export')
+@admin_required
+def export_quiz_analytics(quiz_id):
+    """The per-question report as ?format=csv (default) or ?format=json."""
+    report = get_item_report(quiz_id)
+    if report is None:
+        abort(404)
+    if request.args.get('format') == 'json':
+        response = jsonify(report)
+        filename = f'analytics-{quiz_id}.json'
+    else:
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=ANALYTICS_CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for item in report['questions']:
+            writer.writerow(dict(item, part_correct_rates=';'.join(f'{rate:.4f}' for rate in item['part_correct_rates']),
+                                 flags=';'.join(item['flags'])))
+        response = current_app.response_class(out.getvalue(), mimetype='text/csv')
+        filename = f'analytics-{quiz_id}.csv'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@admin_bp.route('/analytics/<quiz_id>/rebuild', methods=['POST'])
+@admin_required
+def rebuild_quiz_analytics(quiz_id):
+    counted = rebuild_item_stats(quiz_id)
+    if counted is None:
+        flash("Quiz not found.", "danger")
+        return redirect(url_for('admin.admin_dashboard'))
+    flash(f"Rebuilt the statistics from {counted} stored submission(s).", "success")
+    return redirect(url_for('admin.quiz_analytics', quiz_id=quiz_id))
 
 @admin_bp.route('/upload', methods=['POST'])
 @admin_required
 def upload_quiz():
     file = request.files.get('file')
-    if not file or not file.filename.endswith('.json'):
-        flash("Please upload a valid JSON file.", "warning")
+    if not file or not file.filename.endswith(IMPORT_EXTENSIONS):
+        flash("Please upload a valid JSON or JSON Lines file.", "warning")
         return redirect(url_for('admin.admin_dashboard'))
-        
-    try:
-        quiz_content = json.load(file)
-        quiz_id = str(uuid.uuid4())
-        
-        # Prepare the full quiz data object
-        new_quiz_data = {
-            'id': quiz_id,
-            'pin': str(uuid.uuid4().int)[:6],
-            'name': quiz_content['name'],
-            'timer': quiz_content.get('timer', 600),
-            'questions': quiz_content['questions']
-        }
-        
-        save_quiz(quiz_id, new_quiz_data) # <-- CHANGED
-        flash(f"Quiz '{new_quiz_data['name']}' uploaded successfully!", "success")
 
-    except (json.JSONDecodeError, KeyError) as e:
-        flash(f"Error processing file: The JSON is malformed or missing required keys (e.g., 'name', 'questions').", "danger")
-            
+    importer, questions = _import_questions(file)
+    if importer is None:
+        return redirect(url_for('admin.admin_dashboard'))
+
+    quiz_id = str(uuid.uuid4())
+    # Prepare the full quiz data object
+    new_quiz_data = {
+        'id': quiz_id,
+        'pin': str(uuid.uuid4().int)[:6],
+        'name': importer.metadata.get('name') or os.path.splitext(file.filename)[0],
+        'timer': importer.metadata.get('timer', 600),
+        'questions': questions
+    }
+
+    save_quiz(quiz_id, new_quiz_data)
+    flash(f"Quiz '{new_quiz_data['name']}' uploaded successfully with {len(questions)} question(s).", "success")
     return redirect(url_for('admin.admin_dashboard'))
 
 
@@ -86,7 +237,7 @@ def create_quiz():
 @admin_bp.route('/change_pin/<quiz_id>', methods=['POST'])
 @admin_required
 def change_pin(quiz_id):
-    quiz = get_quiz_by_id(quiz_id)
+    quiz = get_quiz_for_update(quiz_id)
     if not quiz:
         flash("Quiz not found.", "danger")
         return redirect(url_for('admin.admin_dashboard'))
@@ -96,12 +247,10 @@ def change_pin(quiz_id):
         flash("New PIN cannot be empty.", "warning")
         return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
 
-    # Validate if the new PIN is already in use
-    all_quizzes = get_all_quizzes()
-    for q in all_quizzes:
-        if q['id'] != quiz_id and q.get('pin') == new_pin:
-            flash(f"PIN '{new_pin}' is already in use by another quiz. Please choose a different one.", "danger")
-            return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
+    # Validate if the new PIN is already in use (as a quiz or practice PIN)
+    if pin_in_use(new_pin, exclude_quiz_id=quiz_id):
+        flash(f"PIN '{new_pin}' is already in use by another quiz. Please choose a different one.", "danger")
+        return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
 
     quiz['pin'] = new_pin
     save_quiz(quiz_id, quiz)
@@ -113,7 +262,7 @@ def change_pin(quiz_id):
 @admin_bp.route('/regenerate_pin/<quiz_id>', methods=['POST'])
 @admin_required
 def regenerate_pin(quiz_id):
-    quiz = get_quiz_by_id(quiz_id)
+    quiz = get_quiz_for_update(quiz_id)
     if not quiz:
         flash("Quiz not found.", "danger")
         return redirect(url_for('admin.admin_dashboard'))
@@ -126,78 +275,128 @@ def regenerate_pin(quiz_id):
 @admin_bp.route('/append/<quiz_id>', methods=['POST'])
 @admin_required
 def append_questions(quiz_id):
-    quiz = get_quiz_by_id(quiz_id)
+    quiz = get_quiz_for_update(quiz_id)
     if not quiz:
         flash("Quiz not found.", "danger")
         return redirect(url_for('admin.admin_dashboard'))
 
     file = request.files.get('file')
-    if not file or not file.filename.endswith('.json'):
-        flash("Please upload a valid JSON file.", "warning")
+    if not file or not file.filename.endswith(IMPORT_EXTENSIONS):
+        flash("Please upload a valid JSON or JSON Lines file.", "warning")
+        return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
+
+    # Number new questions after the existing ones so errors match the editor.
+    importer, new_questions = _import_questions(file, first_number=len(quiz['questions']) + 1)
+    if importer is None:
         return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
-    
-    try:
-        data = json.load(file)
-        new_questions = data.get('questions')
 
-        if not isinstance(new_questions, list):
-            flash("JSON file must contain a 'questions' key with a list of questions.", "danger")
-            return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
+    quiz['questions'].extend(new_questions)
+    save_quiz(quiz_id, quiz)
+    flash(f"{len(new_questions)} question(s) appended successfully.", "success")
+    return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
 
-        quiz['questions'].extend(new_questions)
-        save_quiz(quiz_id, quiz)
-        flash(f"{len(new_questions)} question(s) appended successfully.", "success")
 
-    except json.JSONDecodeError:
-        flash("Invalid JSON format in the uploaded file.", "danger")
-    except Exception as e:
-        flash(f"An error occurred while appending: {e}", "danger")
+@admin_bp.route('/regrade/<quiz_id>', methods=['POST'])
+@admin_required
+def regrade_quiz_attempts(quiz_id):
+    summary = regrade_quiz(quiz_id)
+    if summary is None:
+        flash("Quiz not found.", "danger")
+        return redirect(url_for('admin.admin_dashboard'))
 
+    message = (f"Re-graded {summary['regraded']} of {summary['submissions']} stored attempt(s); "
+               f"{summary['changed']} score(s) changed.")
+    if summary['skipped']:
+        message += f" {summary['skipped']} attempt(s) were skipped (timed out, or taken against an earlier version of the questions)."
+    flash(message, "success")
     return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
 
 
-def validate_question(q_data, q_num):
+def apply_question_ops(questions, ops):
     """
-    Validates a single question dictionary to ensure it's logically sound.
-    Returns an error string if invalid, otherwise None.
+    Applies editor patch operations to a question list, in order:
+      {'op': 'add', 'question': {...}, 'index': i}   (index optional; default is the end)
+      {'op': 'update', 'index': i, 'question': {...}}
+      {'op': 'delete', 'index': i}
+      {'op': 'move', 'from': i, 'to': j}
+    Indices refer to the list as it is after the previous operations.
+    Returns the final indices of the added and updated questions; raises
+    ValueError on a malformed operation.
     """
-    q_type = q_data.get('type')
-    if not q_data.get('text', '').strip():
-        return f"Question #{q_num} is missing its main text."
-    
-    # Validation for types that have predefined options
-    if q_type in ['multiple-choice', 'multiple-select']:
-        options = q_data.get('options', [])
-        if not options:
-            return f"Question #{q_num} ('{q_type}') has no options defined."
-        
-        answers = q_data.get('answer')
-        
-        # It's NOT an error if 'answers' is missing on the first save of a new question.
-        # However, if answers ARE provided, they must be valid.
-        if answers:
-            if not isinstance(answers, list):
-                answers = [answers]
-            
-            for ans in answers:
-                if ans not in options:
-                    return f"Question #{q_num}: The answer '{ans}' is not listed in the provided options."
-    
-    # Recursive validation for multipart questions
-    elif q_type == 'multipart':
-        parts = q_data.get('parts', [])
-        if not parts:
-            return f"Question #{q_num} ('multipart') has no sub-questions (parts) defined."
-        for i, part in enumerate(parts):
-            part_error = validate_question(part, f"{q_num}.{i+1}")
-            if part_error:
-                return part_error
-    
-    # Validation for types that ALWAYS require an answer
-    elif not q_data.get('answer'):
-         return f"Question #{q_num} ('{q_type}') is missing an answer."
-
-    return None
+    touched = []
+    for op_num, op in enumerate(ops, start=1):
+        kind = op.get('op') if isinstance(op, dict) else None
+
+        def index_arg(key, upper):
+            value = op.get(key)
+            if not isinstance(value, int) or not 0 <= value < upper:
+                raise ValueError(f"Operation #{op_num} ('{kind}'): '{key}' must be a question index between 0 and {upper - 1}.")
+            return value
+
+        def question_arg():
+            question = op.get('question')
+            if not isinstance(question, dict) or question.get('type') not in QUESTION_TYPES:
+                raise ValueError(f"Operation #{op_num} ('{kind}'): 'question' must be an object with a valid 'type'.")
+            touched.append(question)
+            return question
+
+        if kind == 'add':
+            index = index_arg('index', len(questions) + 1) if 'index' in op else len(questions)
+            questions.insert(index, question_arg())
+        elif kind == 'update':
+            questions[index_arg('index', len(questions))] = question_arg()
+        elif kind == 'delete':
+            del questions[index_arg('index', len(questions))]
+        elif kind == 'move':
+            question = questions.pop(index_arg('from', len(questions)))
+            questions.insert(index_arg('to', len(questions) + 1), question)
+        else:
+            raise ValueError(f"Operation #{op_num}: unknown op {kind!r} (expected add, update, delete or move).")
+
+    # Map the touched questions to where they ended up (deleted ones drop out).
+    positions = {id(question): i for i, question in enumerate(questions)}
+    return sorted({positions[id(q)] for q in touched if id(q) in positions})
+
+
+@admin_bp.route('/edit/<quiz_id>/questions', methods=['PATCH'])
+@admin_required
+def patch_quiz_questions(quiz_id):
+    """
+    Applies a batch of question operations (see apply_question_ops) from the
+    editor. Only the added and updated questions are validated. The request
+    must carry the quiz 'revision' it was based on; if the quiz has been
+    saved since, nothing is applied and 409 is returned.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('revision'), int) or not isinstance(payload.get('ops'), list):
+        return jsonify({'error': "Expected a JSON object with an integer 'revision' and a list of 'ops'."}), 400
+
+    quiz = get_quiz_for_update(quiz_id)
+    if not quiz:
+        return jsonify({'error': "Quiz not found."}), 404
+    conflict = {'error': "This quiz has been changed since you loaded it. Reload the editor to get the latest version.",
+                'revision': quiz.get('revision', 0)}
+    if quiz.get('revision', 0) != payload['revision']:
+        return jsonify(conflict), 409
+
+    try:
+        touched = apply_question_ops(quiz['questions'], payload['ops'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    validation_messages = []
+    for i in touched:
+        error = validate_question(quiz['questions'][i], i + 1)
+        if error:
+            validation_messages.append({'text': error, 'index': i})
+    validation_messages.extend(display_config_errors(quiz['display_config'], quiz['questions']))
+    if validation_messages:
+        return jsonify({'error': "Please fix the errors below.", 'errors': validation_messages}), 400
+
+    revision = save_quiz(quiz_id, quiz, expected_revision=payload['revision'])
+    if revision is None:
+        return jsonify(conflict), 409
+    return jsonify({'revision': revision, 'question_count': len(quiz['questions'])})
 
 
 @admin_bp.route('/edit/<quiz_id>', methods=['GET', 'POST'])
@@ -245,7 +444,7 @@ def edit_quiz(quiz_id):
                 'display_config': form_data['display_config'],
                 'practice_pin': form_data.get('practice_pin', quiz.get('practice_pin')),
                 'questions': form_data['questions'],
-                
+                'revision': form_data.get('revision', quiz.get('revision', 0)),
             }
 
             # --- MODIFIED VALIDATION LOGIC ---
@@ -261,34 +460,24 @@ def edit_quiz(quiz_id):
                     error_indices.append(i)
 
             # Display Configuration Validation
-            available_counts = defaultdict(int)
-            total_possible_score = sum(q.get('score', 0) if q['type'] != 'multipart' else sum(p.get('score', 0) for p in q.get('parts', [])) for q in updated_quiz['questions'])
-            for q in updated_quiz['questions']: available_counts[q['type']] += 1
-
-            display_mode = updated_quiz['display_config']['mode']
-            if display_mode == 'question_count':
-                for q_type, count in updated_quiz['display_config']['parameters'].items():
-                    if count > available_counts[q_type]:
-                        # General errors have no index
-                        validation_messages.append({'text': f"Display Error: You requested {count} '{q_type}' questions, but only {available_counts[q_type]} are available."})
-            elif display_mode == 'total_score':
-                target = updated_quiz['display_config']['target_score']
-                if target > total_possible_score:
-                    validation_messages.append({'text': f"Display Error: Target score of {target} is higher than the total possible score of all questions ({total_possible_score})."})
+            validation_messages.extend(display_config_errors(updated_quiz['display_config'], updated_quiz['questions']))
 
             if validation_messages:
                 # Instead of flashing, pass the structured errors and indices to the template
                 return render_template('edit_quiz.html', quiz=updated_quiz, validation_errors=validation_messages, error_indices=error_indices)
             
-            save_quiz(quiz_id, updated_quiz)
+            # Editors opened before quizzes had revisions don't send one.
+            if save_quiz(quiz_id, updated_quiz, expected_revision=form_data.get('revision')) is None:
+                current_revision = get_quiz_by_id(quiz_id).get('revision', 0)
+                flash("This quiz was changed by someone else while you were editing it, so your changes were not saved. "
+                      "Save again to overwrite their changes, or reload the editor to see them.", "danger")
+                return render_template('edit_quiz.html', quiz=dict(updated_quiz, revision=current_revision))
             flash(f"Quiz '{updated_quiz['name']}' updated successfully!", "success")
             return redirect(url_for('admin.admin_dashboard'))
 
         except Exception as e:
             # Catch any other errors and provide helpful feedback.
-            print("--- A CRITICAL ERROR OCCURRED IN edit_quiz ---")
-            traceback.print_exc()
-            print("------------------------------------------")
+            logger.exception("A critical error occurred while saving quiz %s in edit_quiz", quiz_id)
             flash(f"A critical error occurred while saving: {e}", "danger")
             return render_template('edit_quiz.html', quiz=quiz)
 
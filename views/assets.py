@@ -0,0 +1,23 @@
+# views/assets.py
+
+import os
+from flask import Blueprint, abort, send_from_directory
+from assets import ASSET_NAME_RE
+from config import ASSET_DIR
+
+assets_bp = Blueprint('assets', __name__)
+
+# Asset names are content hashes, so a URL's bytes never change.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+@assets_bp.route('/assets/<filename>')
+def serve_asset(filename):
+    if not ASSET_NAME_RE.match(filename):
+        abort(404)
+    response = send_from_directory(os.path.abspath(ASSET_DIR), filename, max_age=IMMUTABLE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    # New SVGs stay inline in the quiz, but ones extracted earlier may still be
+    # served here; opened directly, they must not run script on this origin.
+    response.headers['Content-Security-Policy'] = "default-src 'none'; style-src 'unsafe-inline'; sandbox"
+    return response
@@ -2,7 +2,7 @@
 
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from werkzeug.security import check_password_hash
-from data_manager import load_users, save_users # Import save_users
+from data_manager import load_users, save_users, users_exist
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/admin')
 
@@ -15,11 +15,9 @@ def admin_login():
         
         user = users.get(username)
         if user and check_password_hash(user['password'], password) and user['role'] == 'admin':
-            # If this is the first login and users.json doesn't exist, save it.
+            # If this is the first login and no users are stored yet, save them.
             # This ensures the default admin is persisted.
-            import os
-            from config import USER_DATA_FILE
-            if not os.path.exists(USER_DATA_FILE):
+            if not users_exist():
                 save_users(users)
 
             session['user'] = username
@@ -1,25 +1,72 @@
+import hashlib
 import json
-import random
 import uuid
 import os
-from collections import defaultdict
-from flask import Blueprint, jsonify, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, current_app, jsonify, render_template, request, redirect, url_for, session, flash
+from markupsafe import Markup
 from datetime import datetime, timedelta
-from data_manager import get_all_quizzes, get_quiz_by_id, get_leaderboard, add_to_leaderboard, load_temp_session_data, save_temp_session_data
+from data_manager import create_attempt, end_attempt, find_quiz_by_pin, get_attempt, get_grader, get_layout_hash, get_question_fragments, get_questions_hash, get_quiz_by_id, get_quiz_hash, get_selection_index, get_leaderboard_page, add_to_leaderboard, load_temp_session_data, save_temp_session_data, store_submission
+from config import LEADERBOARD_PAGE_SIZE, QUESTION_PAGE_SIZE
 from decorators import quiz_session_required
+import live_monitor
+from selection import QUESTION_TYPES, deal_practice_round, select_for_attempt
+from student_view import join_fragments
 
 student_bp = Blueprint('student', __name__)
 TEMP_REVIEW_DIR = 'temp_reviews'
 
 def find_quiz_by_any_pin(pin):
     """Finds a quiz by matching either its main PIN or its practice PIN."""
-    pin = pin.strip()
-    for quiz in get_all_quizzes():
-        if quiz.get('pin') == pin:
-            return quiz, 'real'
-        if quiz.get('practice_mode_config', {}).get('enabled') and quiz.get('practice_pin') == pin:
-            return quiz, 'practice'
-    return None, None
+    quiz_id, mode = find_quiz_by_pin(pin)
+    if quiz_id is None:
+        return None, None
+    quiz = get_quiz_by_id(quiz_id)
+    if quiz is None:
+        return None, None
+    return quiz, mode
+
+def current_attempt(end=False):
+    """
+    Returns the attempt referenced by the session cookie (removing it from the
+    store if end=True), or None if it has expired.
+    """
+    attempt_id = session.get('attempt_id')
+    if attempt_id:
+        attempt = end_attempt(attempt_id) if end else get_attempt(attempt_id)
+        if attempt and attempt['quiz_id'] == session.get('quiz_id'):
+            return attempt
+        return None
+    # Sessions started before attempts moved server-side
+    if 'question_order' in session and 'start_time' in session:
+        return {'quiz_id': session.get('quiz_id'), 'question_order': session['question_order'],
+                'start_time': session['start_time'], 'mode': 'real'}
+    return None
+
+def practice_allowed(quiz):
+    """
+    Whether this session may use a quiz's practice mode: practice must be
+    enabled, the student must have entered the practice PIN, and no graded
+    attempt of the quiz may be in progress (practice checks reveal answers).
+    """
+    return (quiz is not None and quiz.get('practice_mode_config', {}).get('enabled')
+            and session.get('mode') == 'practice' and current_attempt() is None)
+
+def render_conditional(etag_parts, template, **context):
+    """
+    Renders a page that is fully determined by etag_parts (plus the layout's
+    inputs), answering 304 Not Modified without rendering if the browser
+    already has it.
+    """
+    etag = hashlib.sha1(json.dumps([etag_parts, session.get('role'), current_app.config['STATIC_VERSION']],
+                                   default=str).encode('utf-8')).hexdigest()
+    # Pending flash messages are rendered into the page, so skip the shortcut.
+    if '_flashes' not in session and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.make_response(render_template(template, **context))
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @student_bp.route('/')
 def home():
@@ -44,50 +91,32 @@ def start_quiz():
     session['name'] = name
     session['quiz_id'] = quiz['id']
 
+    session['mode'] = mode
+
     if mode == 'practice':
         # User entered a practice PIN, redirect to practice setup
         return redirect(url_for('student.practice_setup'))
     
     # If we get here, mode is 'real', so proceed with the original quiz start logic
     else:
-        config = quiz.get('display_config', {})
-        mode = config.get('mode', 'question_count')
-        
-        final_question_indices = []
-        # (This is the correct, complex question selection logic)
-        if mode == 'total_score':
-            target_score = config.get('target_score', 10)
-            indexed_questions = []
-            for i, q in enumerate(quiz['questions']):
-                score = sum(p.get('score', 0) for p in q.get('parts', [])) if q['type'] == 'multipart' else q.get('score', 0)
-                if score > 0: indexed_questions.append((i, score))
-            random.shuffle(indexed_questions)
-            current_score = 0
-            for q_index, q_score in indexed_questions:
-                if current_score >= target_score: break
-                final_question_indices.append(q_index)
-                current_score += q_score
-        else: # 'question_count' mode
-            params = config.get('parameters', {})
-            questions_by_type = defaultdict(list)
-            for i, q in enumerate(quiz['questions']): questions_by_type[q['type']].append(i)
-            for q_type, count in params.items():
-                if count > 0 and q_type in questions_by_type:
-                    available = questions_by_type[q_type]
-                    num_to_select = min(count, len(available))
-                    final_question_indices.extend(random.sample(available, num_to_select))
-        
+        selection_index = get_selection_index(quiz['id'], quiz)
+        final_question_indices = select_for_attempt(selection_index, quiz.get('display_config', {}))
+
         if not final_question_indices:
             flash("This quiz has no questions to display based on its current rules.", "danger")
             return redirect(url_for('student.home'))
 
-        random.shuffle(final_question_indices)
-        
-        session['quiz_id'] = quiz['id']    
-        if 'start_time' not in session:
-            session['start_time'] = datetime.utcnow().isoformat()
+        # Restarting keeps the original start time, so the timer can't be reset.
+        previous_attempt = end_attempt(session.get('attempt_id'))
+        start_time = (previous_attempt or {}).get('start_time') or session.pop('start_time', None) \
+            or datetime.utcnow().isoformat()
+        session.pop('question_order', None)
+
+        session['quiz_id'] = quiz['id']
         session['name'] = name
-        session['question_order'] = final_question_indices
+        session['attempt_id'] = create_attempt(quiz['id'], final_question_indices, start_time)
+        live_monitor.record_join(quiz['id'], name,
+                                 restart=(previous_attempt or {}).get('quiz_id') == quiz['id'])
         
         return redirect(url_for('student.instructions'))
 
@@ -95,87 +124,129 @@ def start_quiz():
 @student_bp.route('/quiz/instructions')
 @quiz_session_required
 def instructions():
-    quiz = get_quiz_by_id(session['quiz_id'])
-    total_questions = len(session['question_order'])
-    return render_template('instructions.html', quiz=quiz, total_questions=total_questions)
+    attempt = current_attempt()
+    if attempt is None:
+        flash("Your session expired. Please start the quiz again.", "warning")
+        return redirect(url_for('student.home'))
+    quiz_id = session['quiz_id']
+    quiz = get_quiz_by_id(quiz_id)
+    total_questions = len(attempt['question_order'])
+    return render_conditional(['instructions', get_quiz_hash(quiz_id, quiz), total_questions],
+                              'instructions.html', quiz=quiz, total_questions=total_questions)
 
 @student_bp.route('/quiz')
 @quiz_session_required
 def take_quiz():
+    attempt = current_attempt()
+    if attempt is None:
+        flash("Your session expired. Please start the quiz again.", "warning")
+        return redirect(url_for('student.home'))
     quiz_id = session['quiz_id']
     quiz = get_quiz_by_id(quiz_id)
-    question_order = session.get('question_order', [])
-    questions_to_send = [quiz['questions'][i] for i in question_order]
-    return render_template('quiz.html', quiz=quiz, quiz_data=questions_to_send)
+    question_order = attempt['question_order']
+    # Only the first page is embedded; quiz.html fetches the rest lazily.
+    etag_parts = ['quiz', get_quiz_hash(quiz_id, quiz), attempt['start_time'], QUESTION_PAGE_SIZE,
+                  question_order[:QUESTION_PAGE_SIZE], len(question_order)]
+    first_page = Markup(question_page_json(quiz_id, quiz, question_order, 1).decode('utf-8'))
+    return render_conditional(etag_parts, 'quiz.html', quiz=quiz,
+                              first_page=first_page, page_size=QUESTION_PAGE_SIZE,
+                              total_questions=len(question_order), start_time=attempt['start_time'])
+
+def question_page_json(quiz_id, quiz, question_order, page):
+    """
+    Returns the JSON array (bytes, answers stripped) of the questions at `page`
+    (1-based) of an attempt, in question_order, joined from cached fragments.
+    """
+    start = (page - 1) * QUESTION_PAGE_SIZE
+    return join_fragments(get_question_fragments(quiz_id, quiz), question_order[start:start + QUESTION_PAGE_SIZE])
+
+@student_bp.route('/quiz/api/questions')
+@quiz_session_required
+def quiz_questions_api():
+    attempt = current_attempt()
+    if attempt is None:
+        return jsonify({'error': "Your session expired. Please start the quiz again."}), 404
+    quiz_id = session['quiz_id']
+    quiz = get_quiz_by_id(quiz_id)
+    question_order = attempt['question_order']
+    page = max(1, request.args.get('page', 1, type=int))
+
+    # A page's content is fixed by the quiz version and the question indices
+    # on it, so the ETag can be checked before anything is serialised.
+    start = (page - 1) * QUESTION_PAGE_SIZE
+    page_indices = ','.join(str(i) for i in question_order[start:start + QUESTION_PAGE_SIZE])
+    etag = hashlib.sha1(f"{get_questions_hash(quiz_id, quiz)}:{page}:{page_indices}".encode('utf-8')).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        # Assembled from the cached fragments rather than re-encoded.
+        body = (b'{"page":%d,"per_page":%d,"total":%d,"questions":' % (page, QUESTION_PAGE_SIZE, len(question_order))
+                + question_page_json(quiz_id, quiz, question_order, page) + b'}')
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    # Always revalidate: the same URL serves a different attempt after a restart.
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @student_bp.route('/quiz/submit', methods=['POST'])
 @quiz_session_required
 def submit_quiz():
     quiz_id = session.get('quiz_id')
     name = session.get('name')
-    start_time_str = session.get('start_time')
-    question_order = session.get('question_order', [])
+    attempt_id = session.get('attempt_id')
+    attempt = current_attempt(end=True)
 
-    if not all([quiz_id, name, start_time_str]):
+    if not all([quiz_id, name, attempt]):
         flash("Your session expired. Please start the quiz again.", "warning")
         return redirect(url_for('student.home'))
         
     quiz = get_quiz_by_id(quiz_id)
-    start_time = datetime.fromisoformat(start_time_str)
+    question_order = attempt['question_order']
+    start_time = datetime.fromisoformat(attempt['start_time'])
     
     answers_json = request.form.get('answers')
     user_answers = json.loads(answers_json) if answers_json else {}
 
     score = 0
+    time_expired = False
 
     if not question_order:
         flash("The quiz had no questions to score.", "warning")
     else:
         time_expired = (quiz.get('timer', 0) > 0) and ((datetime.utcnow() - start_time).total_seconds() > quiz['timer'] + 5)
-        
+
         if not time_expired:
-            for i, actual_idx in enumerate(question_order):
-                question = quiz['questions'][actual_idx]
-                user_answer = user_answers.get(str(i))
-                if user_answer is not None:
-                    if question.get('type') == 'multiple-select':
-                        if set(user_answer) == set(question['answer']): score += question.get('score', 1)
-                    elif question.get('type') == 'multipart':
-                        for part_idx, part in enumerate(question.get('parts', [])):
-                            if len(user_answer) > part_idx and user_answer[part_idx] is not None:
-                                user_part_answer = user_answer[part_idx]
-                                if part['type'] == 'multiple-select':
-                                    if set(user_part_answer) == set(part['answer']): score += part.get('score', 1)
-                                else:
-                                    if str(user_part_answer).strip().lower() == str(part['answer']).lower(): score += part.get('score', 1)
-                    else:
-                        if str(user_answer).strip().lower() == str(question['answer']).lower(): score += question.get('score', 1)
-
-    # This block now correctly builds the review data
-    review_items = []
-    if question_order:
-        for i, actual_idx in enumerate(question_order):
-            question = quiz['questions'][actual_idx]
-            user_answer = user_answers.get(str(i))
-            review_items.append({'question': question, 'user_answer': user_answer})
+            score = get_grader(quiz_id, quiz).grade(question_order, user_answers)
 
-    # Save to leaderboard (this is correct)
-    add_to_leaderboard(quiz_id, name, score)
+    # Keep the answers for re-grading, then save to leaderboard
+    timestamp = datetime.utcnow().isoformat()
+    if question_order:
+        store_submission(quiz_id, quiz, name, timestamp, question_order, user_answers,
+                         timed_out=time_expired, attempt_id=attempt_id)
+    add_to_leaderboard(quiz_id, name, score, timestamp)
+    live_monitor.record_submission(quiz_id, name, score, timed_out=time_expired)
     
-    # Exclusively use the correct review_session_id system
-    if review_items and quiz.get('is_reviewable'):
+    # Save a compact review record; review_quiz resolves the questions later
+    if question_order and quiz.get('is_reviewable'):
         review_session_id = str(uuid.uuid4())
-        save_temp_session_data(review_session_id, review_items)
+        save_temp_session_data(review_session_id, {
+            'quiz_id': quiz_id,
+            'version': get_questions_hash(quiz_id, quiz),
+            'layout': get_layout_hash(quiz_id, quiz),
+            'score': score,
+            'question_order': list(question_order),
+            'answers': [user_answers.get(str(i)) for i in range(len(question_order))],
+        })
         session['review_session_id'] = review_session_id
 
     # DELETED: All logic related to 'review_token' has been removed.
 
     session['student_name_final'] = name
     session.pop('quiz_id', None)
+    session.pop('attempt_id', None)
     session.pop('start_time', None)
     session.pop('name', None)
     session.pop('question_order', None)
-    session.pop('start_time', None)
     return redirect(url_for('student.leaderboard', quiz_id=quiz_id))
 
 
@@ -183,7 +254,9 @@ def submit_quiz():
 def leaderboard(quiz_id):
     quiz = get_quiz_by_id(quiz_id)
     quiz_name = quiz['name'] if quiz else 'Unknown Quiz'
-    leaderboard_data = get_leaderboard(quiz_id)
+    page = max(1, request.args.get('page', 1, type=int))
+    leaderboard_data, total_entries = get_leaderboard_page(quiz_id, page)
+    total_pages = max(1, -(-total_entries // LEADERBOARD_PAGE_SIZE))
     is_reviewable = quiz.get('is_reviewable', False) if quiz else False
     student_name = session.get('student_name_final', '')
     
@@ -192,6 +265,9 @@ def leaderboard(quiz_id):
     return render_template(
         'leaderboard.html', 
         leaderboard=leaderboard_data, 
+        rank_offset=(page - 1) * LEADERBOARD_PAGE_SIZE,
+        page=page,
+        total_pages=total_pages,
         quiz_name=quiz_name, 
         is_reviewable=is_reviewable, 
         quiz_id=quiz_id,  # This is crucial: Pass the quiz_id to the template
@@ -207,9 +283,9 @@ def review_quiz(quiz_id):
         flash("Review data has expired or is no longer available. Please start a new quiz.", "warning")
         return redirect(url_for('student.home'))
         
-    review_items = load_temp_session_data(review_session_id)
+    review = load_temp_session_data(review_session_id)
     
-    if not review_items:
+    if not review:
         flash("Review data could not be found. It may have expired.", "warning")
         return redirect(url_for('student.home'))
     
@@ -218,30 +294,52 @@ def review_quiz(quiz_id):
         flash("The quiz you are trying to review could not be found.", "danger")
         return redirect(url_for('student.home'))
 
-    return render_template('review.html', review_items=review_items, quiz_name=quiz['name'])
+    if isinstance(review, list):
+        # Saved before reviews were stored as question references
+        review_items, quiz_changed = review, False
+    else:
+        if review['quiz_id'] != quiz_id:
+            flash("Review data could not be found. It may have expired.", "warning")
+            return redirect(url_for('student.home'))
+        # question_order indexes the question list the attempt was taken
+        # against, so answers can only be paired with questions while the
+        # layout is unchanged. Records saved before the layout was stored
+        # need the exact version.
+        questions_hash = get_questions_hash(quiz_id, quiz)
+        if 'layout' in review:
+            layout_unchanged = review['layout'] == get_layout_hash(quiz_id, quiz)
+        else:
+            layout_unchanged = review['version'] == questions_hash
+        if not layout_unchanged:
+            return render_template('review.html', review_items=[], quiz_name=quiz['name'],
+                                   layout_changed=True, score=review.get('score'))
+        quiz_changed = review['version'] != questions_hash
+        review_items = [{'question': quiz['questions'][i], 'user_answer': answer}
+                        for i, answer in zip(review['question_order'], review['answers'])]
+
+    return render_template('review.html', review_items=review_items, quiz_name=quiz['name'], quiz_changed=quiz_changed)
 
 @student_bp.route('/practice/api/questions', methods=['POST'])
 @quiz_session_required
 def practice_questions_api():
     quiz_id = session['quiz_id']
     quiz = get_quiz_by_id(quiz_id)
-    
+    if not practice_allowed(quiz):
+        return jsonify({'error': "Practice mode is not available. Please enter the quiz's practice PIN."}), 403
+
     practice_config = quiz.get('practice_mode_config', {})
     allow_student_selection = practice_config.get('allow_student_selection', False)
     max_limit = practice_config.get('max_questions_limit', 10)
 
-    available_questions = defaultdict(list)
-    for q in quiz.get('questions', []):
-        available_questions[q['type']].append(q)
+    available_questions = get_selection_index(quiz_id, quiz)['by_type']
 
     requested_counts = {}
-    question_types = ['multiple-choice', 'short-answer', 'multiple-select', 'multipart']
     
     request_data = request.get_json()
 
     if allow_student_selection:
         total_requested = 0
-        for q_type in question_types:
+        for q_type in QUESTION_TYPES:
             count = max(0, request_data.get(f'count_{q_type}', 0))
             requested_counts[q_type] = count
             total_requested += count
@@ -251,36 +349,87 @@ def practice_questions_api():
             
     else: # Use default counts
         default_params = quiz.get('display_config', {}).get('parameters', {})
-        for q_type in question_types:
+        for q_type in QUESTION_TYPES:
             requested_counts[q_type] = default_params.get(q_type, 0)
 
-    questions_to_practice = []
     for q_type, count in requested_counts.items():
-        if count > len(available_questions[q_type]):
-            return jsonify({'error': f"You requested {count} '{q_type}' questions, but only {len(available_questions[q_type])} are available."}), 400
-        
-        if count > 0:
-            questions_to_practice.extend(random.sample(available_questions[q_type], count))
-    
-    if not questions_to_practice:
+        available = available_questions.get(q_type, ())
+        if count > len(available):
+            return jsonify({'error': f"You requested {count} '{q_type}' questions, but only {len(available)} are available."}), 400
+
+    # Each student's decks carry over between rounds, so asking for a new
+    # practice set keeps showing unseen questions until a bucket runs out.
+    decks = session.get('practice_decks')
+    if not decks or decks.get('quiz_id') != quiz_id:
+        decks = {'quiz_id': quiz_id, 'decks': {}}
+    selected = deal_practice_round(get_selection_index(quiz_id, quiz), requested_counts, decks['decks'])
+    # Only the questions of the current round can be checked.
+    decks['round'] = selected
+    session['practice_decks'] = decks
+
+    if not selected:
         return jsonify({'error': "No questions were selected for this practice session. Please choose at least one question."}), 400
 
-    random.shuffle(questions_to_practice)
-    
-    return jsonify(questions_to_practice)
+    # Answer keys stay on the server: the round is sent as question ids plus
+    # the cached student-view fragments, and checked via practice_check_api.
+    body = (b'{"ids":' + json.dumps(selected, separators=(',', ':')).encode('utf-8')
+            + b',"questions":' + join_fragments(get_question_fragments(quiz_id, quiz), selected) + b'}')
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@student_bp.route('/practice/api/check', methods=['POST'])
+@quiz_session_required
+def practice_check_api():
+    """
+    Checks a batch of practice answers, {"answers": [{"id": ..., "answer": ...}]},
+    and returns whether each is correct along with the correct answer.
+    """
+    quiz_id = session['quiz_id']
+    quiz = get_quiz_by_id(quiz_id)
+    if not practice_allowed(quiz):
+        return jsonify({'error': "Practice mode is not available. Please enter the quiz's practice PIN."}), 403
+    decks = session.get('practice_decks') or {}
+    dealt = set(decks.get('round', ())) if decks.get('quiz_id') == quiz_id else set()
+
+    request_data = request.get_json(silent=True)
+    items = request_data.get('answers') if isinstance(request_data, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': "Expected a list of answers."}), 400
+
+    grader = get_grader(quiz_id, quiz)
+    results = []
+    for item in items:
+        question_index = item.get('id')
+        # The quiz may have lost questions since the round was dealt.
+        if (not isinstance(question_index, int) or question_index not in dealt
+                or question_index >= len(quiz['questions'])):
+            return jsonify({'error': "That question is not part of your practice session."}), 400
+        question = quiz['questions'][question_index]
+        user_answer = item.get('answer')
+        if grader.is_multipart(question_index):
+            matches = grader.check(question_index, user_answer)
+            results.append({'id': question_index, 'correct': all(matches),
+                            'parts': [{'correct': match, 'answer': part.get('answer')}
+                                      for match, part in zip(matches, question.get('parts', []))]})
+        else:
+            results.append({'id': question_index, 'correct': grader.check(question_index, user_answer),
+                            'answer': question.get('answer')})
+
+    response = jsonify({'results': results})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @student_bp.route('/practice/setup')
 @quiz_session_required
 def practice_setup():
     quiz = get_quiz_by_id(session['quiz_id'])
 
-    practice_config = quiz.get('practice_mode_config', {})
-    if not practice_config.get('enabled'):
-        flash("Practice mode is not enabled for this quiz.", "warning")
+    if not practice_allowed(quiz):
+        flash("Practice mode is not available for this quiz.", "warning")
         return redirect(url_for('student.home'))
 
-    available_counts = defaultdict(int)
-    for question in quiz.get('questions', []):
-        available_counts[question['type']] += 1
-    
-    return render_template('practice_spa.html', quiz=quiz, available_counts=available_counts)
\ No newline at end of file
+    available_counts = get_selection_index(session['quiz_id'], quiz)['counts']
+
+    return render_conditional(['practice', get_quiz_hash(session['quiz_id'], quiz)],
+                              'practice_spa.html', quiz=quiz, available_counts=available_counts)
\ No newline at end of file